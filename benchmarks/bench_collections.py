@@ -0,0 +1,271 @@
+"""
+Benchmarks of loading, querying, checking and writing collections, and of
+the commandline tools, on synthetic collections of 1,000 to 1,000,000
+resources (see `synthetic`).
+
+Run with asv (https://asv.readthedocs.io) from the repository root, e.g.:
+
+    asv run --bench bench_collections
+
+and compare two commits, failing if any benchmark got more than 20% slower
+or bigger:
+
+    asv continuous --factor 1.2 master HEAD
+
+The collection files are generated on first use and kept in
+SEFARA_BENCHMARK_DIR (default: "sefara-benchmarks" in the temporary
+directory). Set SEFARA_BENCHMARK_MAX_RESOURCES to skip the larger sizes, e.g.
+to 10000 for a quick run.
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+
+import sefara
+from sefara import hooks
+from sefara.commands import check, dump, env, select
+
+from .synthetic import (
+    checker_file, collection_file, sizes, synthetic_collection)
+
+# Seconds allowed for each benchmark. Loading or writing the largest
+# collections takes a while.
+TIMEOUT = 1800
+
+FORMATS = ["python", "json"]
+
+TAG_FILTER = "tags.tumor and tags.wes and not tags.failed_qc"
+
+EXPRESSION_FILTER = "depth > 70 and capture_kit == 'agilent-sureselect-v5'"
+
+SELECTED = ["name", "path", "depth", "sample_depth: '%s:%d' % (sample, depth)"]
+
+# Number of resources looked up by the getitem benchmarks.
+NUM_LOOKUPS = 1000
+
+@contextlib.contextmanager
+def stdout_to_devnull():
+    old_stdout = sys.stdout
+    with open(os.devnull, "w") as fd:
+        sys.stdout = fd
+        try:
+            yield
+        finally:
+            sys.stdout = old_stdout
+
+def load_synthetic(num, format="json"):
+    return sefara.load(
+        collection_file(num, format), environment_transforms=False)
+
+class Load(object):
+    params = (sizes(), FORMATS)
+    param_names = ["num_resources", "format"]
+    timeout = TIMEOUT
+
+    def setup(self, num, format):
+        self.path = collection_file(num, format)
+        with open(self.path) as fd:
+            self.data = fd.read()
+
+    def time_load(self, num, format):
+        sefara.load(self.path, environment_transforms=False)
+
+    def peakmem_load(self, num, format):
+        sefara.load(self.path, environment_transforms=False)
+
+    def time_load_filtered(self, num, format):
+        sefara.load(
+            self.path, filters=[TAG_FILTER], environment_transforms=False)
+
+    def time_load_table(self, num, format):
+        sefara.load(self.path, table=True, environment_transforms=False)
+
+    def peakmem_load_table(self, num, format):
+        sefara.load(self.path, table=True, environment_transforms=False)
+
+    def time_loads(self, num, format):
+        sefara.loads(self.data, format=format, environment_transforms=False)
+
+class Query(object):
+    params = sizes()
+    param_names = ["num_resources"]
+    timeout = TIMEOUT
+
+    def setup(self, num):
+        self.rc = load_synthetic(num)
+        step = max(1, num // NUM_LOOKUPS)
+        self.indices = list(range(0, num, step))[:NUM_LOOKUPS]
+        self.names = [self.rc[i].name for i in self.indices]
+
+    def time_filter_tags(self, num):
+        self.rc.filter(TAG_FILTER)
+
+    def time_filter_expression(self, num):
+        self.rc.filter(EXPRESSION_FILTER)
+
+    def time_filter_columnar(self, num):
+        self.rc.filter(EXPRESSION_FILTER, engine="columnar")
+
+    def time_filter_result(self, num):
+        # A filter result that matches every resource, so the time is
+        # mostly in constructing the result collection.
+        self.rc.filter(lambda resource: True)
+
+    def peakmem_filter_result(self, num):
+        self.rc.filter(lambda resource: True)
+
+    def time_lazy_filter_head(self, num):
+        self.rc.lazy().filter(EXPRESSION_FILTER).head(10).collect()
+
+    def time_select(self, num):
+        self.rc.select(*SELECTED)
+
+    def peakmem_select(self, num):
+        self.rc.select(*SELECTED)
+
+    def time_iter_select(self, num):
+        for _ in self.rc.iter_select(*SELECTED):
+            pass
+
+    def time_getitem_name(self, num):
+        for name in self.names:
+            self.rc[name]
+
+    def time_getitem_index(self, num):
+        for index in self.indices:
+            self.rc[index]
+
+class Table(object):
+    params = sizes()
+    param_names = ["num_resources"]
+    timeout = TIMEOUT
+
+    def setup(self, num):
+        self.table = sefara.load(
+            collection_file(num, "json"),
+            table=True,
+            environment_transforms=False)
+
+    def time_filter_expression(self, num):
+        self.table.filter(EXPRESSION_FILTER)
+
+    def time_select(self, num):
+        self.table.select("name", "path", "depth")
+
+class Check(object):
+    params = sizes()
+    param_names = ["num_resources"]
+    timeout = TIMEOUT
+
+    def setup(self, num):
+        self.rc = load_synthetic(num)
+        self.checker = checker_file()
+
+    def time_check(self, num):
+        for _ in hooks.check(
+                self.rc, [self.checker], include_environment_checkers=False):
+            pass
+
+    def peakmem_check(self, num):
+        for _ in hooks.check(
+                self.rc, [self.checker], include_environment_checkers=False):
+            pass
+
+    def time_check_threads(self, num):
+        for _ in hooks.check(
+                self.rc,
+                [self.checker],
+                include_environment_checkers=False,
+                jobs=4):
+            pass
+
+class Write(object):
+    params = (sizes(), FORMATS)
+    param_names = ["num_resources", "format"]
+    timeout = TIMEOUT
+
+    def setup(self, num, format):
+        self.rc = load_synthetic(num)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "out")
+
+    def teardown(self, num, format):
+        shutil.rmtree(self.directory)
+
+    def time_write(self, num, format):
+        self.rc.write(self.path, format)
+
+    def peakmem_write(self, num, format):
+        self.rc.write(self.path, format)
+
+    def time_write_gzip(self, num, format):
+        self.rc.write(self.path, format, compression="gzip")
+
+class Construct(object):
+    params = sizes()
+    param_names = ["num_resources"]
+    timeout = TIMEOUT
+
+    def time_synthetic_collection(self, num):
+        synthetic_collection(num)
+
+    def peakmem_synthetic_collection(self, num):
+        synthetic_collection(num)
+
+class Commands(object):
+    """
+    The commandline tools, run in this process, with output to /dev/null.
+    """
+    params = sizes()
+    param_names = ["num_resources"]
+    timeout = TIMEOUT
+
+    def setup(self, num):
+        self.path = collection_file(num, "json")
+        self.common = ["--no-environment-transforms", "--no-daemon"]
+
+    def time_select(self, num):
+        select.run([self.path, "name", "path", "--filter", TAG_FILTER] +
+            self.common + ["--out", os.devnull])
+
+    def peakmem_select(self, num):
+        select.run([self.path, "name", "path", "--filter", TAG_FILTER] +
+            self.common + ["--out", os.devnull])
+
+    def time_select_args(self, num):
+        select.run([self.path, "name", "path", "--format", "args"] +
+            self.common + ["--out", os.devnull])
+
+    def time_dump(self, num):
+        dump.run([self.path, "--format", "json", "--out", os.devnull] +
+            self.common)
+
+    def peakmem_dump(self, num):
+        dump.run([self.path, "--format", "json", "--out", os.devnull] +
+            self.common)
+
+    def time_check(self, num):
+        with stdout_to_devnull():
+            check.run([
+                self.path,
+                "--checker", checker_file(),
+                "--no-environment-checkers",
+                "--quiet",
+            ] + self.common)
+
+class Startup(object):
+    """
+    Time to import each commandline tool in a new interpreter.
+    """
+    params = ["check", "dump", "env", "select", "serve"]
+    param_names = ["command"]
+
+    def timeraw_import(self, command):
+        return "import sefara.commands.%s" % command
+
+def time_env():
+    with stdout_to_devnull():
+        env.run([])
@@ -0,0 +1,96 @@
+"""
+Benchmarks comparing `Resource` and `CompactResource`.
+
+Run with asv (https://asv.readthedocs.io) from the repository root:
+
+    asv run --bench bench_resources
+"""
+
+import json
+
+try:
+    import tracemalloc
+except ImportError:  # py2
+    tracemalloc = None
+
+import sefara
+
+def allocated_bytes(function):
+    """
+    Call a function and return its result and the number of bytes allocated
+    during the call that were not freed by the end of it.
+    """
+    if tracemalloc is None:
+        # Skipped by asv.
+        raise NotImplementedError("tracemalloc requires Python 3.4 or later")
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return (result, allocated)
+
+def make_resources(resource_class, num):
+    return [
+        resource_class(
+            "resource%d" % i,
+            path="/path/to/resource%d.bam" % i,
+            sample="sample%d" % (i % 100),
+            capture_kit="kit%d" % (i % 4),
+            tags=["tumor" if i % 2 else "normal", "wes"],
+        )
+        for i in range(num)
+    ]
+
+class ResourceMemory(object):
+    params = ([1000, 100000], ["Resource", "CompactResource"])
+    param_names = ["num_resources", "resource_class"]
+
+    def setup(self, num, resource_class):
+        self.resource_class = getattr(sefara, resource_class)
+
+    def time_construct(self, num, resource_class):
+        make_resources(self.resource_class, num)
+
+    def peakmem_construct(self, num, resource_class):
+        make_resources(self.resource_class, num)
+
+    def track_bytes_per_resource(self, num, resource_class):
+        (resources, allocated) = allocated_bytes(
+            lambda: make_resources(self.resource_class, num))
+        return allocated / float(len(resources))
+    track_bytes_per_resource.unit = "bytes"
+
+class LargeTagVocabulary(object):
+    """
+    Compact resources loaded from JSON, with tags drawn from a small or large
+    vocabulary.
+    """
+    params = ([100000], [10, 10000])
+    param_names = ["num_resources", "num_tags"]
+
+    def setup(self, num, num_tags):
+        self.data = json.dumps(dict(
+            ("resource%d" % i, {
+                "path": "/path/to/resource%d.bam" % i,
+                "tags": [
+                    "tag%d" % (i % num_tags),
+                    "tag%d" % ((i * 7) % num_tags),
+                    "wes",
+                ],
+            })
+            for i in range(num)))
+
+    def time_loads(self, num, num_tags):
+        sefara.loads(self.data, format="json", environment_transforms=False)
+
+    def peakmem_loads(self, num, num_tags):
+        sefara.loads(self.data, format="json", environment_transforms=False)
+
+    def track_bytes_per_resource(self, num, num_tags):
+        (rc, allocated) = allocated_bytes(lambda: sefara.loads(
+            self.data, format="json", environment_transforms=False))
+        return allocated / float(len(rc))
+    track_bytes_per_resource.unit = "bytes"
@@ -0,0 +1,175 @@
+"""
+Synthetic resource collections for the benchmarks.
+
+`synthetic_collection` generates a collection with a given number of
+resources, shaped like a sequencing project: a few resources per sample and
+a few samples per patient, each with a path, some numeric QC attributes, and
+some attributes that only a fraction of the resources have (including nested
+values). Tags follow a Zipf-like distribution: a few tags (e.g. "tumor",
+"wes") are on many resources, and a long tail of tags on a few each.
+
+The generator is deterministic, so every run of the benchmarks sees the same
+collections. `collection_file` writes them to Python and JSON files once, and
+reuses those files in later runs.
+"""
+
+import bisect
+import os
+import random
+import tempfile
+
+import sefara
+
+# Incremented when the generated collections change, so files written by an
+# older version are not reused.
+GENERATOR_VERSION = 1
+
+SEED = 0
+
+# Collection sizes benchmarked, limited by SEFARA_BENCHMARK_MAX_RESOURCES.
+ALL_SIZES = [1000, 10000, 100000, 1000000]
+
+CAPTURE_KITS = [
+    ("agilent-sureselect-v5", 50),
+    ("agilent-sureselect-v4", 25),
+    ("nimblegen-seqcap-ez-v3", 15),
+    ("illumina-truseq-exome", 10),
+]
+
+ASSAYS = [("wes", 60), ("wgs", 30), ("rna", 10)]
+
+NUM_TAIL_TAGS = 200
+
+def sizes():
+    """
+    Collection sizes to benchmark.
+    """
+    limit = int(os.environ.get(
+        "SEFARA_BENCHMARK_MAX_RESOURCES", ALL_SIZES[-1]))
+    return [size for size in ALL_SIZES if size <= limit]
+
+def cache_directory():
+    """
+    Directory where generated collection files are kept between runs:
+    SEFARA_BENCHMARK_DIR, or a directory in the system temporary directory.
+    """
+    return os.environ.get("SEFARA_BENCHMARK_DIR") or os.path.join(
+        tempfile.gettempdir(), "sefara-benchmarks")
+
+class _WeightedChoice(object):
+    """
+    Chooses one of some (value, weight) pairs at random, in proportion to
+    their weights.
+    """
+    def __init__(self, choices):
+        self.values = [value for (value, _) in choices]
+        self.cumulative = []
+        total = 0.0
+        for (_, weight) in choices:
+            total += weight
+            self.cumulative.append(total)
+
+    def __call__(self, rng):
+        index = bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.values[min(index, len(self.values) - 1)]
+
+def synthetic_attributes(num, seed=SEED):
+    """
+    Generate (name, attributes dict) pairs for ``num`` synthetic resources.
+    """
+    rng = random.Random(seed)
+    choose_assay = _WeightedChoice(ASSAYS)
+    choose_capture_kit = _WeightedChoice(CAPTURE_KITS)
+    choose_tail_tag = _WeightedChoice([
+        ("cohort%03d" % rank, 1.0 / ((rank + 1) ** 1.1))
+        for rank in range(NUM_TAIL_TAGS)
+    ])
+    for i in range(num):
+        sample = i // 3
+        patient = sample // 2
+        project = patient % 17
+        assay = choose_assay(rng)
+        tags = set([
+            "tumor" if sample % 2 else "normal",
+            assay,
+            choose_tail_tag(rng),
+        ])
+        for _ in range(rng.randint(0, 3)):
+            tags.add(choose_tail_tag(rng))
+        if rng.random() < 0.05:
+            tags.add("failed_qc")
+
+        attributes = {
+            "tags": sorted(tags),
+            "path": "/data/project%02d/patient%06d/sample%07d.%d.bam" % (
+                project, patient, sample, i % 3),
+            "patient": "patient%06d" % patient,
+            "sample": "sample%07d" % sample,
+            "depth": int(rng.gauss(80 if assay == "wes" else 35, 15)),
+            "read_length": rng.choice([76, 100, 150]),
+            "date": "2015-%02d-%02d" % (rng.randint(1, 12), rng.randint(1, 28)),
+        }
+        if assay != "wgs":
+            attributes["capture_kit"] = choose_capture_kit(rng)
+        if rng.random() < 0.3:
+            attributes["info"] = "resequenced after library prep %d" % (
+                rng.randint(1, 5))
+        if rng.random() < 0.2:
+            attributes["qc"] = {
+                # Not a boolean: Python collections written by sefara give
+                # JSON literals (true, false, null) for those.
+                "status": "fail" if "failed_qc" in tags else "pass",
+                "duplication_rate": round(rng.uniform(0.02, 0.4), 3),
+                "contamination": [round(rng.uniform(0, 0.05), 4)] * 2,
+            }
+        yield ("resource%07d" % i, attributes)
+
+def synthetic_collection(num, seed=SEED, resource_class=None):
+    """
+    Return a `ResourceCollection` of ``num`` synthetic resources.
+    """
+    resource_class = resource_class or sefara.Resource
+    return sefara.ResourceCollection([
+        resource_class(name, **attributes)
+        for (name, attributes) in synthetic_attributes(num, seed=seed)
+    ])
+
+def collection_file(num, format):
+    """
+    Return the path to a "python" or "json" file giving the synthetic
+    collection with ``num`` resources, writing it if necessary.
+    """
+    directory = cache_directory()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, "synthetic-v%d-%d.%s" % (
+        GENERATOR_VERSION, num, "py" if format == "python" else format))
+    if not os.path.exists(path):
+        rc = synthetic_collection(num, resource_class=sefara.CompactResource)
+        temporary = path + ".tmp%d" % os.getpid()
+        rc.write(temporary, format, indent=4)
+        os.rename(temporary, path)
+    return path
+
+def checker_file():
+    """
+    Return the path to a checker hook file for the synthetic collections.
+    """
+    path = os.path.join(cache_directory(), "checker-v%d.py" % GENERATOR_VERSION)
+    if not os.path.exists(path):
+        if not os.path.isdir(cache_directory()):
+            os.makedirs(cache_directory())
+        with open(path, "w") as fd:
+            fd.write(CHECKER)
+    return path
+
+CHECKER = """
+def check(collection):
+    for resource in collection:
+        if "capture_kit" not in resource:
+            yield (resource, False, None)
+        elif resource.depth < 40:
+            yield (resource, True, "depth %d < 40" % resource.depth)
+        else:
+            yield (resource, True, None)
+"""
@@ -12,24 +12,74 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""
+Practical dataset management.
+
+The names below are imported when first used, so that importing sefara (and
+starting the commandline tools) is fast. In particular, pandas and numpy are
+only imported when a DataFrame or `ResourceTable` is needed.
+"""
+
 from __future__ import absolute_import
 
-from . import environment, hooks
-from .resource import Resource
-from .loading import load, loads
-from .exporting import export, export_resources, transform_exports
-from . import commands
-from .resource_collection import ResourceCollection
+import importlib
+import sys
+
+# name -> (submodule, attribute), where an attribute of None means the
+# submodule itself.
+_LAZY_ATTRIBUTES = {
+    "commands": ("commands", None),
+    "environment": ("environment", None),
+    "hooks": ("hooks", None),
+    "load": ("loading", "load"),
+    "load_many": ("loading", "load_many"),
+    "loads": ("loading", "loads"),
+    "ResourceCollection": ("resource_collection", "ResourceCollection"),
+    "ResourceTable": ("resource_table", "ResourceTable"),
+    "Resource": ("resource", "Resource"),
+    "CompactResource": ("compact", "CompactResource"),
+    "export": ("exporting", "export"),
+    "export_resources": ("exporting", "export_resources"),
+    "transform_exports": ("exporting", "transform_exports"),
+}
 
 __all__ = [
     "commands",
     "load",
+    "load_many",
     "loads",
     "ResourceCollection",
+    "ResourceTable",
     "Resource",
+    "CompactResource",
     "export",
     "export_resources",
     "transform_exports",
     "environment",
     "hooks",
 ]
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        (module_name, attribute) = _LAZY_ATTRIBUTES[name]
+    else:
+        # Any submodule, e.g. sefara.snapshot, as if it had been imported.
+        (module_name, attribute) = (name, None)
+    try:
+        module = importlib.import_module("." + module_name, __name__)
+    except ImportError as e:
+        if getattr(e, "name", None) != "%s.%s" % (__name__, module_name):
+            raise
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+    value = module if attribute is None else getattr(module, attribute)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ is not supported, so import everything now.
+    for _name in __all__:
+        __getattr__(_name)
@@ -0,0 +1,242 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Parquet and Feather (Arrow IPC) collection files.
+
+These binary, columnar formats are much faster to write and read than Python
+or JSON, and a reader can decode only the columns it needs (see the
+``columns`` argument of `load`). They require the ``pyarrow`` package.
+
+A collection is stored as a table with a row for each resource, a "name"
+column, a "tags" column (a list of strings) and a column for each other
+attribute. Resources without an attribute have a null in its column. A
+column whose values are all strings, all integers, all floats or all
+booleans is stored with that type; any other column is stored as JSON text,
+which is decoded when it is read.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import json
+
+import six
+import typechecks
+
+FORMATS = ("parquet", "feather")
+
+EXTENSIONS = {
+    ".parquet": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+}
+
+MAGIC = {
+    "parquet": b"PAR1",
+    "feather": b"ARROW1",
+}
+
+# Key of the table metadata written by sefara.
+METADATA_KEY = b"sefara"
+
+METADATA_VERSION = 1
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "Parquet and Feather collections require the pyarrow package. "
+            "Install it with: pip install 'sefara[arrow]'")
+    return pyarrow
+
+def format_from_extension(filename):
+    """
+    Return "parquet" or "feather" if the filename has the corresponding
+    extension, otherwise None.
+    """
+    for (extension, format) in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return format
+    return None
+
+def format_from_magic(data):
+    """
+    Return "parquet" or "feather" if some data starts with the magic bytes of
+    one of those formats, otherwise None.
+    """
+    if not isinstance(data, bytes):
+        return None
+    for (format, magic) in MAGIC.items():
+        if data.startswith(magic):
+            return format
+    return None
+
+def _native_type(pyarrow, values):
+    """
+    Return the Arrow type for a column's values if they can be stored
+    natively, otherwise None.
+    """
+    kinds = set(type(value) for value in values if value is not _ABSENT)
+    if len(kinds) != 1:
+        return None
+    kind = kinds.pop()
+    if issubclass(kind, six.string_types):
+        return pyarrow.string()
+    if kind is bool:
+        return pyarrow.bool_()
+    if kind in six.integer_types:
+        if all(-2**63 <= value < 2**63
+               for value in values if value is not _ABSENT):
+            return pyarrow.int64()
+        return None
+    if kind is float:
+        return pyarrow.float64()
+    return None
+
+_ABSENT = object()
+
+def to_table(collection):
+    """
+    Return a `pyarrow.Table` giving the resources in a collection.
+    """
+    pyarrow = _pyarrow()
+    names = []
+    tags = []
+    attributes = collections.OrderedDict()  # attribute -> list of values
+    for (i, (name, plain)) in enumerate(collection._iter_plain_types()):
+        names.append(name)
+        tags.append(sorted(plain.pop("tags", [])))
+        for key in plain:
+            if key not in attributes:
+                attributes[key] = [_ABSENT] * i
+        for (key, values) in attributes.items():
+            values.append(plain.get(key, _ABSENT))
+
+    columns = [
+        pyarrow.array(names, pyarrow.string()),
+        pyarrow.array(tags, pyarrow.list_(pyarrow.string())),
+    ]
+    json_columns = []
+    for (key, values) in attributes.items():
+        native_type = _native_type(pyarrow, values)
+        if native_type is not None:
+            values = [None if v is _ABSENT else v for v in values]
+            columns.append(pyarrow.array(values, native_type))
+        else:
+            json_columns.append(key)
+            columns.append(pyarrow.array(
+                [None if v is _ABSENT else json.dumps(v) for v in values],
+                pyarrow.string()))
+
+    metadata = {
+        "version": METADATA_VERSION,
+        "json_columns": json_columns,
+    }
+    return pyarrow.Table.from_arrays(
+        columns,
+        names=["name", "tags"] + list(attributes),
+        metadata={METADATA_KEY: json.dumps(metadata).encode("utf-8")})
+
+def write(collection, where, format, compression=None, compression_level=None):
+    """
+    Write a collection to a path or binary file object in "parquet" or
+    "feather" format.
+
+    ``compression`` and ``compression_level`` are passed to pyarrow, which
+    supports e.g. "snappy", "gzip" and "zstd" for Parquet, and "lz4" and
+    "zstd" for Feather. Default: pyarrow's default.
+    """
+    _pyarrow()
+    table = to_table(collection)
+    options = {}
+    if compression is not None:
+        options["compression"] = compression
+    if compression_level is not None:
+        options["compression_level"] = compression_level
+    if format == "parquet":
+        from pyarrow import parquet
+        parquet.write_table(table, where, **options)
+    elif format == "feather":
+        from pyarrow import feather
+        feather.write_feather(table, where, **options)
+    else:
+        raise ValueError("Unsupported format: %s" % format)
+
+def _read_table(source, format, columns):
+    pyarrow = _pyarrow()
+    if format == "parquet":
+        from pyarrow import parquet
+        parquet_file = parquet.ParquetFile(source)
+        schema = parquet_file.schema_arrow
+        if columns is not None:
+            columns = [c for c in columns if c in schema.names]
+        return parquet_file.read(columns=columns)
+    elif format == "feather":
+        if typechecks.is_string(source):
+            # Columns that are not selected are then never read from disk.
+            source = pyarrow.memory_map(source)
+        table = pyarrow.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(
+                [c for c in columns if c in table.schema.names])
+        return table
+    raise ValueError("Unsupported format: %s" % format)
+
+def read_plain_types(source, format, columns=None):
+    """
+    Read a Parquet or Feather collection.
+
+    Parameters
+    ----------
+    source : string or file object
+        Path, or binary file object.
+
+    format : string, "parquet" or "feather"
+
+    columns : list of string [optional]
+        Attributes to read. Others are not decoded. The "name" column is
+        always read; "tags" is read only if listed.
+
+    Returns
+    ----------
+    Generator of (name, attributes dict) pairs.
+    """
+    if columns is not None:
+        columns = ["name"] + [c for c in columns if c != "name"]
+    table = _read_table(source, format, columns)
+    metadata = {}
+    if table.schema.metadata and METADATA_KEY in table.schema.metadata:
+        metadata = json.loads(
+            table.schema.metadata[METADATA_KEY].decode("utf-8"))
+    json_columns = set(metadata.get("json_columns", []))
+
+    names = table.column("name").to_pylist()
+    keys = [
+        key for key in table.schema.names
+        if key != "name" and not key.startswith("__index_level_")
+    ]
+    values = [table.column(key).to_pylist() for key in keys]
+    for (i, name) in enumerate(names):
+        fields = collections.OrderedDict()
+        for (key, column) in zip(keys, values):
+            value = column[i]
+            if value is None:
+                continue
+            if key in json_columns:
+                value = json.loads(
+                    value, object_pairs_hook=collections.OrderedDict)
+            fields[key] = value
+        yield (name, fields)
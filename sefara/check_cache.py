@@ -0,0 +1,257 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An on-disk cache of checker results.
+
+When `hooks.check` is given a cache, the result of each checker on each
+resource is stored in a SQLite database. On later runs, a resource whose
+result is cached is not passed to the checker again, as long as none of
+these have changed:
+
+    - the checker file (or, for built-in checkers, the sefara modules
+      implementing them), and the name, args and kwargs it is called with,
+    - the attributes and tags of the resource,
+    - the modification time and size of any file named by a string
+      attribute of the resource containing a path separator.
+
+Checkers given as callables rather than files are never cached.
+
+Since the checker is then run on only some of the resources, this is only
+correct for checkers that check each resource independently of the others,
+as is also required when running checkers concurrently.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import typechecks
+
+from . import snapshot
+
+DEFAULT_FILENAME = "check-results.sqlite"
+
+_SCHEMA = """
+create table if not exists results (
+    checker text not null,
+    fingerprint text not null,
+    attempted integer not null,
+    error text,
+    created real not null,
+    primary key (checker, fingerprint)
+)
+"""
+
+# SQLite limits the number of parameters in a statement.
+_BATCH_SIZE = 500
+
+def default_filename():
+    """
+    The default database file: DEFAULT_FILENAME in the snapshot cache
+    directory.
+    """
+    return os.path.join(snapshot.cache_directory(), DEFAULT_FILENAME)
+
+def checker_key(path, name, args, kwargs):
+    """
+    Return the key identifying a checker given by a path (or "builtin:" name)
+    and its arguments, or None if the checker file can't be read.
+    """
+    from . import hooks, checkers
+
+    if path.startswith(hooks.BUILTIN_PREFIX):
+        digests = [snapshot.file_digest(x) for x in checkers.source_files()]
+        digest = None if None in digests else " ".join(digests)
+    else:
+        digest = snapshot.file_digest(path)
+    if digest is None:
+        return None
+    hasher = hashlib.sha1()
+    for part in [path, name, digest, args, sorted(kwargs.items())]:
+        hasher.update(repr(part).encode("utf-8"))
+    return hasher.hexdigest()
+
+def _file_state(value):
+    try:
+        stat = os.stat(value)
+    except (OSError, ValueError):
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def resource_fingerprint(resource):
+    """
+    Return a hash of a resource's name, attributes and tags, and of the
+    modification time and size of files its string attributes refer to.
+    """
+    plain = resource.to_plain_types()
+    plain["name"] = resource["name"]
+    plain["tags"] = sorted(plain["tags"])
+    files = dict(
+        (key, _file_state(value)) for (key, value) in plain.items()
+        if typechecks.is_string(value) and os.sep in value)
+    encoded = json.dumps(
+        [plain, files], sort_keys=True, default=repr).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+class CheckCache(object):
+    """
+    A database of checker results.
+
+    A connection is opened for each operation, so instances can be shared
+    between threads and pickled to worker processes.
+    """
+    def __init__(self, filename=None, max_age=None, force=False):
+        """
+        Parameters
+        ----------
+        filename : string [optional]
+            SQLite database file, created if necessary. Default: see
+            `default_filename`.
+
+        max_age : float [optional]
+            Ignore, and delete, results stored more than this many seconds
+            ago.
+
+        force : Boolean [default: False]
+            Ignore all stored results. New results are still stored.
+        """
+        self.filename = filename or default_filename()
+        self.max_age = max_age
+        self.force = force
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(_SCHEMA)
+                if max_age is not None:
+                    connection.execute(
+                        "delete from results where created < ?",
+                        (time.time() - max_age,))
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.filename, timeout=60)
+
+    def lookup(self, checker, fingerprints):
+        """
+        Return a dict of fingerprint -> (attempted, error) for the given
+        resource fingerprints that have results for the given checker key.
+        """
+        if self.force:
+            return {}
+        oldest = (
+            time.time() - self.max_age if self.max_age is not None
+            else float("-inf"))
+        fingerprints = list(set(fingerprints))
+        results = {}
+        connection = self._connect()
+        try:
+            for i in range(0, len(fingerprints), _BATCH_SIZE):
+                batch = fingerprints[i : i + _BATCH_SIZE]
+                rows = connection.execute(
+                    "select fingerprint, attempted, error from results "
+                    "where checker = ? and created >= ? and fingerprint in "
+                    "(%s)" % ", ".join("?" * len(batch)),
+                    [checker, oldest] + batch)
+                for (fingerprint, attempted, error) in rows:
+                    results[fingerprint] = (bool(attempted), error)
+        finally:
+            connection.close()
+        return results
+
+    def store(self, checker, results):
+        """
+        Store (fingerprint, attempted, error) results for a checker key.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "insert or replace into results values (?, ?, ?, ?, ?)",
+                    [
+                        (checker, fingerprint, int(bool(attempted)),
+                            error, now)
+                        for (fingerprint, attempted, error) in results
+                    ])
+        finally:
+            connection.close()
+
+    def clear(self):
+        """
+        Delete all stored results.
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("delete from results")
+        finally:
+            connection.close()
+
+def cached_checker(cache, key, function):
+    """
+    Wrap a checker function so that it is only run on resources without
+    cached results.
+
+    Results are generated as the checker produces them, and stored in the
+    cache in batches.
+    """
+    def check(collection, *args, **kwargs):
+        from .resource_collection import ResourceCollection
+
+        resources = list(collection)
+        fingerprints = [resource_fingerprint(r) for r in resources]
+        cached = cache.lookup(key, fingerprints)
+        missing = [
+            resource
+            for (resource, fingerprint) in zip(resources, fingerprints)
+            if fingerprint not in cached
+        ]
+        computed = iter(())
+        if missing:
+            computed = iter(function(
+                ResourceCollection(
+                    missing, getattr(collection, "filename", None)),
+                *args, **kwargs))
+        pending = []  # (fingerprint, attempted, error) not yet stored
+        try:
+            for (resource, fingerprint) in zip(resources, fingerprints):
+                if fingerprint in cached:
+                    (attempted, error) = cached[fingerprint]
+                    yield (resource, attempted, error)
+                    continue
+                result = next(computed, None)
+                if result is None:
+                    # The checker stopped early.
+                    return
+                (result_resource, attempted, error) = result
+                if result_resource is resource and (
+                        error is None or typechecks.is_string(error)):
+                    pending.append((fingerprint, attempted, error))
+                    if len(pending) >= _BATCH_SIZE:
+                        cache.store(key, pending)
+                        pending = []
+                yield result
+        finally:
+            if pending:
+                cache.store(key, pending)
+    return check
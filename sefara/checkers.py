@@ -0,0 +1,108 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Checkers that ship with sefara.
+
+These are used by giving "builtin:<name>" as a checker, for example
+``sefara-check collection.py --checker builtin:path``. See `hooks.check` for
+how checkers work.
+
+The path checker requires Python 3.7 or later.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+
+# Maximum number of filesystem operations in flight at once.
+DEFAULT_CONCURRENCY = 32
+
+def source_files():
+    """
+    Return the paths of the source files implementing the built-in checkers.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return [
+        os.path.join(directory, name)
+        for name in ["checkers.py", "path_checks.py"]
+    ]
+
+def check_paths(
+        collection,
+        attribute="path",
+        concurrency=DEFAULT_CONCURRENCY,
+        on_latency=None):
+    """
+    Check that the file or directory given by each resource's ``path``
+    attribute exists and is readable.
+
+    Resources are grouped by parent directory, and each directory is listed
+    once. Files found in the listing are checked with `os.access` alone;
+    others (which may still exist, e.g. on a case-insensitive filesystem)
+    with `os.stat` and `os.access`. Filesystem calls run in a thread pool,
+    with at most ``concurrency`` of them in flight at once, scheduled with
+    asyncio.
+
+    Parameters
+    ----------
+    collection : `ResourceCollection`
+
+    attribute : string [optional, default: "path"]
+        Attribute giving the path to check. Resources without it are not
+        attempted.
+
+    concurrency : int [optional]
+        Maximum number of filesystem calls in flight at once.
+
+    on_latency : callable [optional]
+        Called as ``on_latency(resource, seconds)`` with the time taken to
+        check each resource that was attempted, from the start of its own
+        filesystem calls (the directory listing and waiting for other calls
+        are not counted). Error messages also give this time.
+
+    Returns
+    ----------
+    Iterator of ``(resource, attempted, problem)`` tuples, in collection
+    order.
+
+    Raises RuntimeError on Python versions before 3.7.
+    """
+    if sys.version_info < (3, 7):
+        raise RuntimeError(
+            "The builtin:path checker requires Python 3.7 or later.")
+    from . import path_checks
+
+    resources = list(collection)
+    results = path_checks.run_check_paths(
+        resources, attribute, concurrency, on_latency)
+    return (
+        (resource, attempted, problem)
+        for (resource, (attempted, problem)) in zip(resources, results))
+
+# Checkers available as "builtin:<name>".
+BUILTIN_CHECKERS = {
+    "path": check_paths,
+}
+
+def builtin(name):
+    """
+    Return the built-in checker with the given name.
+    """
+    try:
+        return BUILTIN_CHECKERS[name]
+    except KeyError:
+        raise ValueError("No such built-in checker: %s (available: %s)" % (
+            name, " ".join(sorted(BUILTIN_CHECKERS))))
@@ -0,0 +1,849 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Evaluate filter expressions over whole columns of a collection at once.
+
+Common filters, such as ``tags.foo and not tags.bar`` or
+``capture_kit == 'x' and depth > 30``, can be answered with NumPy boolean
+mask operations instead of evaluating Python code once per resource. Only a
+subset of Python expressions is understood; for anything else
+`evaluate_filter` raises `Unsupported`, and the caller should fall back to
+`Resource.evaluate`.
+
+Columns are typed: numbers are stored in float arrays, and compared or
+combined with NumPy operations; strings and bools are dictionary encoded, so
+comparisons, membership tests and method calls run once per distinct value
+rather than once per row. Other values are kept in object arrays.
+
+Evaluation follows Python semantics exactly, including short circuiting:
+the right side of ``a and b`` is only evaluated on the rows where ``a`` is
+true. If evaluating any part of the expression raises an exception (for
+example comparing None to a number), `Unsupported` is raised so that the
+per-resource path can report the error as usual.
+"""
+
+from __future__ import absolute_import
+
+import ast
+import collections
+import itertools
+import operator
+
+import numpy
+import six
+
+from .resource import Tags
+
+class Unsupported(Exception):
+    """
+    The expression cannot be evaluated by the columnar engine.
+    """
+    pass
+
+class ColumnarView(object):
+    """
+    A column-oriented view of a list of resources.
+
+    Columns are built on demand, the first time an expression refers to the
+    corresponding attribute, and then kept for the lifetime of the view.
+    """
+    def __init__(self, resources, attributes, tag_index=None):
+        """
+        Parameters
+        ----------
+        resources : list of `Resource` instances
+
+        attributes : set of strings
+            Attribute names used by any of the resources. In filter
+            expressions these names default to None for resources where they
+            are missing.
+
+        tag_index : `TagIndex` [optional]
+            Index of the tags of these resources. If not specified, tag masks
+            are computed by scanning the resources.
+        """
+        self.resources = resources
+        self.attributes = attributes
+        self.tag_index = tag_index
+        self._columns = {}
+        self._typed_columns = {}
+
+    def __len__(self):
+        return len(self.resources)
+
+    def column(self, name):
+        """
+        Return a NumPy object array giving the value of attribute ``name``
+        for each resource, or None where it is missing.
+        """
+        try:
+            return self._columns[name]
+        except KeyError:
+            pass
+        result = numpy.empty(len(self.resources), dtype=object)
+        for (i, resource) in enumerate(self.resources):
+            # Assign elementwise: list values must not be broadcast.
+            result[i] = resource.get(name)
+        self._columns[name] = result
+        return result
+
+    def typed_column(self, name):
+        """
+        Return the values of attribute ``name`` as given by `typed_column`.
+        """
+        try:
+            return self._typed_columns[name]
+        except KeyError:
+            return self._typed_columns.setdefault(
+                name, typed_column(self.column(name)))
+
+    def tag_mask(self, tag):
+        """
+        Return a NumPy boolean array indicating which resources have the
+        specified tag.
+        """
+        if self.tag_index is not None:
+            if self.tag_index.untagged:
+                # "tags.foo" raises an error on these resources.
+                raise Unsupported("Some resources have no tags")
+            return self.tag_index.mask(tag)
+        return numpy.fromiter(
+            (tag in tags for tags in self.column("tags")),
+            dtype=bool,
+            count=len(self))
+
+class TagIndex(object):
+    """
+    Map from each tag to a NumPy boolean array (a bitmap) giving which
+    resources in a list have that tag.
+
+    Boolean expressions over tags can be answered with bitwise operations on
+    these arrays, without looking at the resources.
+    """
+    def __init__(self, resources):
+        """
+        Parameters
+        ----------
+        resources : list of `Resource` instances
+        """
+        positions = collections.defaultdict(list)
+
+        # Number of resources whose "tags" attribute is missing or not a
+        # `Tags` instance. Expressions like "tags.foo" raise an error on such
+        # resources, so the index can't be used to evaluate them.
+        self.untagged = 0
+        for (i, resource) in enumerate(resources):
+            tags = resource.get("tags")
+            if not isinstance(tags, Tags):
+                self.untagged += 1
+                continue
+            for tag in tags:
+                positions[tag].append(i)
+        self.length = len(resources)
+        self.masks = {}
+        for (tag, indices) in positions.items():
+            mask = numpy.zeros(self.length, dtype=bool)
+            mask[indices] = True
+            self.masks[tag] = mask
+
+    def mask(self, tag):
+        """
+        Boolean array giving whether each resource has the specified tag.
+        The result must not be modified.
+        """
+        try:
+            return self.masks[tag]
+        except KeyError:
+            return numpy.zeros(self.length, dtype=bool)
+
+    @property
+    def tags(self):
+        """
+        Set of tags used by any resource.
+        """
+        return set(self.masks)
+
+def evaluate_filter(view, expression):
+    """
+    Evaluate a filter expression over a `ColumnarView`.
+
+    Parameters
+    ----------
+    view : `ColumnarView`
+
+    expression : string
+        Python expression, as accepted by `ResourceCollection.filter`.
+
+    Returns
+    ----------
+    NumPy boolean array with one entry per resource in the view, giving
+    whether ``expression`` evaluated to a true value for that resource.
+
+    Raises `Unsupported` if the expression can't be evaluated by this engine.
+    """
+    try:
+        tree = ast.parse(expression.lstrip(" \t"), mode="eval")
+    except SyntaxError:
+        raise Unsupported("Syntax error")
+    rows = numpy.arange(len(view))
+    try:
+        # Python doesn't warn about NaNs or overflow, so neither do we.
+        with numpy.errstate(all="ignore"):
+            return _Evaluator(view).mask(tree.body, rows)
+    except Unsupported:
+        raise
+    except Exception as e:
+        # Let the per-resource path raise, with its usual error message.
+        raise Unsupported("Evaluation failed: %s" % e)
+
+# Constant node types. Python 3.8+ uses ast.Constant; older versions have one
+# node type per kind of literal.
+_CONSTANT_NODES = tuple(
+    getattr(ast, name) for name in ("Constant", "Str", "Num", "NameConstant")
+    if hasattr(ast, name))
+
+_BUILTIN_CONSTANTS = {"True": True, "False": False, "None": None}
+
+def _contains(a, b):
+    return a in b
+
+def _not_contains(a, b):
+    return a not in b
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: _contains,
+    ast.NotIn: _not_contains,
+}
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+# Methods that may be called on attribute values in an expression, e.g.
+# "name.startswith('foo')".
+_METHODS = frozenset([
+    "startswith", "endswith", "lower", "upper", "strip", "lstrip", "rstrip",
+    "split", "count", "find", "get", "keys", "values",
+])
+
+def _vectorized_string_function(name, arguments):
+    """
+    Return a function computing the string method or builtin ``name`` with
+    the given arguments on a NumPy unicode array, or None if there isn't one
+    (NumPy's string functions need NumPy 2).
+    """
+    strings = getattr(numpy, "strings", None)
+    if strings is None:
+        return None
+    if name in ("startswith", "endswith") and (
+            len(arguments) == 1 and
+            isinstance(arguments[0], six.text_type)):
+        numpy_function = getattr(strings, name)
+        return lambda array: numpy_function(array, arguments[0])
+    if name == "len" and not arguments:
+        return strings.str_len
+    return None
+
+# Builtin functions that may be called on attribute values, e.g. "len(name)".
+_FUNCTIONS = {
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "abs": abs,
+}
+
+class _Scalar(object):
+    """
+    A value that is the same for every row.
+    """
+    def __init__(self, value):
+        self.value = value
+
+# Integers up to this magnitude are exactly representable as float64, so
+# numeric columns holding them can be stored in a float array.
+_MAX_EXACT_INTEGER = 2 ** 53
+
+_INTEGER_TYPES = tuple(six.integer_types)
+
+# Columns are typed by the exact types of their values, so subclasses (which
+# may override operators) are left in object arrays.
+_INTEGER_KINDS = frozenset(_INTEGER_TYPES)
+
+_NUMBER_TYPES = frozenset(_INTEGER_TYPES + (float,))
+
+_CATEGORY_TYPES = frozenset(
+    tuple(six.string_types) + (six.text_type, six.binary_type, bool))
+
+class _Numeric(object):
+    """
+    A column of numbers (ints and floats, but not bools) and Nones.
+
+    The numbers are held in a float array, with a mask giving which were
+    ints, so the original values can be recovered exactly.
+    """
+    def __init__(self, values, is_int, missing=None):
+        self.values = values
+        self.is_int = is_int
+        # None means no value is missing.
+        self.missing = missing if missing is not None and missing.any() else (
+            None)
+
+    @classmethod
+    def from_objects(cls, objects):
+        """
+        Return a `_Numeric` for an object array of ints, floats and Nones, or
+        None if some ints are too large to be represented exactly.
+        """
+        missing = numpy.fromiter(
+            map(operator.is_, objects, itertools.repeat(None)),
+            dtype=bool,
+            count=len(objects))
+        is_int = numpy.fromiter(
+            map(_INTEGER_KINDS.__contains__, map(type, objects)),
+            dtype=bool,
+            count=len(objects))
+        if missing.any():
+            objects = objects.copy()
+            objects[missing] = 0.0
+        try:
+            values = objects.astype(numpy.float64)
+        except OverflowError:
+            return None
+        if numpy.any(numpy.abs(values[is_int]) >= _MAX_EXACT_INTEGER):
+            return None
+        return cls(values, is_int, missing)
+
+    def __len__(self):
+        return len(self.values)
+
+    def take(self, index):
+        return _Numeric(
+            self.values[index],
+            self.is_int[index],
+            None if self.missing is None else self.missing[index])
+
+    def objects(self):
+        result = self.values.astype(object)
+        if self.is_int.any():
+            result[self.is_int] = (
+                self.values[self.is_int].astype(numpy.int64).astype(object))
+        if self.missing is not None:
+            result[self.missing] = None
+        return result
+
+    def categorical(self):
+        """
+        Return the same values as a `_Categorical`.
+        """
+        codes = numpy.empty(len(self), dtype=numpy.int64)
+        categories = []
+        # Compare bit patterns, so -0.0 and 0.0 (and NaNs) stay distinct.
+        bits = self.values.view(numpy.int64)
+        missing = (
+            self.missing if self.missing is not None
+            else numpy.zeros(len(self), dtype=bool))
+        for (selection, convert) in [
+                (self.is_int & ~missing, int),
+                (~self.is_int & ~missing, float)]:
+            indices = selection.nonzero()[0]
+            if len(indices):
+                (unique, inverse) = numpy.unique(
+                    bits[indices], return_inverse=True)
+                codes[indices] = inverse.reshape(-1) + len(categories)
+                categories.extend(
+                    convert(x) for x in unique.view(numpy.float64))
+        if missing.any():
+            codes[missing] = len(categories)
+            categories.append(None)
+        return _Categorical(codes, _object_array(categories))
+
+class _Categorical(object):
+    """
+    A dictionary encoded column: an integer code for each row, indexing an
+    array of distinct values ("categories").
+
+    A function of a single column is computed by calling it once for each
+    distinct value that occurs, instead of once per row.
+    """
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_objects(cls, objects, mixed=True):
+        """
+        Dictionary encode an object array of hashable values. If ``mixed``
+        is False, the values must all be of one type (or None).
+        """
+        if mixed:
+            # Keyed by type too, so that e.g. True and 1 stay distinct.
+            keys = list(zip(map(type, objects), objects))
+        else:
+            keys = objects.tolist()
+        ids = dict((key, i) for (i, key) in enumerate(dict.fromkeys(keys)))
+        codes = numpy.fromiter(
+            map(ids.__getitem__, keys), dtype=numpy.int64, count=len(keys))
+        categories = [None] * len(ids)
+        for (key, code) in ids.items():
+            categories[code] = key[1] if mixed else key
+        return cls(codes, _object_array(categories))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def take(self, index):
+        return _Categorical(self.codes[index], self.categories)
+
+    def objects(self):
+        return self.categories[self.codes]
+
+    def map(self, function):
+        """
+        Return ``function`` of each value, as given by `typed_column`. The
+        function is called only on categories that occur.
+        """
+        counts = numpy.bincount(self.codes, minlength=len(self.categories))
+        used = counts.nonzero()[0]
+        renumber = numpy.zeros(len(self.categories), dtype=numpy.int64)
+        renumber[used] = numpy.arange(len(used))
+        results = _object_array(
+            [function(x) for x in self.categories[used].tolist()])
+        return _take(typed_column(results), renumber[self.codes])
+
+    def map_strings(self, function):
+        """
+        Like `map`, but ``function`` takes a NumPy unicode array of the
+        categories that occur, and returns a NumPy array of results. Returns
+        None if the categories aren't all strings.
+        """
+        counts = numpy.bincount(self.codes, minlength=len(self.categories))
+        used = counts.nonzero()[0]
+        strings = self.categories[used].tolist()
+        # Fixed width NumPy strings drop trailing NUL characters.
+        if set(map(type, strings)) != set([six.text_type]) or (
+                u"\0" in u"".join(strings)):
+            return None
+        renumber = numpy.zeros(len(self.categories), dtype=numpy.int64)
+        renumber[used] = numpy.arange(len(used))
+        results = function(numpy.array(strings, dtype=numpy.str_))
+        if results.dtype != bool:
+            results = _Numeric(
+                results.astype(numpy.float64),
+                numpy.ones(len(results), dtype=bool))
+        return _take(results, renumber[self.codes])
+
+    def truth(self):
+        return numpy.array(
+            [bool(x) for x in self.categories], dtype=bool)[self.codes]
+
+def _object_array(values):
+    # Unlike numpy.array, these don't treat list values as a further
+    # dimension.
+    try:
+        return numpy.fromiter(values, dtype=object, count=len(values))
+    except ValueError:  # NumPy < 1.23
+        pass
+    result = numpy.empty(len(values), dtype=object)
+    for (i, value) in enumerate(values):
+        result[i] = value
+    return result
+
+def typed_column(objects):
+    """
+    Return a column given as an object array in the most efficient
+    representation that gives the same results: numeric, dictionary encoded
+    (for strings and bools), or the object array itself.
+    """
+    types = set(map(type, objects))
+    types.discard(type(None))
+    if types and types <= _NUMBER_TYPES:
+        numeric = _Numeric.from_objects(objects)
+        return objects if numeric is None else numeric
+    if types <= _CATEGORY_TYPES:
+        return _Categorical.from_objects(objects, mixed=len(types) > 1)
+    return objects
+
+def _take(value, index):
+    if isinstance(value, _Scalar):
+        return value
+    if isinstance(value, (_Numeric, _Categorical)):
+        return value.take(index)
+    return value[index]
+
+def _objects(value, length):
+    """
+    Return an object array for any kind of value.
+    """
+    if isinstance(value, _Scalar):
+        return _broadcast(value.value, length)
+    if isinstance(value, (_Numeric, _Categorical)):
+        return value.objects()
+    if value.dtype != object:
+        return value.astype(object)
+    return value
+
+def _as_categorical(value):
+    """
+    Return a `_Categorical` for a column, if it can be one cheaply, or None.
+    """
+    if isinstance(value, _Categorical):
+        return value
+    if isinstance(value, _Numeric):
+        return value.categorical()
+    if value.dtype == bool:
+        return _Categorical(
+            value.astype(numpy.int64), _object_array([False, True]))
+    return None
+
+# NumPy equivalents of Python operators on numbers.
+_NUMPY_COMPARISONS = {
+    operator.eq: numpy.equal,
+    operator.ne: numpy.not_equal,
+    operator.lt: numpy.less,
+    operator.le: numpy.less_equal,
+    operator.gt: numpy.greater,
+    operator.ge: numpy.greater_equal,
+}
+
+_NUMPY_ARITHMETIC = {
+    operator.add: numpy.add,
+    operator.sub: numpy.subtract,
+    operator.mul: numpy.multiply,
+    operator.truediv: numpy.true_divide,
+    operator.floordiv: numpy.floor_divide,
+    operator.mod: numpy.remainder,
+}
+
+def _numeric_operand(value):
+    """
+    Return (values, is_int) for a number or a `_Numeric` without missing
+    values, or None.
+    """
+    if isinstance(value, _Numeric):
+        if value.missing is not None:
+            return None
+        return (value.values, value.is_int)
+    if isinstance(value, _Scalar):
+        value = value.value
+        if isinstance(value, float):
+            return (value, False)
+        if (isinstance(value, _INTEGER_TYPES) and
+                not isinstance(value, bool) and
+                -_MAX_EXACT_INTEGER < value < _MAX_EXACT_INTEGER):
+            return (float(value), True)
+    return None
+
+def _numeric_operation(function, left, right):
+    """
+    Apply a comparison or arithmetic operator to numbers with NumPy. Returns
+    None if the operands aren't numeric, or if the result might differ from
+    Python's (division by zero, or integers too large to be exact).
+    """
+    if function in _NUMPY_COMPARISONS:
+        numpy_function = _NUMPY_COMPARISONS[function]
+    elif function in _NUMPY_ARITHMETIC:
+        numpy_function = _NUMPY_ARITHMETIC[function]
+    else:
+        return None
+    operands = [_numeric_operand(left), _numeric_operand(right)]
+    if operands[0] is None or operands[1] is None:
+        return None
+    ((left_values, left_int), (right_values, right_int)) = operands
+    if (function in (operator.truediv, operator.floordiv, operator.mod) and
+            numpy.any(right_values == 0)):
+        return None
+    result = numpy_function(left_values, right_values)
+    if function in _NUMPY_COMPARISONS:
+        return result
+    if function is operator.truediv:
+        is_int = numpy.zeros(len(result), dtype=bool)
+    else:
+        is_int = numpy.logical_and(left_int, right_int)
+        is_int = numpy.broadcast_to(is_int, result.shape).copy()
+    if is_int.any() and numpy.any(
+            numpy.abs(result[is_int]) >= _MAX_EXACT_INTEGER):
+        return None
+    return _Numeric(result, is_int)
+
+def _numeric_unary(function, operand):
+    """
+    Apply negation, abs or float to a `_Numeric` with NumPy. Returns None
+    for other functions and operands.
+    """
+    if not isinstance(operand, _Numeric) or operand.missing is not None:
+        return None
+    if function is operator.neg:
+        return _Numeric(-operand.values, operand.is_int)
+    if function is abs:
+        return _Numeric(numpy.abs(operand.values), operand.is_int)
+    if function is float:
+        return _Numeric(operand.values, numpy.zeros(len(operand), dtype=bool))
+    return None
+
+def _apply(function, *operands):
+    """
+    Apply a Python function elementwise. Each operand is a `_Scalar`, a
+    `_Numeric` or `_Categorical` column, or a NumPy array. Returns a
+    `_Scalar` if all operands are scalars.
+
+    Operators on numbers use NumPy. Otherwise, a function of one column is
+    called once per distinct value, and anything else falls back to calling
+    it on each row.
+    """
+    if all(isinstance(x, _Scalar) for x in operands):
+        return _Scalar(function(*[x.value for x in operands]))
+    if len(operands) == 2:
+        result = _numeric_operation(function, *operands)
+        if result is not None:
+            return result
+    if len(operands) == 1:
+        result = _numeric_unary(function, operands[0])
+        if result is not None:
+            return result
+        categorical = _as_categorical(operands[0])
+        if categorical is not None:
+            return categorical.map(function)
+        return numpy.frompyfunc(function, 1, 1)(operands[0])
+    vectors = [x for x in operands if not isinstance(x, _Scalar)]
+    if len(vectors) == 1:
+        # Close over the scalar arguments so NumPy does not try to broadcast
+        # over them (they may be lists).
+        position = [i for (i, x) in enumerate(operands)
+                    if not isinstance(x, _Scalar)][0]
+        values = [x.value if isinstance(x, _Scalar) else None
+                  for x in operands]
+
+        def unary(item):
+            values[position] = item
+            return function(*values)
+        categorical = _as_categorical(vectors[0])
+        if categorical is not None:
+            return categorical.map(unary)
+        return numpy.frompyfunc(unary, 1, 1)(vectors[0])
+    arrays = [_objects(x, len(vectors[0])) for x in operands]
+    return numpy.frompyfunc(function, len(arrays), 1)(*arrays)
+
+def _broadcast(value, length):
+    result = numpy.empty(length, dtype=object)
+    for i in range(length):
+        result[i] = value
+    return result
+
+def _truth(value, length):
+    """
+    Convert any kind of value to a boolean array giving the truth value of
+    each element.
+    """
+    if isinstance(value, _Scalar):
+        return numpy.repeat(bool(value.value), length)
+    if isinstance(value, _Numeric):
+        # NaN is true, as in Python.
+        result = value.values != 0
+        if value.missing is not None:
+            result &= ~value.missing
+        return result
+    if isinstance(value, _Categorical):
+        return value.truth()
+    if value.dtype == bool:
+        return value
+    return value.astype(bool)
+
+def _is_singleton(node):
+    """
+    Is the node the literal None, True or False?
+    """
+    if isinstance(node, ast.Name):
+        return node.id in _BUILTIN_CONSTANTS
+    if isinstance(node, _CONSTANT_NODES):
+        value = getattr(node, "value", getattr(node, "n", 0))
+        return any(value is x for x in (None, True, False))
+    return False
+
+class _Evaluator(object):
+    """
+    Evaluates an expression AST over the rows of a `ColumnarView`.
+
+    Every method takes a ``rows`` argument, an integer array of row indices
+    into the view, and evaluates the node only for those rows.
+    """
+    def __init__(self, view):
+        self.view = view
+
+    def mask(self, node, rows):
+        """
+        Evaluate ``node`` in a boolean context. Returns a boolean array with
+        one entry for each element of ``rows``.
+        """
+        if isinstance(node, ast.BoolOp):
+            is_and = isinstance(node.op, ast.And)
+            result = numpy.repeat(is_and, len(rows))
+            remaining = numpy.arange(len(rows))
+            for operand in node.values:
+                if len(remaining) == 0:
+                    break
+                value = self.mask(operand, rows[remaining])
+                if is_and:
+                    # Rows where this operand is false are decided.
+                    result[remaining[~value]] = False
+                    remaining = remaining[value]
+                else:
+                    result[remaining[value]] = True
+                    remaining = remaining[~value]
+            return result
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ~self.mask(node.operand, rows)
+        if (isinstance(node, ast.Attribute) and
+                isinstance(node.value, ast.Name) and
+                node.value.id == "tags" and
+                "tags" in self.view.attributes):
+            if hasattr(Tags, node.attr):
+                raise Unsupported("Not a tag: %s" % node.attr)
+            return self.view.tag_mask(node.attr)[rows]
+        return _truth(self.value(node, rows), len(rows))
+
+    def value(self, node, rows):
+        """
+        Evaluate ``node`` for its value. Returns a `_Scalar`, a `_Numeric`
+        or `_Categorical` column, or an array, with one entry for each
+        element of ``rows``.
+        """
+        if isinstance(node, _CONSTANT_NODES):
+            for field in ("value", "s", "n"):
+                if hasattr(node, field):
+                    return _Scalar(getattr(node, field))
+        if isinstance(node, ast.Name):
+            if node.id in self.view.attributes:
+                return _take(self.view.typed_column(node.id), rows)
+            if node.id in _BUILTIN_CONSTANTS:
+                return _Scalar(_BUILTIN_CONSTANTS[node.id])
+            raise Unsupported("Unknown name: %s" % node.id)
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            items = [self.value(x, rows) for x in node.elts]
+            if not all(isinstance(x, _Scalar) for x in items):
+                raise Unsupported("Non-constant container")
+            values = [x.value for x in items]
+            if isinstance(node, ast.Tuple):
+                return _Scalar(tuple(values))
+            if isinstance(node, ast.Set):
+                return _Scalar(set(values))
+            return _Scalar(values)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return ~self.mask(node.operand, rows)
+            if isinstance(node.op, ast.USub):
+                return _apply(operator.neg, self.value(node.operand, rows))
+            raise Unsupported("Unary operator: %s" % type(node.op).__name__)
+        if isinstance(node, ast.BinOp):
+            try:
+                function = _BINARY_OPERATORS[type(node.op)]
+            except KeyError:
+                raise Unsupported(
+                    "Binary operator: %s" % type(node.op).__name__)
+            return _apply(
+                function,
+                self.value(node.left, rows),
+                self.value(node.right, rows))
+        if isinstance(node, ast.Compare):
+            return self.compare(node, rows)
+        if isinstance(node, ast.Call):
+            return self.call(node, rows)
+        raise Unsupported("Expression node: %s" % type(node).__name__)
+
+    def compare(self, node, rows):
+        functions = []
+        for op in node.ops:
+            try:
+                functions.append(_COMPARISONS[type(op)])
+            except KeyError:
+                raise Unsupported("Comparison: %s" % type(op).__name__)
+        # Typed columns don't keep the original objects, so identity is only
+        # tested against the None, True and False singletons.
+        for (function, comparator) in zip(functions, node.comparators):
+            if function in (operator.is_, operator.is_not) and not (
+                    _is_singleton(comparator)):
+                raise Unsupported("Identity comparison")
+        left = self.value(node.left, rows)
+        if len(functions) == 1:
+            return _apply(
+                functions[0], left, self.value(node.comparators[0], rows))
+
+        # A chained comparison "a < b < c" means "a < b and b < c", with the
+        # second comparison evaluated only where the first is true. The
+        # value is that of the last comparison evaluated.
+        result = numpy.empty(len(rows), dtype=object)
+        remaining = numpy.arange(len(rows))
+        for (function, comparator) in zip(functions, node.comparators):
+            right = self.value(comparator, rows[remaining])
+            outcome = _apply(function, left, right)
+            result[remaining] = _objects(outcome, len(remaining))
+            truth = _truth(outcome, len(remaining))
+            remaining = remaining[truth]
+            left = _take(right, truth)
+            if len(remaining) == 0:
+                break
+        return result
+
+    def call(self, node, rows):
+        if (node.keywords or
+                getattr(node, "starargs", None) or
+                getattr(node, "kwargs", None)):
+            raise Unsupported("Keyword or star arguments")
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr in _METHODS:
+            arguments = [self.value(x, rows) for x in node.args]
+            if not all(isinstance(x, _Scalar) for x in arguments):
+                raise Unsupported("Non-constant method arguments")
+            arguments = [x.value for x in arguments]
+            return self.string_function(
+                func.attr,
+                arguments,
+                operator.methodcaller(func.attr, *arguments),
+                self.value(func.value, rows))
+        if (isinstance(func, ast.Name) and
+                func.id in _FUNCTIONS and
+                func.id not in self.view.attributes and
+                len(node.args) == 1):
+            return self.string_function(
+                func.id,
+                [],
+                _FUNCTIONS[func.id],
+                self.value(node.args[0], rows))
+        raise Unsupported("Function call")
+
+    def string_function(self, name, arguments, function, value):
+        """
+        Apply ``function``, the method or builtin ``name`` with the given
+        arguments, to ``value``, using NumPy's string functions if possible.
+        """
+        vectorized = _vectorized_string_function(name, arguments)
+        if vectorized is not None and isinstance(value, _Categorical):
+            result = value.map_strings(vectorized)
+            if result is not None:
+                return result
+        return _apply(function, value)
@@ -1,3 +1,11 @@
-from . import check, dump, env, select
+import importlib
 
-__all__ = ["check", "dump", "env", "select"]
\ No newline at end of file
+__all__ = ["check", "dump", "env", "select", "serve"]
+
+def __getattr__(name):
+    # Commands are imported when used, so running one does not import the
+    # others.
+    if name not in __all__:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+    return importlib.import_module("." + name, __name__)
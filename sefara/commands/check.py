@@ -26,7 +26,7 @@ import sys
 import textwrap
 
 from . import util
-from .. import resource_collection, hooks
+from .. import check_cache, hooks
 from .util import print_stderr as stderr
 
 parser = argparse.ArgumentParser(
@@ -42,89 +42,129 @@ parser.add_argument(
     default=True,
     help="Run only the checkers explicitly specified. Do not run checkers "
     "configured in environment variables.")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+    help="Number of checker jobs to run concurrently, on chunks of the "
+    "collection. Default: %(default)d.")
+parser.add_argument("--executor", choices=("thread", "process"),
+    default="thread",
+    help="Run concurrent jobs in threads (suited to I/O bound checkers) or "
+    "processes. Default: %(default)s.")
+parser.add_argument("--cache", nargs="?", const=True, default=None,
+    metavar="FILE",
+    help="Store checker results in a SQLite database, and don't check "
+    "resources again unless they, the files they refer to, or the checker "
+    "have changed. Default FILE: %s in the cache directory."
+    % check_cache.DEFAULT_FILENAME)
+parser.add_argument("--force", action="store_true", default=False,
+    help="With --cache, check all resources, ignoring stored results.")
+parser.add_argument("--max-age", type=float, metavar="SECONDS",
+    help="With --cache, don't use results stored more than this many "
+    "seconds ago.")
 parser.add_argument("-v", "--verbose", action="store_true", default=False)
 parser.add_argument("-q", "--quiet", action="store_true", default=False,
     help="Print only a summary of errors.")
 parser.add_argument("--width", type=int, default=100,
     help="Line width. Default: %(default)d.")
 
-def run(argv=sys.argv[1:]):
-    args = parser.parse_args(argv)
-    rc = util.load_from_args(args)
+def write_output(rc, args, out):
+    """
+    Run the checkers given by the parsed arguments on a collection, and write
+    a report.
+    """
+    cache = None
+    if args.cache:
+        cache = check_cache.CheckCache(
+            None if args.cache is True else args.cache,
+            max_age=args.max_age,
+            force=args.force)
 
     results = hooks.check(
         rc,
         args.checker,
-        include_environment_checkers=args.environment_checkers)
+        include_environment_checkers=args.environment_checkers,
+        jobs=args.jobs,
+        executor=args.executor,
+        cache=cache)
 
-    try:
-        problematic_resources = []
-        for (i, (resource, tpls)) in enumerate(results):
-            if i == 0:
-                print("Checkers:")
-                for (checker_num, (checker, _, _)) in enumerate(tpls):
-                    print("\t[%d]\t%s" % (checker_num, checker))
-                print()
-            sys.stdout.flush()
-            num_errors = sum(
-                1 for (checker, attempted, error) in tpls
-                if attempted and error)
-            num_attempted = sum(
-                1 for (checker, attempted, error) in tpls if attempted)
-            
-            if not args.quiet:
-                summary = " ".join(
-                    "--" if not attempted else (
-                        "ER" if error else "OK")
-                    for (_, attempted, error) in tpls)
-                print("[%3d / %3d] %s %s" % (
-                    i + 1, len(rc), resource.name.ljust(55), summary))
+    problematic_resources = []
+    for (i, (resource, tpls)) in enumerate(results):
+        if i == 0:
+            print("Checkers:", file=out)
+            for (checker_num, (checker, _, _)) in enumerate(tpls):
+                print("\t[%d]\t%s" % (checker_num, checker), file=out)
+            print(file=out)
+        out.flush()
+        num_errors = sum(
+            1 for (checker, attempted, error) in tpls
+            if attempted and error)
+        num_attempted = sum(
+            1 for (checker, attempted, error) in tpls if attempted)
+        
+        if not args.quiet:
+            summary = " ".join(
+                "--" if not attempted else (
+                    "ER" if error else "OK")
+                for (_, attempted, error) in tpls)
+            print("[%3d / %3d] %s %s" % (
+                i + 1, len(rc), resource.name.ljust(55), summary), file=out)
 
-                if args.verbose or num_attempted == 0 or num_errors > 0:
-                    details_lines = []
-                    for (check_num,
-                            (_, attempted, error)) in enumerate(tpls):
-                        if attempted:
-                            message = error if error else "OK"
-                        else:
-                            message = "UNMATCHED"
-                        if args.verbose or (attempted and error):
-                            details_lines.extend(
-                                textwrap.wrap(
-                                    "[%d] %s" % (check_num, message),
-                                    args.width,
-                                    initial_indent=' ' * 4,
-                                    subsequent_indent=' ' * 8))
-                    details = "\n".join(details_lines)
-                    if details:
-                        print(details)
-                        print()
+            if args.verbose or num_attempted == 0 or num_errors > 0:
+                details_lines = []
+                for (check_num,
+                        (_, attempted, error)) in enumerate(tpls):
+                    if attempted:
+                        message = error if error else "OK"
+                    else:
+                        message = "UNMATCHED"
+                    if args.verbose or (attempted and error):
+                        details_lines.extend(
+                            textwrap.wrap(
+                                "[%d] %s" % (check_num, message),
+                                args.width,
+                                initial_indent=' ' * 4,
+                                subsequent_indent=' ' * 8))
+                details = "\n".join(details_lines)
+                if details:
+                    print(details, file=out)
+                    print(file=out)
 
-            if num_attempted == 0 or num_errors > 0:
-                problematic_resources.append(
-                    (resource,
-                        [(checker, error) for (checker, attempted, error)
-                        in tpls
-                        if attempted and error]))
+        if num_attempted == 0 or num_errors > 0:
+            problematic_resources.append(
+                (resource,
+                    [(checker, error) for (checker, attempted, error)
+                    in tpls
+                    if attempted and error]))
 
-        print()
-        if problematic_resources:
-            print("PROBLEMS (%d failed / %d total):" % (
-                len(problematic_resources),
-                len(rc)))
-            for (resource, pairs) in problematic_resources:
-                if not pairs:
-                    print("UNMATCHED:")
-                print(('{:-^%d}' % args.width).format(resource.name))
-                print(resource)
-                print()
-                for (checker, error) in pairs:
-                    print("\t%s" % checker)
-                    print("\t---> %s" % error)
-                    print()
-        else:
-            print("ALL OK")
+    print(file=out)
+    if problematic_resources:
+        print("PROBLEMS (%d failed / %d total):" % (
+            len(problematic_resources),
+            len(rc)), file=out)
+        for (resource, pairs) in problematic_resources:
+            if not pairs:
+                print("UNMATCHED:", file=out)
+            print(('{:-^%d}' % args.width).format(resource.name), file=out)
+            print(resource, file=out)
+            print(file=out)
+            for (checker, error) in pairs:
+                print("\t%s" % checker, file=out)
+                print("\t---> %s" % error, file=out)
+                print(file=out)
+    else:
+        print("ALL OK", file=out)
 
-    except resource_collection.NoCheckers:
+def run(argv=sys.argv[1:]):
+    args = parser.parse_args(argv)
+    output = util.run_in_daemon("check", args)
+    if output is None:
+        rc = util.load_from_args(args)
+
+    try:
+        if output is None:
+            write_output(rc, args, sys.stdout)
+        else:
+            for text in output:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+    except hooks.NoCheckers:
         stderr("No checkers. Use the --checker argument to specify a checker.")
-    
\ No newline at end of file
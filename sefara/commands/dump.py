@@ -33,20 +33,32 @@ the output.
 from __future__ import absolute_import, print_function
 
 import argparse
+import os
 import sys
 import six
 
 from . import util
 from .. import resource
+from ..compression import COMPRESSIONS, from_extension
 
 parser = argparse.ArgumentParser(
     description=__doc__,
     formatter_class=argparse.RawDescriptionHelpFormatter,
     parents=[util.load_collection_parser])
-parser.add_argument("--format", choices=('python', 'json'),
-    help="Output format")
+parser.add_argument("--format",
+    choices=("python", "json", "parquet", "feather"),
+    help="Output format. Default: guessed from the --out filename, or "
+    "python. Parquet and feather require the pyarrow package.")
 parser.add_argument("--out",
-    help="Output file. Default: stdout.")
+    help="Output file. Default: stdout. If the name ends in .gz, .xz or .zst, "
+    "the output is compressed.")
+parser.add_argument("--compression",
+    help="Compress the output: one of %s. Default: guessed from the --out "
+    "filename. For parquet and feather, the codec to use, e.g. zstd."
+    % ", ".join(sorted(COMPRESSIONS)))
+parser.add_argument("--compression-level", type=int,
+    help="Compression level, from 1 (fastest) to 9 (smallest), or up to 22 "
+    "for zstd.")
 parser.add_argument("--indent", type=int, default=4,
     help="Number of spaces for indentation in output. Default: %(default)d.")
 parser.add_argument("--code", nargs="+",
@@ -54,15 +66,65 @@ parser.add_argument("--code", nargs="+",
     "defined become attributes of each resource. Any number of arguments "
     "may be specified, each giving one line of code.")
 
+def text_format(args):
+    """
+    Return the output format given by the parsed arguments if it is Python
+    or JSON without compression, otherwise None.
+    """
+    if args.compression or (args.out and from_extension(args.out)):
+        return None
+    format = args.format
+    if format is None and args.out:
+        format = {".json": "json", ".py": "python"}.get(
+            os.path.splitext(args.out)[1])
+    elif format is None:
+        format = "python"
+    return format if format in ("python", "json") else None
+
+def write_output(rc, args, fd):
+    """
+    Write a collection in the Python or JSON format given by the parsed
+    arguments (see `text_format`).
+    """
+    if text_format(args) == "json":
+        pieces = rc.iter_json(indent=args.indent)
+    else:
+        pieces = rc.iter_python(indent=args.indent, command=args.command_line)
+    for piece in pieces:
+        fd.write(piece)
+
 def run(argv=sys.argv[1:]):
     args = parser.parse_args(argv)
+    args.command_line = list(sys.argv)
+
+    # Code mutates the resources, so it can't be run on a collection kept by
+    # the daemon.
+    output = None
+    if not args.code and text_format(args) is not None:
+        output = util.run_in_daemon("dump", args)
+    if output is not None:
+        fd = open(args.out, "w") if args.out else sys.stdout
+        try:
+            for text in output:
+                fd.write(text)
+        finally:
+            if args.out:
+                fd.close()
+        return
+
     rc = util.load_from_args(args)
 
     if args.code:
-        code = "\n".join(args.code)
+        code = resource.EXPRESSION_CACHE.compile(
+            "\n".join(args.code), mode="exec")
         environment = dict(resource.STANDARD_EVALUATION_ENVIRONMENT)
         for r in rc:
             environment["resource"] = r
             six.exec_(code, environment, r)
 
-    rc.write(args.out, args.format, indent=args.indent)
+    rc.write(
+        args.out,
+        args.format,
+        indent=args.indent,
+        compression=args.compression,
+        compression_level=args.compression_level)
@@ -33,6 +33,12 @@ def run(argv=sys.argv[1:]):
     variables = [
         environment.TRANSFORM_ENVIRONMENT_VARIABLE,
         environment.CHECKER_ENVIRONMENT_VARIABLE,
+        environment.CACHE_DIR_ENVIRONMENT_VARIABLE,
+        environment.CACHE_MAX_BYTES_ENVIRONMENT_VARIABLE,
+        environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE,
+        environment.HTTP_TTL_ENVIRONMENT_VARIABLE,
+        environment.OFFLINE_ENVIRONMENT_VARIABLE,
+        environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE,
     ]
 
     for variable in variables:
@@ -40,18 +40,21 @@ from __future__ import absolute_import, print_function
 
 import argparse
 import csv
+import shutil
 import sys
+import tempfile
 
-from future.utils import raise_
+import six
 
 from . import util
 from .. import resource
+from ..resource_collection import labeled_expressions
 from ..util import shell_quote, move_to_front
 
 parser = argparse.ArgumentParser(
     description=__doc__,
     formatter_class=argparse.RawDescriptionHelpFormatter,
-    parents=[util.load_collection_parser])
+    parents=[util.single_collection_parser])
 parser.add_argument("field", nargs="*",
     help="Expressions to select from each resource. Specify one or more "
     "times.")
@@ -88,57 +91,96 @@ def stringify(value):
         return " ".join(sorted(value))
     return str(value)
 
-def run(argv=sys.argv[1:]):
-    args = parser.parse_args(argv)
-
-    rc = util.load_from_args(args)
+def write_args(fd, labels, rows):
+    """
+    Write rows in "args" format: each label followed by its value in every
+    row. The first column is written as the rows are generated, and the
+    others are spooled to temporary files, then copied.
+    """
+    spools = [tempfile.TemporaryFile(mode="w+") for _ in labels[1:]]
+    try:
+        if labels:
+            fd.write(" ")
+            fd.write(shell_quote("--%s" % labels[0]))
+        for row in rows:
+            for (out, value) in zip([fd] + spools, row):
+                out.write(" ")
+                out.write(shell_quote(stringify(value)))
+        for (label, spool) in zip(labels[1:], spools):
+            fd.write(" ")
+            fd.write(shell_quote("--%s" % label))
+            spool.seek(0)
+            shutil.copyfileobj(spool, fd)
+        fd.write("\n")
+    finally:
+        for spool in spools:
+            spool.close()
 
+def write_output(rc, args, fd):
+    """
+    Write the fields selected by the parsed arguments from a collection.
+    """
     if args.field:
         fields = args.field
     else:
         fields = sorted(rc.attributes)
         move_to_front(fields, "name", "tags")
 
+    labels_and_expressions = labeled_expressions(fields)
+    labels = [label for (label, _) in labels_and_expressions]
+
+    # Rows are written as they are evaluated, so memory use does not depend
+    # on the size of the collection.
+    rows = rc.iter_select(*labels_and_expressions, if_error=args.if_error)
+    if args.format == "csv":
+        writer = csv.writer(fd, lineterminator='\n')
+        if (args.header == 'on' or
+                (args.header is None and len(fields) > 1)):
+            header = list(labels)
+            header[0] = "# " + header[0]
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow([stringify(x) for x in row])
+    elif args.format == "raw":
+        for row in rows:
+            print("".join([stringify(x) for x in row]), file=fd)
+    elif args.format == "args":
+        write_args(fd, labels, rows)
+    elif args.format == "args-repeated":
+        for row in rows:
+            for (field_name, value) in zip(labels, row):
+                fd.write(" ")
+                fd.write(shell_quote("--%s" % field_name))
+                fd.write(" ")
+                fd.write(shell_quote(stringify(value)))
+        fd.write("\n")
+    else:
+        raise ValueError("Unknown format: %s" % args.format)
+
+def run(argv=sys.argv[1:]):
+    args = parser.parse_args(argv)
+
+    output = util.run_in_daemon("select", args)
+    if output is None:
+        rc = util.load_from_args(args)
+
     fd = open(args.out, "w") if args.out else sys.stdout
     try:
-        result = rc.select(*fields, if_error=args.if_error)
-        if args.format == "csv":
-            writer = csv.writer(fd, lineterminator='\n')
-            if (args.header == 'on' or
-                    (args.header is None and len(fields) > 1)):
-                header = list(result.columns)
-                header[0] = "# " + header[0]
-                writer.writerow(header)
-            for (_, row) in result.iterrows():
-                writer.writerow([stringify(x) for x in row])
-        elif args.format == "raw":
-            for (_, row) in result.iterrows():
-                print("".join([stringify(x) for x in row]), file=fd)
-        elif args.format == "args":
-            for (i, label) in enumerate(result.columns):
-                fd.write(" ")
-                fd.write(shell_quote("--%s" % label))
-                for (_, row) in result.iterrows():
-                    fd.write(" ")
-                    fd.write(shell_quote(stringify(row[i])))
-            fd.write("\n")
-        elif args.format == "args-repeated":
-            for (_, row) in result.iterrows():
-                for (field_name, value) in zip(result.columns, row):
-                    fd.write(" ")
-                    fd.write(shell_quote("--%s" % field_name))
-                    fd.write(" ")
-                    fd.write(shell_quote(stringify(value)))
-            fd.write("\n")
+        if output is None:
+            write_output(rc, args, fd)
         else:
-            raise ValueError("Unknown format: %s" % format)
+            for text in output:
+                fd.write(text)
 
     except Exception as e:
         extra = """
         To skip errors like this, pass --if-error skip or --if-error none
         """
         traceback = sys.exc_info()[2]
-        raise_(ValueError, str(e) + "\n\n" + extra.strip(), traceback)
+        six.reraise(
+            ValueError,
+            ValueError(str(e) + "\n\n" + extra.strip()),
+            traceback)
 
     finally:
         fd.close()
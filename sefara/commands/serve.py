@@ -0,0 +1,80 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Run a daemon that keeps resource collections loaded, so that sefara-select,
+sefara-dump and sefara-check don't need to load them again each time they run.
+
+Start it in the directory you run the other tools from, with the same sefara
+environment variables:
+
+    sefara-serve &
+
+While it is running, the tools send their arguments to it instead of loading
+the collection themselves. It loads a collection again when the collection
+file, or a transform run while loading it, changes. Requests from another
+directory, or with different sefara environment variables, are not sent to
+the daemon, and the tools load the collection themselves.
+
+The daemon listens on a Unix socket given by the SEFARA_SERVE_SOCKET
+environment variable, or serve.sock in the cache directory.
+'''
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import sys
+
+from .. import serving
+from .util import print_stderr as stderr
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--socket",
+    help="Socket path. Default: %s." % serving.socket_path())
+parser.add_argument("--max-collections", type=int,
+    default=serving.DEFAULT_MAX_COLLECTIONS,
+    help="Number of loaded collections to keep. Default: %(default)d.")
+parser.add_argument("--status", action="store_true", default=False,
+    help="Print the collections loaded by the running daemon, and exit.")
+parser.add_argument("--stop", action="store_true", default=False,
+    help="Stop the running daemon, and exit.")
+
+def run(argv=sys.argv[1:]):
+    args = parser.parse_args(argv)
+
+    if args.status or args.stop:
+        connection = serving.request(
+            {"command": "stop" if args.stop else "ping"}, path=args.socket)
+        if connection is None:
+            stderr("No sefara-serve daemon is running.")
+            sys.exit(1)
+        try:
+            reply = next(connection.replies())
+        finally:
+            connection.close()
+        if args.status:
+            for (sources, filters, length) in reply["loaded"]:
+                print("%s%s: %d resources" % (
+                    " ".join(sources),
+                    "".join(" --filter %s" % f for f in filters),
+                    length))
+        return
+
+    server = serving.Server(args.socket, max_collections=args.max_collections)
+    stderr("Listening on %s" % server.path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -14,36 +14,115 @@
 
 from __future__ import absolute_import, print_function
 
-import sys
 import argparse
+import glob
+import sys
+
+from .. import load, load_many, hooks
+from ..loading import CONFLICT_POLICIES
+
+def _load_collection_parser(multiple=True):
+    parser = argparse.ArgumentParser(add_help=False)
+    if multiple:
+        parser.add_argument("collections",
+            nargs="+",
+            metavar="collection",
+            help="Resource collection path, glob pattern or URL. Specify '-' "
+            "for stdin. If more than one collection is given (or a pattern "
+            "matches more than one file), they are merged.")
+    else:
+        # For commands taking other positional arguments after the
+        # collection. More collections are given with --merge.
+        parser.add_argument("collections",
+            nargs=1,
+            metavar="collection",
+            help="Resource collection path, glob pattern or URL. Specify '-' "
+            "for stdin.")
+        parser.add_argument("--merge",
+            action="append",
+            default=[],
+            metavar="COLLECTION",
+            help="Another collection (path, glob pattern or URL) to merge "
+            "in. Can be specified multiple times.")
+    parser.add_argument("-f", "--filter",
+        action="append",
+        default=[],
+        help="Filter expression. Can be specified multiple times; "
+        "the result is the intersection of the filters.")
+    parser.add_argument("--transform", action="append", default=[],
+        help="Path to Python file with transform function to run. Can be "
+        "specified multiple times.")
+    parser.add_argument("--no-environment-transforms",
+        dest="environment_transforms",
+        action="store_false",
+        default=True,
+        help="Do not run transforms configured in environment variables.")
+    parser.add_argument("--load-jobs", type=int, default=1,
+        help="When merging collections, number of collections to load at "
+        "once. Default: %(default)d.")
+    parser.add_argument("--on-conflict",
+        choices=CONFLICT_POLICIES,
+        default="error",
+        help="When merging collections, how to handle a resource with the "
+        "same name as one from an earlier collection. Default: %(default)s.")
+    parser.add_argument("--no-daemon",
+        dest="daemon",
+        action="store_false",
+        default=True,
+        help="Load the collection in this process, even if a sefara-serve "
+        "daemon is running.")
+    return parser
 
-from .. import load, hooks
-
-load_collection_parser = argparse.ArgumentParser(add_help=False)
-load_collection_parser.add_argument("collection",
-    help="Resource collection path or URL. Specify '-' for stdin.")
-load_collection_parser.add_argument("-f", "--filter",
-    action="append",
-    default=[],
-    help="Filter expression. Can be specified multiple times; "
-    "the result is the intersection of the filters.")
-load_collection_parser.add_argument("--transform", action="append", default=[],
-    help="Path to Python file with transform function to run. Can be "
-    "specified multiple times.")
-load_collection_parser.add_argument("--no-environment-transforms",
-    dest="environment_transforms",
-    action="store_false",
-    default=True,
-    help="Do not run transforms configured in environment variables.")
+load_collection_parser = _load_collection_parser()
+
+single_collection_parser = _load_collection_parser(multiple=False)
 
 def load_from_args(args):
-    rc = load(
-        args.collection, environment_transforms=args.environment_transforms)
-    for value in args.filter:
-        rc = rc.filter(value)
+    sources = args.collections + getattr(args, "merge", [])
+    if len(sources) > 1 or any(glob.has_magic(s) for s in sources):
+        # Filters apply to the merged collection.
+        rc = _filtered(
+            load_many(
+                sources,
+                jobs=args.load_jobs,
+                on_conflict=args.on_conflict,
+                environment_transforms=args.environment_transforms),
+            args.filter)
+    elif args.environment_transforms and hooks.environment_transforms():
+        # Environment transforms run before the filters given here, so the
+        # filters can't be applied while loading.
+        rc = _filtered(load(sources[0]), args.filter)
+    else:
+        rc = load(
+            sources[0],
+            filters=args.filter,
+            environment_transforms=args.environment_transforms)
     for transform in args.transform:
         hooks.transform(rc, transform)
     return rc
 
+def run_in_daemon(command, args):
+    """
+    Run a command in the sefara-serve daemon, if one is running and can run
+    it (see the `serving` module).
+
+    Returns None if the command should be run in this process. Otherwise,
+    returns a generator of strings giving the command's output.
+    """
+    # The daemon can't read our stdin.
+    sources = args.collections + getattr(args, "merge", [])
+    if not args.daemon or "-" in sources:
+        return None
+    from .. import serving
+    return serving.run_command(command, dict(vars(args)))
+
+def _filtered(rc, filters):
+    if not filters:
+        return rc
+    plan = rc.lazy()
+    for value in filters:
+        plan = plan.filter(value)
+    return plan.collect()
+
 def print_stderr(s=''):
     print(s, file=sys.stderr)
@@ -0,0 +1,358 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A memory-efficient alternative to `Resource` for large collections.
+
+A `Resource` carries an `AttrMap` wrapper with its own ``__dict__``, an inner
+dict, and a `Tags` set. A `CompactResource` instead stores:
+
+    - its attribute names as a shared `KeyLayout`: every resource with the
+      same attribute names (in the same order) points to the same layout
+      object,
+    - its attribute values in a list, in layout order, and
+    - its tags as a tuple of tag strings. Resources loaded together share a
+      `TagVocabulary`, through which each distinct tag, and each distinct
+      set of tags, is stored only once.
+
+It supports the same item and attribute access as `Resource`, and
+``isinstance(x, Resource)`` is True for compact resources.
+"""
+
+from __future__ import absolute_import
+
+import weakref
+
+try:
+    from collections.abc import Mapping, MutableMapping, Sequence
+except ImportError:  # py2
+    from collections import Mapping, MutableMapping, Sequence
+
+import six
+from attrdict import AttrMap
+
+from . import resource as resource_module
+from .resource import Resource, Tags, MISSING, check_valid_tag
+
+class KeyLayout(object):
+    """
+    An ordered tuple of attribute names, shared by all compact resources
+    having those attributes.
+
+    Layouts form a tree: adding an attribute to a resource moves it to a
+    child layout, which is created once and then reused by every resource
+    that makes the same transition.
+    """
+    __slots__ = ("keys", "index", "_transitions")
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = dict((key, i) for (i, key) in enumerate(keys))
+        self._transitions = {}
+
+    def with_key(self, key):
+        """
+        Return the layout given by appending ``key`` to this layout.
+        """
+        try:
+            return self._transitions[key]
+        except KeyError:
+            return self._transitions.setdefault(
+                key, KeyLayout(self.keys + (key,)))
+
+    def without_key(self, key):
+        """
+        Return the layout given by removing ``key`` from this layout.
+        """
+        layout = EMPTY_LAYOUT
+        for other in self.keys:
+            if other != key:
+                layout = layout.with_key(other)
+        return layout
+
+EMPTY_LAYOUT = KeyLayout(())
+
+def _encode_tags(tags):
+    """
+    Return the tuple of tags stored by a compact resource without a
+    vocabulary.
+    """
+    tags = set(tags)
+    for tag in tags:
+        check_valid_tag(tag)
+    return tuple(sorted(tags))
+
+class TagVocabulary(object):
+    """
+    The tags used by a group of compact resources, typically those loaded
+    together into one collection.
+
+    Each distinct tag, and each distinct tuple of tags, is stored once and
+    shared by every resource using it. Each tag is validated once, when it is
+    first added to the vocabulary.
+    """
+    def __init__(self):
+        self.tags = {}
+        self._tuples = {}
+
+    def intern(self, tag, validate=True):
+        """
+        Return the vocabulary's copy of ``tag``, adding it if needed.
+        """
+        try:
+            return self.tags[tag]
+        except KeyError:
+            pass
+        if validate:
+            check_valid_tag(tag)
+        return self.tags.setdefault(tag, tag)
+
+    def encode(self, tags, validate=True):
+        """
+        Return the tuple of tags stored by a resource for an iterable of
+        tags.
+        """
+        intern = self.intern
+        result = tuple(sorted(set(
+            intern(tag, validate=validate) for tag in tags)))
+        return self._tuples.setdefault(result, result)
+
+    def __getstate__(self):
+        return list(self.tags)
+
+    def __setstate__(self, tags):
+        self.tags = dict((tag, tag) for tag in tags)
+        self._tuples = {}
+
+class CompactResource(MutableMapping):
+    """
+    A `Resource` using a compact, slotted representation.
+
+    Construct it the same way as a `Resource`. The value of the ``tags``
+    attribute is a `Tags` set; modifying it in place updates the resource.
+    While a `Tags` instance obtained from a resource is in use, accessing
+    ``tags`` again returns the same instance.
+    """
+    __slots__ = (
+        "_layout",
+        "_values",
+        "_tag_tuple",
+        "_tags_reference",
+        "_vocabulary",
+        "_owners",
+        "__weakref__")
+
+    def __init__(self, name=None, **fields):
+        """
+        Construct a resource with the specified attributes.
+
+        See `Resource` for the parameters.
+        """
+        self._initialize(fields, name, None)
+
+    @classmethod
+    def _from_fields(cls, fields, name=None, vocabulary=None):
+        """
+        Construct a compact resource from a dict of fields, which is not
+        modified. Tags are stored through the given `TagVocabulary`, if any.
+        """
+        result = cls.__new__(cls)
+        result._initialize(dict(fields), name, vocabulary)
+        return result
+
+    def _initialize(self, fields, name, vocabulary):
+        # The key order is the same as a Resource constructed with the same
+        # arguments.
+        if name is not None:
+            fields["name"] = name
+        if "name" not in fields:
+            fields["name"] = resource_module._generated_name()
+        tags = fields.get("tags", [])
+        fields["tags"] = None
+        layout = EMPTY_LAYOUT
+        for key in fields:
+            layout = layout.with_key(key)
+        setattr_ = object.__setattr__
+        setattr_(self, "_layout", layout)
+        setattr_(self, "_values", list(fields.values()))
+        setattr_(self, "_vocabulary", vocabulary)
+        setattr_(self, "_tag_tuple", self._encode_tags(tags))
+        setattr_(self, "_tags_reference", None)
+        setattr_(self, "_owners", [])
+
+    def __reduce__(self):
+        fields = dict(self.items())
+        fields["tags"] = list(fields["tags"]) if "tags" in fields else None
+        return (_unpickle_compact_resource, (fields, self._vocabulary))
+
+    # Mapping interface.
+
+    def __getitem__(self, key):
+        i = self._layout.index[key]
+        if key == "tags":
+            return self._tags()
+        return self._values[i]
+
+    def __setitem__(self, key, value):
+        old_value = self.get(key, MISSING)
+        if key == "tags":
+            tag_tuple = self._encode_tags(value)
+            self._detach_tags()
+            object.__setattr__(self, "_tag_tuple", tag_tuple)
+            value = None
+        layout = self._layout
+        i = layout.index.get(key)
+        if i is None:
+            object.__setattr__(self, "_layout", layout.with_key(key))
+            self._values.append(value)
+        else:
+            self._values[i] = value
+        self._notify_owners(
+            "_resource_updated", key, old_value, self[key])
+
+    def __delitem__(self, key):
+        old_value = self[key]
+        i = self._layout.index[key]
+        object.__setattr__(self, "_layout", self._layout.without_key(key))
+        del self._values[i]
+        if key == "tags":
+            self._detach_tags()
+            object.__setattr__(self, "_tag_tuple", ())
+        self._notify_owners("_resource_updated", key, old_value, MISSING)
+
+    def __contains__(self, key):
+        return key in self._layout.index
+
+    def __iter__(self):
+        return iter(self._layout.keys)
+
+    def __len__(self):
+        return len(self._layout.keys)
+
+    def get(self, key, default=None):
+        i = self._layout.index.get(key)
+        if i is None:
+            return default
+        if key == "tags":
+            return self._tags()
+        return self._values[i]
+
+    # Attribute access, following `AttrMap`.
+
+    def __getattr__(self, key):
+        if (key.startswith("_") or
+                key not in self or
+                not Resource._valid_name(key)):
+            raise AttributeError(
+                "'%s' instance has no attribute '%s'" % (
+                    self.__class__.__name__, key))
+        return self._build(self[key])
+
+    def __setattr__(self, key, value):
+        if Resource._valid_name(key):
+            self[key] = value
+        else:
+            raise TypeError(
+                "'%s' does not allow attribute creation." %
+                self.__class__.__name__)
+
+    def __delattr__(self, key):
+        if Resource._valid_name(key):
+            del self[key]
+        else:
+            raise TypeError(
+                "'%s' does not allow attribute deletion." %
+                self.__class__.__name__)
+
+    def __call__(self, key):
+        if key not in self:
+            raise AttributeError(
+                "'%s' instance has no attribute '%s'" % (
+                    self.__class__.__name__, key))
+        return self._build(self[key])
+
+    @classmethod
+    def _build(cls, obj):
+        if isinstance(obj, Mapping):
+            return AttrMap(obj)
+        if (isinstance(obj, Sequence) and
+                not isinstance(obj, (six.string_types, six.binary_type))):
+            return tuple(cls._build(element) for element in obj)
+        return obj
+
+    # Tags.
+
+    def _encode_tags(self, tags):
+        if self._vocabulary is None:
+            return _encode_tags(tags)
+        return self._vocabulary.encode(tags)
+
+    def _tags(self):
+        """
+        Return the `Tags` instance for this resource: the one already in
+        use, if any, otherwise a new one.
+        """
+        reference = self._tags_reference
+        result = reference() if reference is not None else None
+        if result is None:
+            result = Tags.__new__(Tags)
+            set.__init__(result, self._tag_tuple)
+            result._owner = self
+            object.__setattr__(self, "_tags_reference", weakref.ref(result))
+        return result
+
+    def _detach_tags(self):
+        """
+        Stop the `Tags` instance in use, if any, from updating this resource,
+        as when the tags attribute is replaced.
+        """
+        reference = self._tags_reference
+        tags = reference() if reference is not None else None
+        if tags is not None:
+            tags._owner = None
+        object.__setattr__(self, "_tags_reference", None)
+
+    def _tags_changed(self, added, removed):
+        tags = set(self._tag_tuple)
+        tags.update(added)
+        tags.difference_update(removed)
+        # The tags were validated by the Tags instance.
+        if self._vocabulary is None:
+            tag_tuple = tuple(sorted(tags))
+        else:
+            tag_tuple = tuple(sorted(
+                self._vocabulary.intern(tag, validate=False) for tag in tags))
+        object.__setattr__(self, "_tag_tuple", tag_tuple)
+        self._notify_owners("_resource_tags_updated", added, removed)
+
+    # Shared with Resource.
+
+    _add_owner = Resource._add_owner
+    _remove_owner = Resource._remove_owner
+    _notify_owners = Resource._notify_owners
+    evaluate = Resource.evaluate
+    to_plain_types = Resource.to_plain_types
+    __str__ = Resource.__str__
+    __repr__ = Resource.__repr__
+    RAISE = Resource.RAISE
+
+Resource.register(CompactResource)
+
+def _unpickle_compact_resource(fields, vocabulary):
+    if fields["tags"] is None:
+        del fields["tags"]
+        result = CompactResource._from_fields(fields, vocabulary=vocabulary)
+        del result["tags"]
+        return result
+    return CompactResource._from_fields(fields, vocabulary=vocabulary)
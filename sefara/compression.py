@@ -0,0 +1,151 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compressed collection files.
+
+Collections (in either format) can be compressed with gzip (".gz"), xz
+(".xz") or, if the ``zstandard`` package is installed, Zstandard (".zst").
+The compression is detected from the filename extension or from the first
+bytes of the data.
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import io
+
+# name -> (extension, magic bytes)
+COMPRESSIONS = {
+    "gzip": (".gz", b"\x1f\x8b"),
+    "xz": (".xz", b"\xfd7zXZ\x00"),
+    "zstd": (".zst", b"\x28\xb5\x2f\xfd"),
+}
+
+DEFAULT_LEVELS = {
+    "gzip": 6,
+    "xz": 6,
+    "zstd": 3,
+}
+
+def from_extension(filename):
+    """
+    Return the compression given by a filename's extension, or None.
+    """
+    for (name, (extension, _)) in COMPRESSIONS.items():
+        if filename.endswith(extension):
+            return name
+    return None
+
+def from_magic(data):
+    """
+    Return the compression identified by the first bytes of some data, or
+    None.
+    """
+    if not isinstance(data, bytes):
+        return None
+    for (name, (_, magic)) in COMPRESSIONS.items():
+        if data.startswith(magic):
+            return name
+    return None
+
+def strip_extension(filename):
+    """
+    Return a filename without any compression extension, so the extension
+    giving the format can be found.
+    """
+    compression = from_extension(filename)
+    if compression is None:
+        return filename
+    return filename[:-len(COMPRESSIONS[compression][0])]
+
+def _lzma():
+    try:
+        import lzma
+    except ImportError:  # py2
+        raise ValueError("xz compression requires Python 3")
+    return lzma
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            "Zstandard compression requires the zstandard package")
+    return zstandard
+
+class _Prefixed(object):
+    """
+    A binary file object giving some bytes already read from another file
+    object, followed by the rest of that file.
+    """
+    def __init__(self, initial, fd):
+        self.initial = initial
+        self.fd = fd
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            (result, self.initial) = (self.initial + self.fd.read(), b"")
+            return result
+        if self.initial:
+            (result, self.initial) = (
+                self.initial[:size], self.initial[size:])
+            if len(result) < size:
+                result += self.fd.read(size - len(result))
+            return result
+        return self.fd.read(size)
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # The caller closes the underlying file.
+        pass
+
+def decompressing_reader(fd, compression, initial=b""):
+    """
+    Return a binary file object giving the decompressed contents of
+    ``initial`` (bytes already read from ``fd``) followed by the rest of
+    ``fd``, decompressed as it is read.
+    """
+    source = _Prefixed(initial, fd)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=source, mode="rb")
+    if compression == "xz":
+        return _lzma().LZMAFile(source, mode="rb")
+    if compression == "zstd":
+        return _zstandard().ZstdDecompressor().stream_reader(source)
+    raise ValueError("Unsupported compression: %s" % compression)
+
+def decompress(data, compression):
+    """
+    Decompress bytes.
+    """
+    return decompressing_reader(io.BytesIO(data), compression).read()
+
+def compressing_writer(fd, compression, level=None):
+    """
+    Return a binary file object that compresses data written to it, and
+    writes it to ``fd``. Closing it does not close ``fd``.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fd, mode="wb", compresslevel=level)
+    if compression == "xz":
+        return _lzma().LZMAFile(fd, mode="wb", preset=level)
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor(level=level).stream_writer(
+            fd, closefd=False)
+    raise ValueError("Unsupported compression: %s" % compression)
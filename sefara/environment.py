@@ -20,3 +20,10 @@ from __future__ import absolute_import
 
 TRANSFORM_ENVIRONMENT_VARIABLE = "SEFARA_TRANSFORM"
 CHECKER_ENVIRONMENT_VARIABLE = "SEFARA_CHECKER"
+CACHE_DIR_ENVIRONMENT_VARIABLE = "SEFARA_CACHE_DIR"
+CACHE_MAX_BYTES_ENVIRONMENT_VARIABLE = "SEFARA_CACHE_MAX_BYTES"
+CACHE_VARIABLES_ENVIRONMENT_VARIABLE = "SEFARA_CACHE_VARIABLES"
+HTTP_TTL_ENVIRONMENT_VARIABLE = "SEFARA_HTTP_TTL"
+OFFLINE_ENVIRONMENT_VARIABLE = "SEFARA_OFFLINE"
+SERVE_SOCKET_ENVIRONMENT_VARIABLE = "SEFARA_SERVE_SOCKET"
+CHDIR_ENVIRONMENT_VARIABLE = "SEFARA_CHDIR"
@@ -21,9 +21,37 @@ normal scripts.
 
 from __future__ import absolute_import
 
+import contextlib
+
+from . import util
 from .resource import Resource
 
-_EXPORTED_RESOURCES = []
+class _Exports(object):
+    """
+    Resources and transforms exported by a collection being loaded.
+    """
+    def __init__(self):
+        self.resources = []
+        self.transforms = []
+
+# Exports made outside of `collecting_exports`.
+_DEFAULT_EXPORTS = _Exports()
+
+_CURRENT_EXPORTS = util.ContextVariable("sefara_exports")
+
+@contextlib.contextmanager
+def collecting_exports():
+    """
+    Context manager giving an object whose ``resources`` and ``transforms``
+    lists receive everything exported in the current thread or asyncio task
+    while it is active. Used by `loads`.
+    """
+    with _CURRENT_EXPORTS.setting(_Exports()) as exports:
+        yield exports
+
+def _current_exports():
+    return _CURRENT_EXPORTS.get() or _DEFAULT_EXPORTS
+
 def export(*args, **kwargs):
     """
     Create and export a Resource with the specified attributes.
@@ -31,7 +59,7 @@ def export(*args, **kwargs):
     All arguments are passed to `Resource`.
     """
     resource = Resource(*args, **kwargs)
-    _EXPORTED_RESOURCES.append(resource)
+    _current_exports().resources.append(resource)
     return resource
 
 def export_resources(resources):
@@ -43,9 +71,8 @@ def export_resources(resources):
     resources : list of `Resource` instances
         Resource instances to be exported.
     """
-    _EXPORTED_RESOURCES.extend(resources)
+    _current_exports().resources.extend(resources)
 
-_TRANSFORMS = []
 def transform_exports(path_or_callable):
     """
     Transform the resources exported by this collection.
@@ -53,7 +80,9 @@ def transform_exports(path_or_callable):
     Parameters
     ----------
     path_or_callable : string or callable
-        Passed to `hooks.transform`; see those docs for details.
+        Passed to `hooks.transform`; see those docs for details. A relative
+        path is relative to the directory of the collection file.
     """
-    _TRANSFORMS.append(path_or_callable)
-    
+    if not hasattr(path_or_callable, '__call__'):
+        path_or_callable = util.resolve_path(path_or_callable)
+    _current_exports().transforms.append(path_or_callable)
@@ -0,0 +1,365 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Fetching collections over HTTP.
+
+`load` uses `fetch` for "http://" and "https://" URLs. Compared to
+``urlopen``, it:
+
+    - reuses connections to the same host (HTTP keep-alive),
+    - asks for gzip compressed responses,
+    - keeps a copy of each response in the cache directory (see the
+      `snapshot` module), and revalidates it with a conditional request
+      (using the ETag and Last-Modified headers), so an unchanged collection
+      is not downloaded again.
+
+A cached response younger than SEFARA_HTTP_TTL seconds (default: 0) is used
+without contacting the server at all. If SEFARA_OFFLINE is set to "1" or
+"true", cached responses are always used, and fetching a URL that is not
+cached is an error.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin
+
+from . import environment, snapshot, util
+
+DEFAULT_TIMEOUT = 60
+
+# Maximum number of idle connections kept for each host.
+MAX_IDLE_CONNECTIONS = 4
+
+MAX_REDIRECTS = 5
+
+USER_AGENT = "sefara"
+
+def default_ttl():
+    """
+    Seconds a cached response is used for without revalidating it.
+    """
+    value = os.environ.get(environment.HTTP_TTL_ENVIRONMENT_VARIABLE)
+    return float(value) if value else 0.0
+
+def offline_mode():
+    """
+    Is offline mode enabled by the environment?
+    """
+    value = os.environ.get(environment.OFFLINE_ENVIRONMENT_VARIABLE, "")
+    return value.strip().lower() in ("1", "true", "yes")
+
+def cache_directory():
+    """
+    The directory where responses are cached.
+    """
+    return os.path.join(snapshot.cache_directory(), "http")
+
+class Response(object):
+    """
+    The body of a successful response, with the headers used for caching.
+
+    Attributes
+    ----------
+    url : string
+        URL requested.
+
+    location : string
+        URL the body was received from, after following any redirects. The
+        ETag and Last-Modified values are from this URL.
+
+    data : bytes
+        Response body, decompressed.
+
+    etag, last_modified : string or None
+        Values of the corresponding response headers.
+
+    fetched : float
+        Time the response was received or last revalidated.
+
+    from_cache : Boolean
+        True if the body came from the cache (because the server replied
+        "304 Not Modified", or was not contacted).
+    """
+    def __init__(
+            self,
+            url,
+            data,
+            etag=None,
+            last_modified=None,
+            fetched=None,
+            from_cache=False,
+            location=None):
+        self.url = url
+        self.location = location or url
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = time.time() if fetched is None else fetched
+        self.from_cache = from_cache
+
+    @property
+    def digest(self):
+        """
+        Hash of the body, as given by `snapshot.data_digest`.
+        """
+        return snapshot.data_digest(self.data)
+
+class ConnectionPool(object):
+    """
+    Idle HTTP connections, by host, for reuse by later requests.
+    """
+    def __init__(self, max_idle=MAX_IDLE_CONNECTIONS, timeout=DEFAULT_TIMEOUT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}  # (scheme, host, port) -> list of connections
+        self._lock = threading.Lock()
+
+    def _new_connection(self, scheme, host, port):
+        if scheme == "https":
+            return http_client.HTTPSConnection(
+                host, port, timeout=self.timeout)
+        return http_client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def request(self, method, url, headers):
+        """
+        Make a request, and return (status, headers, body), where headers is
+        a dict with lowercase keys.
+        """
+        parsed = util.urlparse(url)
+        scheme = parsed.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError("Not an HTTP URL: %s" % url)
+        key = (scheme, parsed.hostname, parsed.port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        headers = dict(headers)
+        headers.setdefault("Host", parsed.netloc)
+        headers.setdefault("User-Agent", USER_AGENT)
+
+        with self._lock:
+            idle = self._idle.get(key)
+            connection = idle.pop() if idle else None
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = self._new_connection(*key)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http_client.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed an idle connection. Retry once on a new
+                # one.
+                (connection, reused) = (None, False)
+                continue
+            break
+
+        response_headers = dict(
+            (name.lower(), value) for (name, value) in response.getheaders())
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+        return (response.status, response_headers, body)
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle = {}
+        for connection in connections:
+            connection.close()
+
+POOL = ConnectionPool()
+
+def _cache_filenames(directory, url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    base = os.path.join(directory, key)
+    return (base + ".json", base + ".body")
+
+def _read_cached(directory, url):
+    (metadata_filename, body_filename) = _cache_filenames(directory, url)
+    try:
+        with open(metadata_filename) as fd:
+            metadata = json.load(fd)
+        with open(body_filename, "rb") as fd:
+            data = fd.read()
+    except (IOError, OSError, ValueError):
+        return None
+    if (metadata.get("url") != url or
+            metadata.get("digest") != snapshot.data_digest(data)):
+        # Another process may be part way through updating the entry.
+        return None
+    return Response(
+        url,
+        data,
+        etag=metadata.get("etag"),
+        last_modified=metadata.get("last_modified"),
+        fetched=metadata.get("fetched"),
+        from_cache=True,
+        location=metadata.get("location"))
+
+def _write_atomically(directory, filename, data):
+    (descriptor, temporary_filename) = tempfile.mkstemp(
+        dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as fd:
+            fd.write(data)
+        getattr(os, "replace", os.rename)(temporary_filename, filename)
+    except BaseException:
+        os.unlink(temporary_filename)
+        raise
+
+def _write_cached(directory, response, write_body=True):
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        # Caching is best effort, e.g. the directory may be read only.
+        return
+    (metadata_filename, body_filename) = _cache_filenames(
+        directory, response.url)
+    try:
+        if write_body:
+            _write_atomically(directory, body_filename, response.data)
+    except (IOError, OSError):
+        return
+    metadata = {
+        "url": response.url,
+        "location": response.location,
+        "etag": response.etag,
+        "last_modified": response.last_modified,
+        "fetched": response.fetched,
+        "digest": response.digest,
+    }
+    try:
+        _write_atomically(
+            directory,
+            metadata_filename,
+            json.dumps(metadata).encode("utf-8"))
+    except (IOError, OSError):
+        pass
+
+def fetch(
+        url,
+        ttl=None,
+        offline=None,
+        directory=None,
+        pool=None):
+    """
+    Fetch a URL, using and updating the response cache.
+
+    Parameters
+    ----------
+    url : string
+        HTTP or HTTPS URL. Any fragment is ignored.
+
+    ttl : float [optional]
+        Use a cached response without revalidating it if it was fetched or
+        revalidated less than this many seconds ago. Default: the
+        SEFARA_HTTP_TTL environment variable, or 0.
+
+    offline : Boolean [optional]
+        If True, use the cached response regardless of its age, and never
+        contact the server. Default: the SEFARA_OFFLINE environment
+        variable.
+
+    directory : string [optional]
+        Cache directory. Default: see `cache_directory`.
+
+    pool : `ConnectionPool` [optional]
+        Pool to make requests with. Default: a pool shared by the process.
+
+    Returns
+    ----------
+    `Response` instance. Raises IOError if the server replies with an error,
+    or in offline mode if the URL is not cached.
+    """
+    url = util.urlparse(url)._replace(fragment="").geturl()
+    if ttl is None:
+        ttl = default_ttl()
+    if offline is None:
+        offline = offline_mode()
+    directory = directory or cache_directory()
+    pool = pool or POOL
+
+    cached = _read_cached(directory, url)
+    if cached is not None and (
+            offline or time.time() - cached.fetched < ttl):
+        return cached
+    if offline:
+        raise IOError("Offline, and %s is not cached" % url)
+
+    location = url
+    for _ in range(MAX_REDIRECTS + 1):
+        headers = {"Accept-Encoding": "gzip"}
+        # The cached validators only apply to the URL that issued them.
+        if cached is not None and location == cached.location:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        (status, response_headers, body) = pool.request(
+            "GET", location, headers)
+        if status in (301, 302, 303, 307, 308) and (
+                "location" in response_headers):
+            location = urljoin(location, response_headers["location"])
+            continue
+        break
+    else:
+        raise IOError("Too many redirects fetching %s" % url)
+
+    no_store = "no-store" in response_headers.get("cache-control", "")
+    if status == 304 and cached is not None:
+        cached.fetched = time.time()
+        if not no_store:
+            _write_cached(directory, cached, write_body=False)
+        return cached
+    if status != 200:
+        raise IOError("HTTP error %d fetching %s" % (status, url))
+
+    if response_headers.get("content-encoding", "").lower() == "gzip":
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    response = Response(
+        url,
+        body,
+        etag=response_headers.get("etag"),
+        last_modified=response_headers.get("last-modified"),
+        location=location)
+    if not no_store:
+        _write_cached(directory, response)
+    return response
@@ -19,9 +19,17 @@ routines on Sefara resources.
 
 from __future__ import absolute_import
 
+import collections
+import functools
 import os
-from . import environment
-from .util import exec_in_directory
+import threading
+
+from . import check_cache, environment, snapshot
+from .util import exec_in_directory, resolve_path
+
+# Prefix of hook names referring to checkers in the `checkers` module, such as
+# "builtin:path", rather than to Python files.
+BUILTIN_PREFIX = "builtin:"
 
 class NoCheckers(Exception):
     pass
@@ -35,13 +43,19 @@ def transform_from_environment(collection):
     See the `environment` module for the definition of the environment
     variable used here.
     """
-    transforms = os.environ.get(
-        environment.TRANSFORM_ENVIRONMENT_VARIABLE, "").split(":")
+    for t in environment_transforms():
+        transform(collection, t)
 
-    for t in transforms:
-        t = t.strip()
-        if t:
-            transform(collection, t)
+def environment_transforms():
+    """
+    Return the list of transform paths configured in the environment.
+    """
+    return [
+        t.strip()
+        for t in os.environ.get(
+            environment.TRANSFORM_ENVIRONMENT_VARIABLE, "").split(":")
+        if t.strip()
+    ]
 
 def transform(collection, path_or_callable, name='transform', *args, **kwargs):
     """
@@ -74,7 +88,14 @@ def transform(collection, path_or_callable, name='transform', *args, **kwargs):
     """
     run_hook(collection, path_or_callable, name, *args, **kwargs)
 
-def check(collection, checkers=None, include_environment_checkers=True):
+def check(
+        collection,
+        checkers=None,
+        include_environment_checkers=True,
+        jobs=1,
+        executor="thread",
+        chunk_size=None,
+        cache=None):
     '''
     Run "checkers", either specified as an argument or using environment
     variables, on the resource collection.
@@ -89,6 +110,9 @@ def check(collection, checkers=None, include_environment_checkers=True):
         
         If tuples, the elements are ``(path, name, args, kwargs)``.
 
+        Strings of the form "builtin:<name>" give checkers that ship with
+        sefara, for example "builtin:path". See the `checkers` module.
+
         Like transforms, checkers are called with this ResourceCollection
         instance as an argument. Unlike transforms, checkers should NOT
         mutate the resources. They are expected to return a list or
@@ -117,6 +141,34 @@ def check(collection, checkers=None, include_environment_checkers=True):
         See the `environment` module for the definition of the environment
         variable used here.
 
+    jobs : int [optional, default: 1]
+        Number of threads or processes to run checkers in. If greater than 1,
+        the collection is split into chunks of consecutive resources, and
+        the checkers are run on each chunk (as a `ResourceCollection`)
+        separately. Checkers that need to see the whole collection at once
+        should only be used with ``jobs=1``.
+
+        Results are still generated in collection order. At most ``2 * jobs``
+        chunks are checked or buffered at a time.
+
+    executor : string, either "thread" or "process" [default: "thread"]
+        Whether to run chunks in a thread pool or a process pool. Threads
+        suit checkers that spend their time waiting on I/O. With processes,
+        resources are copied to the worker processes, and checkers given as
+        callables must be picklable (defined at the top level of a module).
+
+    chunk_size : int [optional]
+        Number of resources in each chunk when ``jobs`` is greater than 1.
+        Default: enough for each job to get about 4 chunks, at most
+        `DEFAULT_CHUNK_SIZE`.
+
+    cache : `check_cache.CheckCache` or Boolean [optional]
+        Store checker results in this cache, and reuse stored results for
+        resources that haven't changed instead of checking them again. If
+        True, a cache in the default location is used. Only checkers given
+        as paths or "builtin:" names are cached. See the `check_cache`
+        module.
+
     Returns
     ----------
     Generator giving (resource, tuples) pairs, where resource is a Resource
@@ -136,18 +188,56 @@ def check(collection, checkers=None, include_environment_checkers=True):
                 environment.CHECKER_ENVIRONMENT_VARIABLE, "").split(":")
             if e.strip())
 
-    generators = []
-    for checker in checkers:
-        if isinstance(checker, tuple):
-            (path, name, args, kwargs) = checker
-            generator = run_hook(collection, path, name, *args, **kwargs)
-        else:
-            generator = run_hook(collection, checker, name="check")
-        generators.append(generator)
-
-    if not generators:
+    if not checkers:
         raise NoCheckers()
 
+    if cache is True:
+        cache = check_cache.CheckCache()
+    elif not cache:
+        cache = None
+
+    labels = [str(checker) for checker in checkers]
+    if jobs > 1:
+        rows = _check_concurrently(
+            collection, checkers, labels, jobs, executor, chunk_size, cache)
+    else:
+        rows = _check_rows(
+            collection,
+            [_checker_function(checker, results=cache) for checker in checkers],
+            labels)
+    for row in rows:
+        yield row
+
+# Largest number of resources checked together when running concurrently.
+DEFAULT_CHUNK_SIZE = 1000
+
+def _checker_function(checker, results=None):
+    """
+    Return (function, args, kwargs) for a checker given to `check`.
+
+    If ``results`` is given, it is a `check_cache.CheckCache`, and the
+    function returned uses it.
+    """
+    if isinstance(checker, tuple):
+        (path_or_callable, name, args, kwargs) = checker
+    else:
+        (path_or_callable, name, args, kwargs) = (checker, "check", (), {})
+    function = _hook_function(path_or_callable, name)
+    if results is not None and not hasattr(path_or_callable, '__call__'):
+        key = check_cache.checker_key(path_or_callable, name, args, kwargs)
+        if key is not None:
+            function = check_cache.cached_checker(results, key, function)
+    return (function, args, kwargs)
+
+def _check_rows(collection, functions, labels):
+    """
+    Run checkers on a collection and generate (resource, tuples) pairs as
+    described in `check`.
+    """
+    generators = [
+        function(collection, *args, **kwargs)
+        for (function, args, kwargs) in functions
+    ]
     for row in zip(collection, *generators):
         (expected_resource, results) = (row[0], row[1:])
         tuples = []  # (checker, attempted, error)
@@ -155,9 +245,76 @@ def check(collection, checkers=None, include_environment_checkers=True):
             if resource != expected_resource:
                 raise ValueError(
                     "Checker %d (%s): skipping / reordering: %s != %s"
-                    % (i, checkers[i], resource, expected_resource))
-            tuples.append((str(checkers[i]), attempted, error))
-        yield (expected_resource, tuples) 
+                    % (i, labels[i], resource, expected_resource))
+            tuples.append((labels[i], attempted, error))
+        yield (expected_resource, tuples)
+
+def _check_chunk(functions, labels, chunk):
+    return [tuples for (_, tuples) in _check_rows(chunk, functions, labels)]
+
+def _check_chunk_in_process(checkers, labels, cache, chunk):
+    # Hook files are executed once per worker process; see `hook_module`.
+    functions = [
+        _checker_function(checker, results=cache) for checker in checkers
+    ]
+    return _check_chunk(functions, labels, chunk)
+
+def _check_concurrently(
+        collection, checkers, labels, jobs, executor, chunk_size, cache):
+    """
+    Run checkers on chunks of a collection in a thread or process pool, and
+    generate (resource, tuples) pairs in collection order.
+    """
+    from concurrent import futures
+    from .resource_collection import ResourceCollection
+
+    if executor == "thread":
+        functions = [
+            _checker_function(checker, results=cache) for checker in checkers
+        ]
+        task = functools.partial(_check_chunk, functions, labels)
+        pool = futures.ThreadPoolExecutor(jobs)
+    elif executor == "process":
+        task = functools.partial(
+            _check_chunk_in_process, checkers, labels, cache)
+        pool = futures.ProcessPoolExecutor(jobs)
+    else:
+        raise ValueError("Unsupported executor: %s" % executor)
+
+    resources = list(collection)
+    if chunk_size is None:
+        chunk_size = max(
+            1, min(DEFAULT_CHUNK_SIZE, len(resources) // (jobs * 4)))
+    chunks = (
+        ResourceCollection(resources[i : i + chunk_size], collection.filename)
+        for i in range(0, len(resources), chunk_size))
+
+    # (chunk, future) pairs, in collection order.
+    submitted = collections.deque()
+    try:
+        for chunk in chunks:
+            submitted.append((chunk, pool.submit(task, chunk)))
+            if len(submitted) < 2 * jobs:
+                continue
+            (chunk, future) = submitted.popleft()
+            rows = future.result()
+            for row in zip(chunk, rows):
+                yield row
+            if len(rows) < len(chunk):
+                # A checker stopped early. As when running serially, the
+                # results end there.
+                return
+        while submitted:
+            (chunk, future) = submitted.popleft()
+            rows = future.result()
+            for row in zip(chunk, rows):
+                yield row
+            if len(rows) < len(chunk):
+                return
+    finally:
+        for (_, future) in submitted:
+            future.cancel()
+        pool.shutdown(wait=True)
 
 def run_hook(collection, path_or_callable, name, *args, **kwargs):
     """
@@ -172,7 +329,8 @@ def run_hook(collection, path_or_callable, name, *args, **kwargs):
         file will be exec'd and is expected to define a module attribute
         given by the `name` argument. This attribute will be used as the
         callable. It should take a ResourceCollection instance as an
-        argument.
+        argument. The file is executed only the first time it is used in
+        this process, or after it has changed; see `hook_module`.
 
         Otherwise, this parameter should be a callable that takes a
         ResourceCollection instance. It will be invoked on this
@@ -187,15 +345,73 @@ def run_hook(collection, path_or_callable, name, *args, **kwargs):
         Additional args and kwargs are passed to the callable after the
         ResourceCollection.
     """
-    if hasattr(path_or_callable, '__call__'):
-        function = path_or_callable
-    else:
-        filename = path_or_callable
-        defines = exec_in_directory(filename)
-        try:
-            function = defines[name]
-        except KeyError:
-            raise AttributeError(
-                "Hook '%s' defines no such field '%s'"
-                % (filename, name))
+    function = _hook_function(path_or_callable, name)
     return function(collection, *args, **kwargs)
+
+def _hook_function(path_or_callable, name):
+    """
+    Return the callable given by ``path_or_callable`` and ``name``, as
+    described in `run_hook`.
+    """
+    if hasattr(path_or_callable, '__call__'):
+        return path_or_callable
+    if path_or_callable.startswith(BUILTIN_PREFIX):
+        from . import checkers
+        if name != "check":
+            raise ValueError(
+                "Built-in hooks are checkers only: %s" % path_or_callable)
+        return checkers.builtin(path_or_callable[len(BUILTIN_PREFIX):])
+    filename = resolve_path(path_or_callable)
+    snapshot.record_hook_file(filename)
+    defines = hook_module(filename)
+    try:
+        return defines[name]
+    except KeyError:
+        raise AttributeError(
+            "Hook '%s' defines no such field '%s'"
+            % (filename, name))
+
+class _HookModule(object):
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.signature = None  # (modification time, size)
+        self.digest = None
+        self.defines = None
+
+# Absolute path -> _HookModule, for hook files executed in this process.
+_HOOK_MODULES = {}
+_HOOK_MODULES_LOCK = threading.Lock()
+
+def hook_module(filename):
+    """
+    Return a dict of the module-level attributes defined by a hook file.
+
+    Each hook file is executed once per process, and the result reused by
+    later calls, until the file changes: its modification time or size
+    change, and its content hash then differs. So the module-level state of
+    a hook file persists between uses, as for an imported module.
+    """
+    path = resolve_path(filename)
+    with _HOOK_MODULES_LOCK:
+        module = _HOOK_MODULES.get(path)
+        if module is None:
+            module = _HOOK_MODULES[path] = _HookModule()
+    with module.lock:
+        stat = os.stat(path)
+        signature = (
+            getattr(stat, "st_mtime_ns", stat.st_mtime), stat.st_size)
+        if module.defines is not None and module.signature == signature:
+            return module.defines
+        digest = snapshot.file_digest(path)
+        if module.defines is None or digest != module.digest:
+            module.defines = exec_in_directory(path)
+            module.digest = digest
+        module.signature = signature
+        return module.defines
+
+def clear_hook_modules():
+    """
+    Forget all executed hook files, so they are executed again on next use.
+    """
+    with _HOOK_MODULES_LOCK:
+        _HOOK_MODULES.clear()
@@ -19,13 +19,22 @@ Instantiate ResourceCollection instances from files or strings.
 from __future__ import absolute_import
 
 import collections
+import glob
+import io
 import json
 import os
+import pickle
 import sys
 import re
+import threading
 
+import typechecks
+
+from . import arrow
+from . import compression
 from . import resource_collection
-from . import resource
+from . import snapshot
+from . import streaming
 from . import util
 from . import exporting
 from . import hooks
@@ -35,7 +44,11 @@ def load(
         format=None,
         filters=None,
         transforms=None,
-        environment_transforms=None):
+        environment_transforms=None,
+        compact=True,
+        table=False,
+        cache=None,
+        columns=None):
 
     """
     Load a `ResourceCollection` from a file or URL.
@@ -51,6 +64,9 @@ def load(
 
         Can be the string '-' to read from stdin. 
 
+        The file may be compressed with gzip, xz or Zstandard, e.g.
+        "collection.json.gz"; see the `compression` module.
+
         May include a "fragment", the part of a URL following a "#" symbol,
         e.g. "file1.py#filter=tags.foo". The fragment is a query string of
         key/value pairs separated by "&" symbols, e.g.
@@ -104,6 +120,21 @@ def load(
         the "environment_transforms" fragment setting specified in the filename
         URL. If not specified in either place, the default is True.
 
+    compact : Boolean [optional, default True]
+        Passed to `loads`.
+
+    table : Boolean [optional, default False]
+        Passed to `loads`.
+
+    cache : Boolean [optional]
+        Whether to use the on-disk snapshot cache; see the `snapshot` module.
+        Default: True if the SEFARA_CACHE_DIR environment variable is set.
+        Collections read from stdin, or loaded with callable filters or
+        transforms, are never cached.
+
+    columns : list of string [optional]
+        Passed to `loads`.
+
     Returns
     ----------
     ``ResourceCollection`` instance.
@@ -155,7 +186,7 @@ def load(
     if filters:
         operations.extend(("filter", x) for x in filters)
     if transforms:
-        operations.extend(("transform", x) for x in filters)
+        operations.extend(("transform", x) for x in transforms)
 
     # Default scheme is 'file', and needs an absolute path.
     fd = None
@@ -163,9 +194,10 @@ def load(
     if not parsed.scheme or parsed.scheme.lower() == 'file':
         if parsed.path == '-':
             # Read from stdin.
-            fd = sys.stdin
+            # Read bytes where possible, so compressed data can be detected.
+            fd = getattr(sys.stdin, "buffer", sys.stdin)
         else:
-            absolute_local_filename = os.path.abspath(parsed.path)
+            absolute_local_filename = util.resolve_path(parsed.path)
             parsed = parsed._replace(
                 scheme="file",
                 fragment="",
@@ -174,96 +206,604 @@ def load(
 
     # Try to guess data format from filename extension if not specified.
     if format is None:
-        if parsed.path.endswith(".py"):
+        path = compression.strip_extension(parsed.path)
+        if path.endswith(".py"):
             format = "python"
-        elif parsed.path.endswith(".json"):
+        elif path.endswith(".json"):
             format = "json"
+        else:
+            format = arrow.format_from_extension(path)
+
+    if cache is None:
+        cache = snapshot.enabled()
+    if cache and (
+            _is_stdin(fd) or
+            any(not typechecks.is_string(value) for (_, value) in operations)):
+        # Only collections with a name, and operations given as strings,
+        # can be cached.
+        cache = False
+
+    if parsed.scheme.lower() in ("http", "https"):
+        return _load_from_http(
+            filename,
+            format,
+            operations,
+            environment_transforms,
+            compact,
+            table,
+            cache,
+            columns)
+
+    if not cache:
+        return _load_from_url(
+            filename,
+            fd,
+            absolute_local_filename,
+            format,
+            operations,
+            environment_transforms,
+            compact,
+            table,
+            columns)
+
+    source = snapshot.source_name(filename)
+    if absolute_local_filename:
+        # Hash the file separately, so it can still be parsed incrementally.
+        data = None
+        digest = snapshot.file_digest(absolute_local_filename)
+    else:
+        data = _read(filename)
+        digest = snapshot.data_digest(data)
+    key = snapshot.snapshot_key(
+        source,
+        digest,
+        (format, operations, environment_transforms, compact, table,
+            columns))
+    rc = snapshot.read(source, key)
+    if rc is not None:
+        return rc
+    with snapshot.recording_hook_files() as hook_files:
+        if data is None:
+            rc = _load_from_url(
+                filename,
+                None,
+                absolute_local_filename,
+                format,
+                operations,
+                environment_transforms,
+                compact,
+                table,
+                columns)
+        else:
+            rc = _load_data(
+                data,
+                absolute_local_filename,
+                format,
+                operations,
+                environment_transforms,
+                compact,
+                table,
+                columns)
+    snapshot.write(source, key, rc, hook_files)
+    return rc
+
+class _ParsedCollections(object):
+    """
+    The most recently loaded collections fetched over HTTP, pickled, by
+    snapshot key, so a collection that has not changed on the server is not
+    parsed again. Like snapshots, entries are valid only while the hook
+    files run while loading them are unchanged.
+
+    At most ``maxsize`` entries totalling ``max_bytes`` pickled bytes are
+    kept. Collections larger than that are not kept at all.
+    """
+    def __init__(self, maxsize=16, max_bytes=2**26):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry  # Mark as most recently used.
+        (hook_files, pickled) = entry
+        for (filename, digest) in hook_files:
+            if snapshot.file_digest(filename) != digest:
+                return None
+        for (filename, _) in hook_files:
+            snapshot.record_hook_file(filename)
+        # Each call returns a new copy, which the caller may modify.
+        return pickle.loads(pickled)
+
+    def put(self, key, collection, hook_files):
+        try:
+            pickled = pickle.dumps(collection, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if len(pickled) > self.max_bytes:
+            return
+        hook_files = [
+            (filename, snapshot.file_digest(filename))
+            for filename in sorted(set(hook_files))
+        ]
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (hook_files, pickled)
+            self._bytes += len(pickled)
+            while (len(self._entries) > self.maxsize or
+                    self._bytes > self.max_bytes):
+                (_, (_, evicted)) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+_PARSED_COLLECTIONS = _ParsedCollections()
+
+def _load_from_http(
+        filename,
+        format,
+        operations,
+        environment_transforms,
+        compact,
+        table,
+        cache,
+        columns):
+    """
+    Load a collection from an HTTP or HTTPS URL with `fetching.fetch`.
+
+    If the response is unchanged since an earlier load with the same
+    arguments, in this process or (when ``cache`` is True) in the snapshot
+    cache, the collection is not parsed again.
+
+    The whole response body is read into memory before it is parsed, since
+    its hash is needed to look the collection up in these caches. So unlike
+    local files, collections fetched over HTTP are not parsed incrementally.
+    """
+    from . import fetching
+    response = fetching.fetch(filename)
+    if any(not typechecks.is_string(value) for (_, value) in operations):
+        return _load_from_url(
+            filename,
+            io.BytesIO(response.data),
+            None,
+            format,
+            operations,
+            environment_transforms,
+            compact,
+            table,
+            columns)
+
+    source = snapshot.source_name(filename)
+    key = snapshot.snapshot_key(
+        source,
+        response.digest,
+        (format, operations, environment_transforms, compact, table,
+            columns))
+    rc = _PARSED_COLLECTIONS.get(key)
+    if rc is None and cache:
+        rc = snapshot.read(source, key)
+    if rc is not None:
+        return rc
+    with snapshot.recording_hook_files() as hook_files:
+        rc = _load_from_url(
+            filename,
+            io.BytesIO(response.data),
+            None,
+            format,
+            operations,
+            environment_transforms,
+            compact,
+            table,
+            columns)
+    _PARSED_COLLECTIONS.put(key, rc, hook_files)
+    if cache:
+        snapshot.write(source, key, rc, hook_files)
+    return rc
+
+# Ways `load_many` can handle resources with the same name in several sources.
+CONFLICT_POLICIES = ("error", "first", "last", "rename")
+
+def load_many(sources, jobs=1, on_conflict="error", **kwargs):
+    """
+    Load several collections, possibly concurrently, and merge them into one.
+
+    Parameters
+    ----------
+    sources : list of string
+        Paths or URLs to resource collections, as accepted by `load`. Paths
+        may be glob patterns, e.g. "projects/*/collection.py", which are
+        expanded in sorted order. It is an error for a pattern to match no
+        files.
+
+    jobs : int [optional, default: 1]
+        Number of collections to load at once. Python collections are loaded
+        in a pool of processes, since executing them is CPU bound, and other
+        collections in a pool of threads. Arguments for `load`, including
+        filters and transforms, must then be picklable; if any filter or
+        transform is a callable, threads are used for all collections.
+
+    on_conflict : string [optional, default: "error"]
+        What to do when a resource has the same name as one from an earlier
+        source:
+
+            error
+                raise ValueError.
+
+            first
+                keep the earlier resource, and drop the later one.
+
+            last
+                replace the earlier resource with the later one, at the
+                earlier one's position.
+
+            rename
+                keep both, renaming the later resource by appending "-2"
+                (or "-3", etc.) to its name.
+
+    **kwargs
+        Passed to `load` for each source. If ``table`` is True, the merged
+        collection is a `ResourceTable`.
+
+    Returns
+    ----------
+    `ResourceCollection` instance, whose resources are in order of source,
+    then of position in the source. Its ``provenance`` attribute is a dict
+    giving the source each resource came from, by (possibly renamed)
+    resource name.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError("Unsupported conflict policy: %s (expected one of: "
+            "%s)" % (on_conflict, ", ".join(CONFLICT_POLICIES)))
+    table = kwargs.pop("table", False)
+    sources = _expand_sources(sources)
+    loaded = _load_sources(sources, jobs, kwargs)
+
+    merged = collections.OrderedDict()
+    provenance = {}
+    for (source, rc) in zip(sources, loaded):
+        for resource in rc:
+            name = resource["name"]
+            if name in merged:
+                if on_conflict == "error":
+                    raise ValueError(
+                        "Resource '%s' is defined in both %s and %s" % (
+                            name, provenance[name], source))
+                elif on_conflict == "first":
+                    continue
+                elif on_conflict == "rename":
+                    number = 2
+                    while "%s-%d" % (name, number) in merged:
+                        number += 1
+                    name = "%s-%d" % (name, number)
+                    resource["name"] = name
+            merged[name] = resource
+            provenance[name] = source
+
+    filename = ", ".join(sources)
+    if table:
+        from .resource_table import ResourceTable
+        result = ResourceTable.from_resources(
+            list(merged.values()), filename)
+    else:
+        result = resource_collection.ResourceCollection(
+            list(merged.values()), filename)
+    result.provenance = provenance
+    return result
 
+def _expand_sources(sources):
+    """
+    Expand glob patterns in a list of collection paths or URLs.
+    """
+    result = []
+    for source in sources:
+        parsed = util.urlparse(source)
+        local = not parsed.scheme or parsed.scheme.lower() == "file"
+        if not local or not glob.has_magic(parsed.path):
+            result.append(source)
+            continue
+        matches = sorted(glob.glob(parsed.path))
+        if not matches:
+            raise ValueError("No files match: %s" % parsed.path)
+        suffix = "#" + parsed.fragment if parsed.fragment else ""
+        result.extend(match + suffix for match in matches)
+    return result
+
+def _is_python_source(source, format):
+    if format is not None:
+        return format == "python"
+    parsed = util.urlparse(source)
+    fragment_formats = [
+        value for (key, value) in util.parse_qsl(parsed.fragment)
+        if key.lower() == "format"
+    ]
+    if fragment_formats:
+        return fragment_formats[0] == "python"
+    return parsed.path.endswith(".py")
+
+def _load_source(source, kwargs):
+    return load(source, **kwargs)
+
+def _load_sources(sources, jobs, kwargs):
+    """
+    Return a list of the collections loaded from the given sources.
+    """
+    if jobs <= 1 or len(sources) <= 1:
+        return [load(source, **kwargs) for source in sources]
+
+    from concurrent import futures
+
+    picklable = all(
+        typechecks.is_string(value)
+        for key in ("filters", "transforms")
+        for value in (kwargs.get(key) or []))
+    in_process = [
+        picklable and source != "-" and
+        _is_python_source(source, kwargs.get("format"))
+        for source in sources
+    ]
+    threads = futures.ThreadPoolExecutor(jobs)
+    processes = futures.ProcessPoolExecutor(jobs) if any(in_process) else None
     try:
-        if fd is None:
-            fd = util.urlopen(filename)
+        submitted = [
+            (processes if process else threads).submit(
+                _load_source, source, kwargs)
+            for (source, process) in zip(sources, in_process)
+        ]
+        return [future.result() for future in submitted]
+    finally:
+        threads.shutdown(wait=True)
+        if processes is not None:
+            processes.shutdown(wait=True)
 
-        # We don't apply environment_transforms here as we will apply them
-        # ourselves after any other specified transforms or filters.    
-        rc = loads(
-            fd.read(),
-            filename=absolute_local_filename,
-            format=format,
-            environment_transforms=False)
+def _read(filename):
+    fd = util.urlopen(filename)
+    try:
+        return fd.read()
     finally:
-        if fd is not None and fd is not sys.stdin:
-            fd.close()        
+        fd.close()
+
+def _is_stdin(fd):
+    return fd is sys.stdin or fd is getattr(sys.stdin, "buffer", None)
+
+def _guess_format(data):
+    """
+    Guess whether data is JSON or Python: we call it JSON if the first non
+    whitespace character is '{', otherwise Python. Parquet and Feather data
+    are detected by `arrow.format_from_magic`.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+    return "json" if re.match(r"^\W*{", data) else "python"
 
-    # Apply filters and transforms.
+def _load_from_url(
+        filename,
+        fd,
+        local_filename,
+        format,
+        operations,
+        environment_transforms,
+        compact,
+        table,
+        columns):
+    """
+    Read a collection from a file or URL, then apply the given operations and
+    any transforms configured in the environment.
+
+    JSON collections are parsed incrementally, and any filters at the start
+    of the operations are applied while parsing.
+    """
+    if fd is None:
+        if local_filename:
+            fd = open(local_filename, "rb")
+        else:
+            fd = util.urlopen(filename)
+    source = fd
+    try:
+        initial = fd.read(streaming.CHUNK_SIZE)
+        compression_name = (
+            compression.from_magic(initial) or
+            compression.from_extension(util.urlparse(filename).path))
+        if compression_name is not None:
+            # Decompress while parsing.
+            fd = compression.decompressing_reader(
+                source, compression_name, initial)
+            initial = fd.read(streaming.CHUNK_SIZE)
+        if format is None:
+            format = arrow.format_from_magic(initial) or _guess_format(initial)
+        if format in arrow.FORMATS:
+            if local_filename and compression_name is None:
+                # Read from the file, so unneeded columns are skipped.
+                data = local_filename
+            else:
+                data = io.BytesIO(initial + fd.read())
+            rc = _from_pairs(
+                arrow.read_plain_types(data, format, columns),
+                local_filename,
+                compact,
+                table)
+        elif format == "json":
+            filters = []
+            while operations and operations[0][0] == "filter":
+                filters.append(operations[0][1])
+                operations = operations[1:]
+            rc = streaming.read_collection(
+                fd,
+                filename=local_filename,
+                compact=compact,
+                table=table,
+                filters=filters,
+                initial=initial,
+                columns=columns)
+        else:
+            data = initial + fd.read()
+    finally:
+        if not _is_stdin(source):
+            source.close()
+
+    if format == "json" or format in arrow.FORMATS:
+        return _apply_operations(rc, operations, environment_transforms)
+    return _load_data(
+        data,
+        local_filename,
+        format,
+        operations,
+        environment_transforms,
+        compact,
+        table,
+        columns)
+
+def _load_data(
+        data,
+        filename,
+        format,
+        operations,
+        environment_transforms,
+        compact,
+        table,
+        columns):
+    """
+    Load a collection with `loads`, then apply the given operations and
+    any transforms configured in the environment.
+    """
+    # We don't apply environment_transforms here as we will apply them
+    # ourselves after any other specified transforms or filters.
+    rc = loads(
+        data,
+        filename=filename,
+        format=format,
+        environment_transforms=False,
+        compact=compact,
+        table=table,
+        columns=columns)
+    return _apply_operations(rc, operations, environment_transforms)
+
+def _from_pairs(pairs, filename, compact, table):
+    """
+    Create a collection from (name, attributes dict) pairs.
+    """
+    if table:
+        from .resource_table import ResourceTable
+        return ResourceTable.from_plain_types(pairs, filename)
+    return resource_collection.ResourceCollection(
+        list(streaming.resources_from_pairs(pairs, compact)), filename)
+
+def _apply_operations(rc, operations, environment_transforms):
+    # Consecutive filters are combined into one filter call.
+    plan = None
     for (operation, value) in operations:
         if operation == 'filter':
-            rc = rc.filter(value)
-        elif operation == 'transform':
+            plan = (plan or rc.lazy()).filter(value)
+            continue
+        if plan is not None:
+            rc = plan.collect()
+            plan = None
+        if operation == 'transform':
             hooks.transform(rc, value)
         else:
             assert(False)
+    if plan is not None:
+        rc = plan.collect()
 
     if environment_transforms is not False:
         hooks.transform_from_environment(rc)
 
     return rc
 
-def loads(data, filename=None, format=None, environment_transforms=True):
+def loads(
+        data,
+        filename=None,
+        format=None,
+        environment_transforms=True,
+        compact=True,
+        table=False,
+        columns=None):
     """
     Load a ResourceCollection from a string.
 
     Parameters
     ----------
-    data : string
-        ResourceCollection specification in either Python or JSON.
+    data : string or bytes
+        ResourceCollection specification in either Python or JSON, or bytes
+        in Parquet or Feather format (see the `arrow` module). Bytes may be
+        compressed; see the `compression` module.
 
     filename : string [optional]
         filename where this data originally came from to use in error messages
 
-    format : string,  either "python" or "json" [default: guess from data]
+    format : string, one of "python", "json", "parquet" or "feather"
+        [default: guess from data]
         format of the data
 
     environment_transforms : Boolean [default: True]
         whether to run transforms configured in environment variables.
 
+    compact : Boolean [default: True]
+        whether to create `CompactResource` instances, which use much less
+        memory, for JSON data. If False, `Resource` instances are created.
+        Resources defined in Python are always `Resource` instances.
+
+    table : Boolean [default: False]
+        whether to return a `ResourceTable`, which stores the resources as
+        columns, instead of a `ResourceCollection`.
+
+    columns : list of string [optional]
+        attributes to load. Other attributes are dropped, and, for Parquet
+        and Feather data, never decoded. "name" is always loaded, and "tags"
+        only if listed. Transforms defined by a Python collection run before
+        the other attributes are dropped.
+
     Returns
     -------
     ResourceCollection instance.
     """
+    compression_name = compression.from_magic(data)
+    if compression_name is not None:
+        data = compression.decompress(data, compression_name)
+
     if format is None:
-        # Attempt to guess format from data.
-        # We call it JSON if the first non whitespace character is '{',
-        # otherwise Python.
-        format = "json" if re.match(r"^\W*{", data) else "python"
+        format = arrow.format_from_magic(data) or _guess_format(data)
 
     rc = None
     transforms = []
-    if format == "python":
-        try:
-            old_resources = exporting._EXPORTED_RESOURCES
-            old_transforms = exporting._TRANSFORMS
-            exporting._EXPORTED_RESOURCES = []
-            exporting._TRANSFORMS = []
+    if format in arrow.FORMATS:
+        rc = _from_pairs(
+            arrow.read_plain_types(io.BytesIO(data), format, columns),
+            filename,
+            compact,
+            table)
+    elif format == "python":
+        with exporting.collecting_exports() as exports:
             util.exec_in_directory(filename=filename, code=data)
-        finally:
-            transforms = exporting._TRANSFORMS
-            resources = exporting._EXPORTED_RESOURCES
-            exporting._EXPORTED_RESOURCES = old_resources
-            exporting._TRANSFORMS = old_transforms
-        rc = resource_collection.ResourceCollection(resources, filename)
+        (resources, transforms) = (exports.resources, exports.transforms)
+        if table:
+            from .resource_table import ResourceTable
+            rc = ResourceTable.from_resources(resources, filename)
+        else:
+            rc = resource_collection.ResourceCollection(resources, filename)
     elif format == "json":
         parsed = json.loads(data, object_pairs_hook=collections.OrderedDict)
-        resources = [
-            resource.Resource(name=key, **value)
-            for (key, value) in parsed.items()
-        ]
-        rc = resource_collection.ResourceCollection(resources, filename)
+        rc = _from_pairs(
+            streaming.project_pairs(parsed.items(), columns),
+            filename,
+            compact,
+            table)
     else:
         raise ValueError("Unsupported file format: %s" % filename)
 
     for transform in transforms:
         hooks.transform(rc, transform)
 
+    if format == "python" and columns is not None:
+        rc = _from_pairs(
+            streaming.project_pairs(rc._iter_plain_types(), columns),
+            filename,
+            False,
+            table)
+
     if environment_transforms:
         hooks.transform_from_environment(rc)
     return rc
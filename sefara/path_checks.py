@@ -0,0 +1,139 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The asyncio implementation of `checkers.check_paths`.
+
+Requires Python 3.7 or later; import it only through `checkers`.
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import collections
+import concurrent.futures
+import errno
+import os
+import threading
+import time
+
+import six
+
+def run_check_paths(resources, attribute, concurrency, on_latency):
+    """
+    Return a list of (attempted, problem) pairs, one for each resource. See
+    `checkers.check_paths`.
+    """
+    coroutine = _check_paths(resources, attribute, concurrency, on_latency)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Called from within an event loop (e.g. in a notebook), so run ours in
+    # another thread.
+    return _run_in_thread(coroutine)
+
+def _run_in_thread(coroutine):
+    box = []
+
+    def target():
+        try:
+            box.append((True, asyncio.run(coroutine)))
+        except BaseException as e:
+            box.append((False, e))
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    (success, value) = box[0]
+    if not success:
+        raise value
+    return value
+
+def _check_readable(path):
+    os.stat(path)
+    if not os.access(path, os.R_OK):
+        raise OSError(errno.EACCES, os.strerror(errno.EACCES), path)
+
+def _check_listed(path):
+    # The directory listing showed the path exists, so skip the stat unless
+    # the access check fails (e.g. the file was removed since).
+    if not os.access(path, os.R_OK):
+        _check_readable(path)
+
+async def _check_paths(resources, attribute, concurrency, on_latency):
+    """
+    Return a list of (attempted, problem) pairs, one for each resource.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+    results = [None] * len(resources)
+
+    async def call(function, *args):
+        async with semaphore:
+            return await loop.run_in_executor(executor, function, *args)
+
+    async def check_resource(i, path, names):
+        # The listing is only a hint: a name missing from it may still
+        # exist on a case-insensitive or normalizing filesystem, or may have
+        # been created since, so it is checked in full.
+        if names is not None and os.path.basename(path) in names:
+            check = _check_listed
+        else:
+            check = _check_readable
+        try:
+            async with semaphore:
+                # Time only this resource's own filesystem calls, not the
+                # wait for a free slot.
+                start = time.monotonic()
+                await loop.run_in_executor(executor, check, path)
+            problem = None
+        except OSError as e:
+            problem = "Couldn't access %s: %s" % (attribute, e)
+        latency = time.monotonic() - start
+        if on_latency is not None:
+            on_latency(resources[i], latency)
+        if problem is not None:
+            problem += " (%.1f ms)" % (latency * 1000.0)
+        results[i] = (True, problem)
+
+    async def check_directory(directory, items):
+        try:
+            names = frozenset(await call(os.listdir, directory))
+        except OSError:
+            # The directory may be missing, or searchable but not listable.
+            # Either way, checking each path gives the right error.
+            names = None
+        await asyncio.gather(*[
+            check_resource(i, path, names) for (i, path) in items
+        ])
+
+    by_directory = collections.OrderedDict()
+    for (i, resource) in enumerate(resources):
+        path = resource.get(attribute)
+        if not path or not isinstance(path, six.string_types):
+            results[i] = (False, "No %s specified." % attribute)
+            continue
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        by_directory.setdefault(directory, []).append((i, path))
+
+    try:
+        await asyncio.gather(*[
+            check_directory(directory, items)
+            for (directory, items) in by_directory.items()
+        ])
+    finally:
+        executor.shutdown(wait=True)
+    return results
@@ -0,0 +1,310 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Lazy queries over resource collections.
+
+Each call to `ResourceCollection.filter` makes a pass over the collection and
+builds a new collection. A `LazyCollection`, returned by
+`ResourceCollection.lazy`, instead records ``filter`` and ``head`` calls as
+a plan, and runs the whole plan when its result is needed:
+
+    >>> rc.lazy().filter("tags.foo").filter("depth > 10").head(5).collect()
+
+Consecutive string filters are combined into a single expression, here
+"(tags.foo) and (depth > 10)", which is passed to one ``filter`` call. So
+no intermediate collection is built, each resource stops at the first
+condition it fails, and the tag index and columnar engine of the collection
+still apply. The result is that of calling ``filter`` once with the combined
+expression.
+
+The input may also be an iterable of resources, such as a collection being
+loaded. Then the first filter (and a ``head`` right after it) is applied as
+the resources are read, so resources that don't pass are never kept, and
+once a ``head`` has its resources the rest of the input is not read at all.
+The result is the same as building a `ResourceCollection` from the whole
+input and then running the plan on it, with two exceptions:
+
+    - In a `ResourceCollection`, a resource replaces an earlier one with the
+      same name. Input after a ``head`` has its resources is not read, so a
+      replacement there is not seen, and the result keeps the earlier
+      resource.
+
+    - Names of builtins (like ``len``), of the modules available to
+      expressions (like ``re``), and ``resource`` are taken to refer to
+      those. If a later resource has an attribute with such a name,
+      `ResourceCollection.filter` would bind it to None for resources
+      without it, but resources already filtered are not evaluated again.
+"""
+
+from __future__ import absolute_import
+
+import ast
+
+import six
+import typechecks
+
+from .resource import STANDARD_EVALUATION_ENVIRONMENT
+
+# Names an expression can read that are not attributes of a resource.
+_ENVIRONMENT_NAMES = frozenset(
+    dir(six.moves.builtins) +
+    list(STANDARD_EVALUATION_ENVIRONMENT) +
+    ["resource", "on_error"])
+
+def _free_names(expression):
+    """
+    Return the variable names an expression reads but does not bind.
+    """
+    tree = ast.parse(expression.lstrip(" \t"), mode="eval")
+    loaded = set()
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.add(node.id)
+            else:
+                bound.add(node.id)
+        elif type(node).__name__ == "arg":  # py3 lambda arguments
+            bound.add(node.arg)
+    return loaded - bound
+
+def _conjunction(expressions):
+    """
+    Combine filter expressions with "and".
+    """
+    if len(expressions) == 1:
+        return expressions[0]
+    # A newline ends any comment before the closing parenthesis.
+    return " and ".join(
+        "(%s\n)" % x.strip() if "#" in x else "(%s)" % x.strip()
+        for x in expressions)
+
+def _fuse(steps):
+    """
+    Return a plan's steps with each run of consecutive string filters
+    combined into one filter.
+    """
+    result = []
+    run = []
+    for (operation, value) in steps:
+        if operation not in ("filter", "head"):
+            raise ValueError("Unsupported operation: %s" % operation)
+        if operation == "filter" and typechecks.is_string(value):
+            run.append(value)
+            continue
+        if run:
+            result.append(("filter", _conjunction(run)))
+            run = []
+        result.append((operation, value))
+    if run:
+        result.append(("filter", _conjunction(run)))
+    return result
+
+# State of a resource whose filter result isn't known yet.
+_PENDING = object()
+
+class _Stream(object):
+    """
+    Filters resources as they are read, giving the same result as
+    `ResourceCollection.filter` on the collection of all of them.
+
+    That filter evaluates its expression with every attribute of the
+    collection bound to None. Here the attributes are only known once the
+    input ends, so a resource is evaluated as soon as every name the
+    expression reads is an attribute of the resource, has been seen as an
+    attribute of another one, or is a builtin or other name available to
+    every expression. Other resources are held until then, or until the
+    input ends.
+    """
+    def __init__(self, expression=None, attributes=None, limit=None):
+        self.expression = expression
+        self.names = (
+            _free_names(expression) - _ENVIRONMENT_NAMES
+            if typechecks.is_string(expression) else ())
+        self.complete = attributes is not None
+        self.bindings = dict((key, None) for key in (attributes or ()))
+        self.limit = limit
+
+        self.positions = {}  # name -> position
+        # For each position: the resource if it passes, None if it doesn't,
+        # or _PENDING.
+        self.states = []
+        self.pending = {}  # position -> resource
+        # Every position before the frontier is decided, and "passed" of
+        # them pass.
+        self.frontier = 0
+        self.passed = 0
+
+    def run(self, resources):
+        """
+        Return the list of resources that pass.
+        """
+        if self.limit == 0:
+            return []
+        for resource in resources:
+            self.add(resource)
+            if self.limit is not None and self.passed >= self.limit:
+                break
+        else:
+            for position in sorted(self.pending):
+                self.decide(position, self.pending.pop(position))
+        result = [x for x in self.states[:self.frontier] if x is not None]
+        return result if self.limit is None else result[:self.limit]
+
+    def add(self, resource):
+        name = resource["name"]
+        position = self.positions.get(name)
+        if position is None:
+            # As in a ResourceCollection, a repeated name replaces the earlier
+            # resource at the earlier position.
+            position = self.positions[name] = len(self.states)
+            self.states.append(None)
+        self.pending.pop(position, None)
+
+        if not self.complete:
+            new_attributes = [
+                key for key in resource if key not in self.bindings]
+            for key in new_attributes:
+                self.bindings[key] = None
+            if new_attributes and self.pending:
+                for other in sorted(self.pending):
+                    if self.resolved(self.pending[other]):
+                        self.decide(other, self.pending.pop(other))
+
+        if self.resolved(resource):
+            self.decide(position, resource)
+        else:
+            self.pending[position] = resource
+            self.set_state(position, _PENDING)
+
+    def resolved(self, resource):
+        return self.complete or all(
+            name in resource or name in self.bindings for name in self.names)
+
+    def decide(self, position, resource):
+        if self.expression is None:
+            passes = True
+        elif typechecks.is_string(self.expression):
+            passes = resource.evaluate(
+                self.expression, extra_bindings=self.bindings)
+        else:
+            passes = self.expression(resource)
+        self.set_state(position, resource if passes else None)
+
+    def set_state(self, position, state):
+        if position < self.frontier:
+            if state is _PENDING:
+                self.frontier = position
+                self.passed = sum(
+                    1 for x in self.states[:position] if x is not None)
+            else:
+                self.passed += (
+                    (state is not None) - (self.states[position] is not None))
+        self.states[position] = state
+        while (self.frontier < len(self.states) and
+                self.states[self.frontier] is not _PENDING):
+            if self.states[self.frontier] is not None:
+                self.passed += 1
+            self.frontier += 1
+
+class LazyCollection(object):
+    """
+    A query over a collection of resources, run when its result is needed.
+
+    Create one with `ResourceCollection.lazy`.
+    """
+    def __init__(
+            self,
+            resources,
+            filename="<no file>",
+            attributes=None,
+            steps=()):
+        """
+        Parameters
+        ----------
+        resources : `ResourceCollection` or iterable of `Resource` instances
+            Input to the query. If an iterator is given, the query can only be
+            run once. As when constructing a `ResourceCollection`, if a name
+            occurs more than once in an iterator, the last resource with that
+            name replaces the earlier ones.
+
+        filename : string [optional]
+            Filename of the collection, used in error messages.
+
+        attributes : set of string [optional]
+            All attribute names used by the input resources, if known.
+            Determined automatically for a `ResourceCollection`.
+
+        steps : tuple of (string, object) pairs [optional]
+            Steps of the plan so far: ("filter", expression) or ("head", n).
+        """
+        self.resources = resources
+        self.filename = filename
+        self.attributes = attributes
+        self.steps = tuple(steps)
+
+    def _with_step(self, step):
+        return LazyCollection(
+            self.resources,
+            filename=self.filename,
+            attributes=self.attributes,
+            steps=self.steps + (step,))
+
+    def filter(self, expression):
+        """
+        Add a filter to the plan. See `ResourceCollection.filter`.
+        """
+        return self._with_step(("filter", expression))
+
+    def head(self, n):
+        """
+        Add a step keeping only the first ``n`` resources to the plan.
+        """
+        return self._with_step(("head", n))
+
+    def collect(self):
+        """
+        Run the plan and return the resulting `ResourceCollection` (a
+        `ResourceTable` if the input is one).
+        """
+        from .resource_collection import ResourceCollection
+
+        steps = _fuse(self.steps)
+        result = self.resources
+        if not isinstance(result, ResourceCollection):
+            expression = limit = None
+            if steps and steps[0][0] == "filter":
+                expression = steps.pop(0)[1]
+            if steps and steps[0][0] == "head":
+                limit = steps.pop(0)[1]
+            stream = _Stream(expression, self.attributes, limit)
+            result = ResourceCollection(stream.run(result), self.filename)
+        for (operation, value) in steps:
+            result = getattr(result, operation)(value)
+        return result
+
+    def select(self, *expressions, **kwargs):
+        """
+        Run the plan and select fields or expressions from the result. See
+        `ResourceCollection.select`.
+        """
+        return self.collect().select(*expressions, **kwargs)
+
+    def select_series(self, expression):
+        """
+        Run the plan and select one field or expression from the result. See
+        `ResourceCollection.select_series`.
+        """
+        return self.collect().select_series(expression)
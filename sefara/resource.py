@@ -12,17 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ast
 import os
 import re
 import collections
+import itertools
 import sys
 import json
-from future.utils import raise_
+import threading
+import weakref
+import six
 import typechecks
 from attrdict import AttrMap
 from . import util
 
-NEXT_RESOURCE_NUM = 1
+# Numbers used to generate names for resources created without one.
+_RESOURCE_NUMBERS = itertools.count(1)
+_RESOURCE_NUMBERS_LOCK = threading.Lock()
+
+def _generated_name():
+    with _RESOURCE_NUMBERS_LOCK:
+        return "resource-%d" % next(_RESOURCE_NUMBERS)
+
+# Placeholder for the value of an attribute that is not set.
+MISSING = object()
+
 class Resource(AttrMap):
     """
     A Resource gives information on how to access some dataset under analysis
@@ -49,15 +63,72 @@ class Resource(AttrMap):
         **fields : string -> strings, dicts, and lists
             Other fields in the resource.
         """
-        global NEXT_RESOURCE_NUM
         if name is not None:
             fields["name"] = name
         if "name" not in fields:
-            fields["name"] = "resource-%d" % NEXT_RESOURCE_NUM
-            NEXT_RESOURCE_NUM += 1
+            fields["name"] = _generated_name()
         fields['tags'] = Tags(fields.get('tags', []))
+        fields['tags']._owner = self
         AttrMap.__init__(self, fields)
-        
+        self._setattr('_owners', [])
+
+    def __setitem__(self, key, value):
+        old_value = self._mapping.get(key, MISSING)
+        if key == "tags":
+            value = Tags(value)
+            value._owner = self
+        AttrMap.__setitem__(self, key, value)
+        if isinstance(old_value, Tags) and old_value is not value:
+            old_value._owner = None
+        self._notify_owners("_resource_updated", key, old_value, value)
+
+    def __delitem__(self, key):
+        old_value = self._mapping[key]
+        AttrMap.__delitem__(self, key)
+        if key == "tags" and isinstance(old_value, Tags):
+            old_value._owner = None
+        self._notify_owners("_resource_updated", key, old_value, MISSING)
+
+    def __setstate__(self, state):
+        AttrMap.__setstate__(self, state)
+        self._setattr('_owners', [])
+        tags = self._mapping.get("tags")
+        if isinstance(tags, Tags):
+            tags._owner = self
+
+    def _add_owner(self, collection):
+        """
+        Register a collection to be notified when this resource changes.
+        """
+        # Drop references to collections that no longer exist.
+        owners = self._owners
+        owners[:] = [x for x in owners if x() is not None]
+        owners.append(weakref.ref(collection))
+
+    def _remove_owner(self, collection):
+        """
+        Stop notifying the given collection when this resource changes.
+        """
+        self._owners[:] = [
+            x for x in self._owners
+            if x() is not None and x() is not collection
+        ]
+
+    def _tags_changed(self, added, removed):
+        """
+        Called by our `Tags` instance when it is modified in place.
+        """
+        self._notify_owners("_resource_tags_updated", added, removed)
+
+    def _notify_owners(self, method, *args):
+        """
+        Call the given method on each collection containing this resource.
+        """
+        for reference in self._owners:
+            owner = reference()
+            if owner is not None:
+                getattr(owner, method)(self, *args)
+
     def __str__(self):
         keys = sorted(self.keys())
         util.move_to_front(keys, "name", "tags")
@@ -148,7 +219,8 @@ class Resource(AttrMap):
                 environment["on_error"] = on_error
                 environment.update(extra_bindings)
 
-                return eval(expression, environment, self)
+                return eval(
+                    EXPRESSION_CACHE.compile(expression), environment, self)
             else:
                 return expression(self)                
         except Exception as e:
@@ -157,7 +229,8 @@ class Resource(AttrMap):
             extra = "Error while evaluating: \n\t%s\non resource:\n%s" % (
                 expression, self)
             traceback = sys.exc_info()[2]
-            raise_(ValueError, str(e) + "\n" + extra, traceback)
+            six.reraise(
+                ValueError, ValueError(str(e) + "\n" + extra), traceback)
                 
     def to_plain_types(self):
         """
@@ -171,7 +244,82 @@ class Resource(AttrMap):
                 result[field] = value
         return result
 
-class Tags(set):
+class _ObservedSet(set):
+    """
+    A set that tells its owning `Resource`, if any, when it is modified.
+
+    The mutating methods are defined here rather than on `Tags` so that they
+    do not count as reserved names in `check_valid_tag`.
+    """
+    # The Resource these tags belong to.
+    _owner = None
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def _changed(self, added=(), removed=()):
+        if self._owner is not None and (added or removed):
+            self._owner._tags_changed(added, removed)
+
+    def _update_with(self, method, *args):
+        """
+        Call a set method that modifies this set in place, and notify the
+        owner of the difference.
+        """
+        before = set(self)
+        result = method(self, *args)
+        self._changed(added=self - before, removed=before - self)
+        return result
+
+    def add(self, tag):
+        if tag not in self:
+            set.add(self, tag)
+            self._changed(added=(tag,))
+
+    def discard(self, tag):
+        if tag in self:
+            set.discard(self, tag)
+            self._changed(removed=(tag,))
+
+    def remove(self, tag):
+        set.remove(self, tag)
+        self._changed(removed=(tag,))
+
+    def pop(self):
+        result = set.pop(self)
+        self._changed(removed=(result,))
+        return result
+
+    def clear(self):
+        removed = list(self)
+        set.clear(self)
+        self._changed(removed=removed)
+
+    def update(self, *others):
+        self._update_with(set.update, *others)
+
+    def difference_update(self, *others):
+        self._update_with(set.difference_update, *others)
+
+    def intersection_update(self, *others):
+        self._update_with(set.intersection_update, *others)
+
+    def symmetric_difference_update(self, other):
+        self._update_with(set.symmetric_difference_update, other)
+
+    def __ior__(self, other):
+        return self._update_with(set.__ior__, other)
+
+    def __iand__(self, other):
+        return self._update_with(set.__iand__, other)
+
+    def __isub__(self, other):
+        return self._update_with(set.__isub__, other)
+
+    def __ixor__(self, other):
+        return self._update_with(set.__ixor__, other)
+
+class Tags(_ObservedSet):
     """
     A set of strings used to group resources.
 
@@ -207,6 +355,28 @@ def check_valid_tag(tag):
     if re.match('^[\w][\w-]*$', tag) is None:
         raise ValueError("Invalid tag: '%s'" % tag)
 
+def is_tag_expression(expression):
+    """
+    Return True if ``expression`` is a string consisting only of tag tests
+    (like "tags.foo") combined with "and", "or", and "not".
+    """
+    try:
+        tree = ast.parse(expression.lstrip(" \t"), mode="eval")
+    except SyntaxError:
+        return False
+
+    def check(node):
+        if isinstance(node, ast.BoolOp):
+            return all(check(x) for x in node.values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return check(node.operand)
+        return (
+            isinstance(node, ast.Attribute) and
+            isinstance(node.value, ast.Name) and
+            node.value.id == "tags" and
+            not hasattr(Tags, node.attr))
+    return check(tree.body)
+
 STANDARD_EVALUATION_ENVIRONMENT = {
     "os": os,
     "sys": sys,
@@ -214,3 +384,82 @@ STANDARD_EVALUATION_ENVIRONMENT = {
     "re": re,
     "json": json,
 }
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+class ExpressionCache(object):
+    """
+    A bounded, least-recently-used cache of compiled Python code objects,
+    keyed by the text of the expression.
+
+    Filtering or selecting over a collection evaluates the same expression
+    once per resource. Looking the compiled code up here means each distinct
+    expression is parsed and compiled only once.
+    """
+    def __init__(self, maxsize=1024):
+        """
+        Parameters
+        ----------
+        maxsize : int [optional, default 1024]
+            Maximum number of compiled expressions to keep. When the cache is
+            full, the least recently used entry is discarded.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, source, mode="eval"):
+        """
+        Return a code object for the given source, compiling it if it is not
+        already cached.
+
+        Parameters
+        ----------
+        source : string
+            Python source code.
+
+        mode : string [optional, default "eval"]
+            Passed to the builtin `compile`: "eval" for an expression, "exec"
+            for statements.
+        """
+        key = (source, mode)
+        with self._lock:
+            code = self._entries.pop(key, None)
+            if code is not None:
+                self._entries[key] = code  # Mark as most recently used.
+                self.hits += 1
+                return code
+            self.misses += 1
+        if mode == "eval":
+            # Like eval() on a string, ignore leading spaces and tabs.
+            code = compile(source.lstrip(" \t"), "<string>", mode)
+        else:
+            code = compile(source, "<string>", mode)
+        with self._lock:
+            self._entries[key] = code
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return code
+
+    def info(self):
+        """
+        Return a `CacheInfo` tuple giving the hit and miss counts and the
+        current and maximum size of the cache.
+        """
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        """
+        Discard all cached code objects and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+EXPRESSION_CACHE = ExpressionCache()
@@ -19,13 +19,20 @@ import json
 import collections
 import datetime
 import getpass
-import pandas
+import numbers
 import re
 
 import typechecks
 
+from . import arrow
+from . import compression as compression_module
 from . import util
-from . import Resource
+from .resource import Resource, Tags, MISSING, is_tag_expression
+
+# Smallest collection for which `ResourceCollection.filter` answers tag
+# expressions from its tag index. Building the index needs NumPy, which takes
+# longer to import than filtering a small collection one resource at a time.
+TAG_INDEX_MIN_RESOURCES = 10000
 
 class NoCheckers(Exception):
     pass
@@ -53,37 +60,234 @@ class ResourceCollection(object):
             Filename these resources were loaded from. Used in error messages.
         """
         if isinstance(resources, list):
-            resources = collections.OrderedDict(
-                (x.name, x) for x in resources)
-        self.resources = collections.OrderedDict()
-        for (key, value) in resources.items():
-            if value is not None:
-                assert value.name == key
-                self.resources[key] = value
-        self.resources = resources
+            resources = _distinct_names(resources)
+        else:
+            for (key, value) in resources.items():
+                if value is not None:
+                    assert value["name"] == key
+            resources = list(resources.values())
+        self._setup(resources, filename)
+
+    def _setup(self, resource_list, filename):
+        # The resources in order.
+        self._resource_list = resource_list
+
         self.filename = filename
 
+        # Resources by name (see `resources`). Built on first use, then kept
+        # up to date when resources are renamed.
+        self._name_index = None
+        self._name_order_stale = False
+
+        # Caches used by filter(). They are discarded when a resource in this
+        # collection is modified.
+        self._tag_index = None
+        self._columnar_view = None
+
+        # Reference counts giving the number of resources using each
+        # attribute name and each tag. Built on first use, then kept up to
+        # date as resources are added, removed, or modified.
+        self._attribute_counts = None
+        self._tag_counts = None
+
+        # Whether the resources notify this collection when they change. This
+        # is only needed once one of the above is built, so collections that
+        # are only iterated over, like most filter results, never register.
+        self._watching = False
+
+    def _subset(self, resources):
+        """
+        Return a new collection of the given resources, which are some of the
+        resources in this collection, in order.
+        """
+        result = ResourceCollection.__new__(ResourceCollection)
+        result._setup(resources, self.filename)
+        return result
+
+    def _watch(self):
+        """
+        Register with each resource to be notified when it changes.
+        """
+        if not self._watching:
+            for resource in self._resource_list:
+                if resource is not None:
+                    resource._add_owner(self)
+            self._watching = True
+
+    def _get_name_index(self):
+        if self._name_index is None:
+            self._watch()
+            # As in the constructor, a later resource with a name wins.
+            self._name_index = collections.OrderedDict(
+                (x["name"], x) for x in self._resource_list if x is not None)
+            self._name_order_stale = False
+        return self._name_index
+
+    @property
+    def resources(self):
+        """
+        OrderedDict of name -> resource, in collection order.
+        """
+        if self._name_order_stale:
+            # A rename moved an entry to the end. Rebuild in list order.
+            self._name_index = None
+        return self._get_name_index()
+
+    @resources.setter
+    def resources(self, resources):
+        """
+        Replace the resources, given as a list or as a dict of name ->
+        resource, as in the constructor.
+        """
+        if self._watching:
+            for resource in self._resource_list:
+                if resource is not None:
+                    resource._remove_owner(self)
+        self.__init__(resources, self.filename)
+
+    def __getstate__(self):
+        # Caches are rebuilt as needed after unpickling.
+        return {
+            "resources": self._resource_list,
+            "filename": self.filename,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["resources"], state["filename"])
+
+    def add(self, resource):
+        """
+        Add a resource to the end of this collection.
+
+        Raises ValueError if there is already a resource with the same name.
+        """
+        name = resource["name"]
+        index = self._get_name_index()
+        if name in index:
+            raise ValueError("Duplicate resource name: %s" % name)
+        index[name] = resource
+        self._resource_list.append(resource)
+        resource._add_owner(self)
+        self._structure_changed()
+        self._count_resource(resource, 1)
+
+    def remove(self, name):
+        """
+        Remove the resource with the given name from this collection and
+        return it.
+        """
+        resource = self[name]
+        position = next(
+            i for (i, x) in enumerate(self._resource_list) if x is resource)
+        del self._resource_list[position]
+        resource._remove_owner(self)
+        # Another resource may have the same name.
+        self._name_index = None
+        self._structure_changed()
+        self._count_resource(resource, -1)
+        return resource
+
+    def _structure_changed(self):
+        self._tag_index = None
+        self._columnar_view = None
+
+    def _count_resource(self, resource, delta):
+        if self._attribute_counts is not None:
+            for key in resource:
+                _update_count(self._attribute_counts, key, delta)
+        self._count_tags(resource.get("tags"), delta)
+
+    def _count_tags(self, tags, delta):
+        if self._tag_counts is not None and isinstance(tags, Tags):
+            for tag in tags:
+                _update_count(self._tag_counts, tag, delta)
+
+    def _resource_updated(self, resource, key, old_value, new_value):
+        """
+        Called by a resource in this collection when its attribute ``key`` is
+        set or deleted. A missing value is given as `resource.MISSING`.
+        """
+        self._columnar_view = None
+        index = self._name_index
+        if key == "name" and index is not None:
+            if (old_value is not MISSING and new_value is not MISSING and
+                    index.get(old_value) is resource and
+                    new_value not in index):
+                # Patch the index. Its order is fixed on next use of
+                # `resources`.
+                del index[old_value]
+                index[new_value] = resource
+                self._name_order_stale = True
+            else:
+                # Another resource has or had one of the names. Which
+                # resource a name refers to depends on their order, so
+                # rebuild.
+                self._name_index = None
+        if self._attribute_counts is not None:
+            if old_value is MISSING and new_value is not MISSING:
+                _update_count(self._attribute_counts, key, 1)
+            elif old_value is not MISSING and new_value is MISSING:
+                _update_count(self._attribute_counts, key, -1)
+        if key == "tags":
+            self._tag_index = None
+            self._count_tags(old_value, -1)
+            self._count_tags(new_value, 1)
+
+    def _resource_tags_updated(self, resource, added, removed):
+        """
+        Called by a resource in this collection when tags are added to or
+        removed from its `Tags` set.
+        """
+        self._tag_index = None
+        if self._tag_counts is not None:
+            for tag in added:
+                _update_count(self._tag_counts, tag, 1)
+            for tag in removed:
+                _update_count(self._tag_counts, tag, -1)
+
+    def _get_tag_index(self):
+        if self._tag_index is None:
+            from . import columnar
+            self._watch()
+            self._tag_index = columnar.TagIndex(self._resource_list)
+        return self._tag_index
+
+    def _get_columnar_view(self):
+        if self._columnar_view is None:
+            from . import columnar
+            self._watch()
+            self._columnar_view = columnar.ColumnarView(
+                self._resource_list, self.attributes)
+        self._columnar_view.tag_index = self._get_tag_index()
+        return self._columnar_view
+
     @property
     def tags(self):
         """
         The tags associated with any resources in this collection.
         """
-        result = set()
-        for resource in self:
-            result.update(resource.tags)
-        return result
+        if self._tag_counts is None:
+            self._watch()
+            self._tag_counts = {}
+            for resource in self:
+                self._count_tags(resource.get("tags"), 1)
+        return set(self._tag_counts)
 
     @property
     def attributes(self):
         """
         The attribute names used by resouces in this collection.
         """
-        result = set()
-        for resource in self:
-            result.update(resource)
-        return result
-
-    def filter(self, expression):
+        if self._attribute_counts is None:
+            self._watch()
+            counts = {}
+            for resource in self:
+                for key in resource:
+                    _update_count(counts, key, 1)
+            self._attribute_counts = counts
+        return set(self._attribute_counts)
+
+    def filter(self, expression, engine="python"):
         """
         Return a new collection containing only those resources for which
         ``expression`` evaluated to True.
@@ -104,16 +308,67 @@ class ResourceCollection(object):
             If a callable, then it will be called and passed this `Resource`
             instance as its argument.
 
+        engine : string, one of "python" or "columnar" [default: "python"]
+            If "columnar", try to evaluate a string expression with NumPy
+            operations over whole columns of the collection at once (see the
+            `columnar` module). This is much faster on large collections.
+            Expressions the columnar engine does not understand are evaluated
+            one resource at a time as usual, so the result is the same either
+            way.
+
+            Expressions consisting only of tag tests combined with "and",
+            "or", and "not" (e.g. "tags.foo and not tags.bar") are answered
+            from the collection's tag index when the collection has at least
+            `TAG_INDEX_MIN_RESOURCES` resources, or the index was already
+            built.
+
         Returns
         ----------
         A new ResourceCollection containing those resources for which
         `expression` evaluated to True.        
         """
+        if engine not in ("python", "columnar"):
+            raise ValueError("Unsupported engine: %s" % engine)
+        if typechecks.is_string(expression):
+            use_tag_index = (
+                self._tag_index is not None or
+                len(self._resource_list) >= TAG_INDEX_MIN_RESOURCES)
+            if engine == "columnar" or (
+                    use_tag_index and
+                    is_tag_expression(expression) and
+                    self._get_tag_index().untagged == 0):
+                from . import columnar
+                view = self._get_columnar_view()
+                try:
+                    mask = columnar.evaluate_filter(view, expression)
+                except columnar.Unsupported:
+                    pass
+                else:
+                    return self._subset(
+                        [view.resources[i] for i in mask.nonzero()[0]])
         extra_bindings = {key: None for key in self.attributes}
-        return ResourceCollection([
+        return self._subset([
             x for x in self
             if x.evaluate(expression, extra_bindings=extra_bindings)
-        ], self.filename)
+        ])
+
+    def head(self, n=5):
+        """
+        Return a new collection containing the first ``n`` resources.
+        """
+        return self._subset(self._resource_list[:n])
+
+    def lazy(self):
+        """
+        Return a `query.LazyCollection` over this collection.
+
+        Calls to ``filter`` and ``head`` on the result build up a query plan,
+        which is run by ``collect``, ``select``, or ``select_series``.
+        Consecutive string filters are combined into one ``filter`` call, so
+        no intermediate collections are created for them.
+        """
+        from .query import LazyCollection
+        return LazyCollection(self, self.filename)
 
     def singleton(self, raise_on_multiple=True):
         """
@@ -181,6 +436,26 @@ class ResourceCollection(object):
         A `pandas.DataFrame`. Rows correspond to resources. Columns correspond
         to the specified expressions.
         """
+        import pandas
+        labels_and_expressions = labeled_expressions(expressions)
+        df_dict = collections.OrderedDict(
+            (label, []) for (label, _) in labels_and_expressions)
+        for row in self.iter_select(*labels_and_expressions, **kwargs):
+            for (values, value) in zip(df_dict.values(), row):
+                values.append(value)
+
+        return pandas.DataFrame(df_dict)
+
+    def iter_select(self, *expressions, **kwargs):
+        """
+        Evaluate expressions on each resource, one resource at a time.
+
+        Takes the same arguments as `select`, but instead of a DataFrame
+        returns a generator giving, for each resource (except those skipped
+        with ``if_error="skip"``), a list of the values of the expressions.
+        The values are exactly as evaluated; unlike with `select`, pandas
+        does not convert them.
+        """
         if_error = kwargs.pop("if_error", "raise")
         if if_error == "raise" or if_error == "skip":
             error_value = Resource.RAISE
@@ -191,25 +466,7 @@ class ResourceCollection(object):
         if kwargs:
             raise TypeError("Invalid keyword arguments: %s" % " ".join(kwargs))
 
-        labels_and_expressions = []
-        expr_num = 1
-        for expression in expressions:
-            if isinstance(expression, tuple):
-                (label, expression) = expression
-            elif typechecks.is_string(expression):
-                match = re.match(r"^([\w\- ]+):(.*)$", expression)
-                if match is None:
-                    label = expression
-                else:
-                    (label, expression) = match.groups()
-            else:
-                label = "expr_%d" % expr_num
-                expr_num += 1
-            labels_and_expressions.append((label, expression))
-
-        df_dict = collections.OrderedDict(
-            (label, []) for (label, _) in labels_and_expressions)
-
+        labels_and_expressions = labeled_expressions(expressions)
         extra_bindings = {key: None for key in self.attributes}
 
         def values_for_resource(resource):
@@ -233,77 +490,105 @@ class ResourceCollection(object):
         for resource in self:
             row = values_for_resource(resource)
             if row is not None:
-                for ((label, _), value) in zip(labels_and_expressions, row):
-                    df_dict[label].append(value)
-
-        return pandas.DataFrame(df_dict)
+                yield row
 
     def __getitem__(self, index_or_key):
-        if isinstance(index_or_key, (int, slice)):
-            return list(self.resources.values())[index_or_key]
-        try:
-            result = self.resources[index_or_key]
-            if result.name != index_or_key:
-                raise KeyError
-            return result
-        except KeyError:
-            # Rebuild dictionary since names may have changed.
-            self.resources = collections.OrderedDict(
-                (x.name, x) for x in self)
-            return self.resources[index_or_key]
+        if isinstance(index_or_key, (numbers.Integral, slice)):
+            return self._resource_list[index_or_key]
+        return self._get_name_index()[index_or_key]
 
     def __len__(self):
-        return len(self.resources)
+        return len(self._resource_list)
 
     def __iter__(self):
-        return iter(self.resources.values())
+        return iter(self._resource_list)
 
     def to_plain_types(self):
         """
         Return a representation of this collection using Python dicts, lists,
         and strings.
         """
-        result = collections.OrderedDict()
+        return collections.OrderedDict(self._iter_plain_types())
+
+    def _iter_plain_types(self):
+        """
+        Generate (name, plain types) pairs for the resources in this
+        collection, where plain types is as given by
+        `Resource.to_plain_types`.
+        """
         for resource in self:
-            result[resource.name] = resource.to_plain_types()
-        return result
+            yield (resource["name"], resource.to_plain_types())
 
     def to_json(self, indent=4):
         """
         Return a string giving this collection represented as JSON.
         """
-        return json.dumps(self.to_plain_types(), indent=indent)
+        return "".join(self.iter_json(indent=indent))
+
+    def iter_json(self, indent=4):
+        """
+        Generate the JSON representation of this collection in pieces, one
+        resource at a time. Joined together, the pieces are the same as
+        `to_json`, and as ``json.dumps`` of `to_plain_types`.
+        """
+        if indent is None:
+            (start, separator, end) = ("{", ", ", "}")
+            spaces = None
+        else:
+            spaces = " " * indent
+            (start, separator, end) = ("{\n" + spaces, ",\n" + spaces, "\n}")
+        first = True
+        for (name, plain_types) in self._iter_plain_types():
+            value = json.dumps(plain_types, indent=indent)
+            if spaces:
+                value = value.replace("\n", "\n" + spaces)
+            yield "%s%s: %s" % (
+                start if first else separator, json.dumps(name), value)
+            first = False
+        yield "{}" if first else end
 
     def to_python(self, indent=4):
         """
         Return a string giving this collection represented as Python code.
         """
-        lines = []
+        return "".join(self.iter_python(indent=indent))
 
-        def w(s=''):
-            lines.append(s)
+    def iter_python(self, indent=4, command=None):
+        """
+        Generate the Python code representing this collection in pieces, one
+        resource at a time. Joined together, the pieces are the same as
+        `to_python`.
 
-        w("# Generated on %s by %s with the command:"
-            % (datetime.datetime.now(), getpass.getuser()))
-        w("# " + " ".join(util.shell_quote(x) for x in sys.argv))
-        w()
-        w("from sefara import export")
-        w()
+        The code starts with a comment giving the time, user, and
+        ``command`` (a list of strings, default: ``sys.argv``).
+        """
+        if command is None:
+            command = sys.argv
+        yield "# Generated on %s by %s with the command:\n" % (
+            datetime.datetime.now(), getpass.getuser())
+        yield "# " + " ".join(util.shell_quote(x) for x in command) + "\n"
+        yield "\nfrom sefara import export\n"
         spaces = " " * indent
-        for resource in self:
-            w("export(")
-            w(spaces + "name=%s," % json.dumps(resource.name))
-            plain_types = resource.to_plain_types()
-            w(spaces + "tags=%s," % json.dumps(plain_types.pop('tags', [])))
+        for (name, plain_types) in self._iter_plain_types():
+            lines = ["", "export("]
+            lines.append(spaces + "name=%s," % json.dumps(name))
+            lines.append(
+                spaces + "tags=%s," % json.dumps(plain_types.pop('tags', [])))
             for (key, value) in plain_types.items():
                 json_value = json.dumps(value, indent=indent)
                 indented = json_value.replace("\n", "\n" + spaces)
-                w(spaces + "%s=%s," % (key, indented))
+                lines.append(spaces + "%s=%s," % (key, indented))
             lines[-1] = lines[-1][:-1] + ")"  # Drop last comma and close paren
-            w()
-        return "\n".join(lines)
-
-    def write(self, file=None, format=None, indent=None):
+            lines.append("")
+            yield "\n".join(lines)
+
+    def write(
+            self,
+            file=None,
+            format=None,
+            indent=None,
+            compression=None,
+            compression_level=None):
         """
         Serialize this collection to disk.
 
@@ -312,40 +597,85 @@ class ResourceCollection(object):
         file : string or file handle [optional, default: sys.stdout]
             Path or file handle to write to.
 
-        format : string, one of "python" or "json" [optional]
+        format : string, one of "python", "json", "parquet" or "feather"
+            [optional]
             Output format. If not specified, it is guessed from the filename
-            extension.
+            extension. Parquet and Feather require the pyarrow package; see
+            the `arrow` module. File handles for these formats must be open
+            in binary mode.
 
         indent : int [optional]
             Number of spaces to use for indentation.
+
+        compression : string [optional]
+            For Python and JSON, one of "gzip", "xz" or "zstd" to compress
+            the output. If not specified, it is guessed from the filename
+            extension, e.g. "collection.json.gz". A file handle given with a
+            compression must be open in binary mode. For Parquet and Feather,
+            the compression codec used by pyarrow, e.g. "zstd".
+
+        compression_level : int [optional]
+            Compression level, from 1 (fastest) to 9 (smallest), or up to 22
+            for "zstd". Default: see `compression.DEFAULT_LEVELS`.
         """
+        if typechecks.is_string(file) and format is None:
+            path = compression_module.strip_extension(file)
+            if path.endswith(".json"):
+                format = "json"
+            elif path.endswith(".py"):
+                format = "python"
+            else:
+                format = arrow.format_from_extension(path)
+            if format is None:
+                raise ValueError(
+                    "Couldn't guess format from filename: %s" % file)
+        elif format is None:
+            format = "python"
+
+        if format in arrow.FORMATS:
+            if not file:
+                file = getattr(sys.stdout, "buffer", sys.stdout)
+            arrow.write(
+                self,
+                file,
+                format,
+                compression=compression,
+                compression_level=compression_level)
+            return
+
         close_on_exit = False
         if typechecks.is_string(file):
-            fd = open(file, "w")
+            if compression is None:
+                compression = compression_module.from_extension(file)
+            fd = open(file, "wb" if compression else "w")
             close_on_exit = True
-            if format is None:
-                if file.endswith(".json"):
-                    format = "json"
-                elif file.endswith(".py"):
-                    format = "python"
-                else:
-                    raise ValueError(
-                        "Couldn't guess format from filename: %s" % file)
         elif not file:
             fd = sys.stdout
-            if format is None:
-                format = "python"
+            if compression:
+                fd = getattr(sys.stdout, "buffer", sys.stdout)
         else:
             fd = file
         try:
+            # Each resource is written as soon as it is serialized, so the
+            # whole output is never held in memory.
             extra_args = {} if indent is None else {"indent": indent}
             if format == "json":
-                value = self.to_json(**extra_args)
+                pieces = self.iter_json(**extra_args)
             elif format == "python":
-                value = self.to_python(**extra_args)
+                pieces = self.iter_python(**extra_args)
             else:
                 raise ValueError("Unsupported format: %s" % format)
-            fd.write(value)
+            if compression:
+                writer = compression_module.compressing_writer(
+                    fd, compression, compression_level)
+                try:
+                    for piece in pieces:
+                        writer.write(piece.encode("utf-8"))
+                finally:
+                    writer.close()
+            else:
+                for piece in pieces:
+                    fd.write(piece)
         finally:
             if close_on_exit:
                 fd.close()
@@ -380,7 +710,51 @@ class ResourceCollection(object):
 
     def __eq__(self, other):
         return (isinstance(other, ResourceCollection)
-            and self.resources == other.resources)
+            and len(self) == len(other)
+            and all(a == b for (a, b) in zip(self, other)))
 
     def __repr__(self):
         return str(self)
+
+def _distinct_names(resources):
+    """
+    Return a list of the given resources, where a resource whose name
+    appeared earlier replaces the earlier one at its position.
+    """
+    names = [x["name"] for x in resources]
+    if len(set(names)) == len(names):
+        return list(resources)
+    return list(collections.OrderedDict(zip(names, resources)).values())
+
+def _update_count(counts, key, delta):
+    """
+    Add ``delta`` to the reference count of ``key`` in the ``counts`` dict,
+    removing it when the count reaches zero.
+    """
+    count = counts.get(key, 0) + delta
+    if count:
+        counts[key] = count
+    else:
+        del counts[key]
+
+def labeled_expressions(expressions):
+    """
+    Parse the expressions given to `ResourceCollection.select` into a list of
+    (label, expression) pairs.
+    """
+    result = []
+    expr_num = 1
+    for expression in expressions:
+        if isinstance(expression, tuple):
+            (label, expression) = expression
+        elif typechecks.is_string(expression):
+            match = re.match(r"^([\w\- ]+):(.*)$", expression)
+            if match is None:
+                label = expression
+            else:
+                (label, expression) = match.groups()
+        else:
+            label = "expr_%d" % expr_num
+            expr_num += 1
+        result.append((label, expression))
+    return result
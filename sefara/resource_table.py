@@ -0,0 +1,788 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A columnar storage backend for resource collections.
+
+A `ResourceTable` holds its resources as columns instead of as a dict of
+per-resource objects:
+
+    - each attribute is a NumPy array; attributes whose values are mostly
+      repeated strings are dictionary encoded (an integer code per row
+      indexing a list of the distinct values),
+    - tags are stored as an index per row into a list of the distinct
+      sorted tuples of tags; a bitmap (one NumPy boolean array per tag) is
+      built from it for tags used in filters.
+
+It supports the `ResourceCollection` API. Resource objects (`CompactResource`
+instances) are created only when a caller asks for one, for example by
+indexing or iterating over the table, and modifying them updates the
+columns. They are discarded once nothing else refers to them. `filter` and
+`select` work on the columns directly where they can.
+
+Tables returned by `filter` share storage with the table they came from.
+As with `ResourceCollection`, modifying a resource obtained from a filtered
+table modifies it in the original table too.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import numbers
+import re
+import weakref
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # py2
+    from collections import Mapping
+
+import numpy
+import six
+import typechecks
+
+from . import columnar
+from .compact import CompactResource, TagVocabulary
+from .resource import MISSING
+from .resource_collection import ResourceCollection, labeled_expressions
+
+def _grown(array, capacity, fill):
+    """
+    Return a copy of ``array`` extended to length ``capacity``, with the new
+    entries set to ``fill``.
+    """
+    result = numpy.empty(capacity, dtype=array.dtype)
+    result[:len(array)] = array
+    result[len(array):] = fill
+    return result
+
+class _Column(object):
+    """
+    The values of one attribute for every row of a `_Store`.
+    """
+    def __init__(self, length):
+        self.present = numpy.zeros(length, dtype=bool)
+
+        # Either ``values`` is an object array of the values, or ``codes``
+        # gives an index into ``categories`` for each row (-1 if missing).
+        self.values = numpy.empty(length, dtype=object)
+        self.codes = None
+        self.categories = None
+        self._category_ids = None
+        self._category_array = None
+
+    @classmethod
+    def from_values(cls, length, rows, values):
+        """
+        Create a column with the given values at the given row indices.
+        """
+        column = cls(length)
+        column.present[rows] = True
+        if values and all(isinstance(x, six.string_types) for x in values):
+            ids = {}
+            codes = [ids.setdefault(x, len(ids)) for x in values]
+            if len(ids) <= len(values) // 2:
+                column.values = None
+                column.codes = numpy.repeat(numpy.int32(-1), length)
+                column.codes[rows] = codes
+                column.categories = [None] * len(ids)
+                for (value, code) in ids.items():
+                    column.categories[code] = value
+                column._category_ids = ids
+                return column
+        array = numpy.empty(len(values), dtype=object)
+        for (i, value) in enumerate(values):
+            array[i] = value
+        column.values[rows] = array
+        return column
+
+    def get(self, rows):
+        """
+        Return an object array giving the value at each of the given rows,
+        or None where the value is missing.
+        """
+        if self.codes is None:
+            return self.values[rows]
+        return self._categories_with_missing()[self.codes[rows]]
+
+    def get_typed(self, rows):
+        """
+        Like `get`, but return the values as given by
+        `columnar.typed_column`. Dictionary encoded columns are passed on
+        without decoding.
+        """
+        if self.codes is None:
+            return columnar.typed_column(self.values[rows])
+        codes = self.codes[rows].astype(numpy.int64)
+        codes[codes < 0] = len(self.categories)
+        return columnar._Categorical(codes, self._categories_with_missing())
+
+    def _categories_with_missing(self):
+        if self._category_array is None:
+            # Code -1 indexes the trailing None.
+            self._category_array = numpy.empty(
+                len(self.categories) + 1, dtype=object)
+            for (i, value) in enumerate(self.categories):
+                self._category_array[i] = value
+        return self._category_array
+
+    def get_one(self, row):
+        """
+        Return the value at the given row, or `MISSING`.
+        """
+        if not self.present[row]:
+            return MISSING
+        if self.codes is None:
+            return self.values[row]
+        return self.categories[self.codes[row]]
+
+    def set(self, row, value):
+        self.present[row] = True
+        if self.codes is not None:
+            if isinstance(value, six.string_types):
+                code = self._category_ids.get(value)
+                if code is None:
+                    code = self._category_ids[value] = len(self.categories)
+                    self.categories.append(value)
+                    self._category_array = None
+                self.codes[row] = code
+                return
+            self.values = self.get(slice(None))
+            self.codes = self.categories = self._category_ids = None
+            self._category_array = None
+        self.values[row] = value
+
+    def delete(self, row):
+        self.present[row] = False
+        if self.codes is None:
+            self.values[row] = None
+        else:
+            self.codes[row] = -1
+
+    def grow(self, capacity):
+        """
+        Extend the column to ``capacity`` rows, with the new values missing.
+        """
+        self.present = _grown(self.present, capacity, False)
+        if self.codes is None:
+            self.values = _grown(self.values, capacity, None)
+        else:
+            self.codes = _grown(self.codes, capacity, -1)
+
+class _Store(object):
+    """
+    Column storage shared by one or more `ResourceTable` instances.
+
+    Rows are never removed from a store; tables refer to a subset of rows.
+
+    The arrays have room for ``capacity`` rows, of which the first ``length``
+    are in use. When a row is appended to a full store the capacity is
+    doubled, so appending rows one at a time takes amortized constant time.
+    """
+    def __init__(self, field_dicts, vocabulary=None):
+        """
+        Parameters
+        ----------
+        field_dicts : list of dicts
+            The attributes of each resource, in order. Each must include a
+            "name".
+
+        vocabulary : `TagVocabulary` [optional]
+            Vocabulary to use for the tags of resources created from this
+            store.
+        """
+        self.vocabulary = vocabulary or TagVocabulary()
+        self.length = self.capacity = len(field_dicts)
+        self.layouts = []
+        self._layout_ids = {}
+
+        # Distinct tuples of tags (as given by `TagVocabulary.encode`), and
+        # for each row the index of its tags in that list, or -1 if it has
+        # no "tags" attribute.
+        self.tag_sets = []
+        self._tag_set_ids = {}
+
+        layout_ids = []
+        tag_set_ids = []
+        values = collections.defaultdict(lambda: ([], []))
+        for (row, fields) in enumerate(field_dicts):
+            layout_ids.append(self._layout_id(tuple(fields)))
+            tag_set_ids.append(-1)
+            for (key, value) in fields.items():
+                if key == "tags":
+                    tag_set_ids[-1] = self._tag_set_id(value)
+                else:
+                    (rows, column_values) = values[key]
+                    rows.append(row)
+                    column_values.append(value)
+        self.row_layouts = numpy.array(layout_ids, dtype=numpy.int32)
+        self.row_tag_sets = numpy.array(tag_set_ids, dtype=numpy.int32)
+        self.columns = dict(
+            (key, _Column.from_values(self.length, rows, column_values))
+            for (key, (rows, column_values)) in values.items())
+
+        # Boolean array per tag giving which rows have it. Built by
+        # `tag_mask` when first needed, then kept up to date.
+        self._tag_masks = {}
+
+        # Name -> row, or a list of rows if several rows have that name.
+        # Rows not in any table (e.g. removed ones) are left in the index,
+        # and different tables sharing this store can each have a resource
+        # with the same name.
+        self.name_index = {}
+        if "name" in self.columns:
+            for (row, name) in enumerate(self.columns["name"].get(
+                    slice(None))):
+                self._index_name(name, row)
+
+        # Resources in use, by row, and the reverse mapping from id() to
+        # (row, weak reference). Resources no longer referenced elsewhere
+        # are dropped, and created again from the columns when needed.
+        self.materialized = weakref.WeakValueDictionary()
+        self._rows_by_id = {}
+
+        # Incremented on every modification; tables use it to invalidate
+        # cached summaries.
+        self.version = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["materialized"]
+        del state["_rows_by_id"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.materialized = weakref.WeakValueDictionary()
+        self._rows_by_id = {}
+
+    def _index_name(self, name, row):
+        rows = self.name_index.get(name)
+        if rows is None:
+            self.name_index[name] = row
+        elif isinstance(rows, list):
+            rows.append(row)
+        else:
+            self.name_index[name] = [rows, row]
+
+    def _unindex_name(self, name, row):
+        rows = self.name_index.get(name)
+        if isinstance(rows, list):
+            if row in rows:
+                rows.remove(row)
+            if len(rows) == 1:
+                self.name_index[name] = rows[0]
+        elif rows == row:
+            del self.name_index[name]
+
+    def rows_named(self, name):
+        """
+        Return the list of rows with the given name.
+        """
+        rows = self.name_index.get(name)
+        if rows is None:
+            return []
+        if isinstance(rows, list):
+            return list(rows)
+        return [rows]
+
+    def _layout_id(self, keys):
+        try:
+            return self._layout_ids[keys]
+        except KeyError:
+            self.layouts.append(keys)
+            return self._layout_ids.setdefault(keys, len(self.layouts) - 1)
+
+    def _tag_set_id(self, tags):
+        """
+        Return the index in ``tag_sets`` of the given tags, adding them if
+        needed.
+        """
+        key = self.vocabulary.encode(tags)  # Validates the tags.
+        try:
+            return self._tag_set_ids[key]
+        except KeyError:
+            self.tag_sets.append(key)
+            return self._tag_set_ids.setdefault(key, len(self.tag_sets) - 1)
+
+    def tag_mask(self, tag):
+        """
+        Return a boolean array giving which rows have the given tag. It has
+        ``capacity`` entries and must not be modified.
+        """
+        try:
+            return self._tag_masks[tag]
+        except KeyError:
+            pass
+        # Indexed by tag set id; the extra entry at -1 is for untagged rows.
+        has_tag = numpy.zeros(len(self.tag_sets) + 1, dtype=bool)
+        for (i, tags) in enumerate(self.tag_sets):
+            has_tag[i] = tag in tags
+        return self._tag_masks.setdefault(tag, has_tag[self.row_tag_sets])
+
+    def row_tags(self, row):
+        tag_set_id = self.row_tag_sets[row]
+        return list(self.tag_sets[tag_set_id]) if tag_set_id >= 0 else []
+
+    def row_fields(self, row):
+        """
+        Return the attributes of the given row as a dict, with tags given as
+        a list.
+        """
+        fields = collections.OrderedDict()
+        for key in self.layouts[self.row_layouts[row]]:
+            if key == "tags":
+                fields[key] = self.row_tags(row)
+            else:
+                fields[key] = self.columns[key].get_one(row)
+        return fields
+
+    def materialize(self, row):
+        """
+        Return the resource for the given row, creating it if needed.
+        """
+        row = int(row)
+        try:
+            return self.materialized[row]
+        except KeyError:
+            pass
+        fields = self.row_fields(row)
+        has_tags = "tags" in fields
+        resource = CompactResource._from_fields(
+            fields, vocabulary=self.vocabulary)
+        if not has_tags:
+            del resource["tags"]
+        resource = self.materialized.setdefault(row, resource)
+        self._track(row, resource)
+        resource._add_owner(self)
+        return resource
+
+    def _track(self, row, resource):
+        key = id(resource)
+        if key in self._rows_by_id:
+            return
+        rows_by_id = self._rows_by_id
+
+        def forget(reference):
+            if rows_by_id.get(key, (None, None))[1] is reference:
+                del rows_by_id[key]
+        rows_by_id[key] = (row, weakref.ref(resource, forget))
+
+    def append(self, resource):
+        """
+        Add a resource as a new row, and return the row index.
+        """
+        row = self.length
+        if row == self.capacity:
+            self._grow(max(1, 2 * self.capacity))
+        self.length += 1
+        self.materialized[row] = resource
+        self._track(row, resource)
+        for (key, value) in resource.items():
+            self._set(row, key, MISSING, value)
+        self.row_layouts[row] = self._layout_id(tuple(resource.keys()))
+        resource._add_owner(self)
+        self.version += 1
+        return row
+
+    def _grow(self, capacity):
+        for column in self.columns.values():
+            column.grow(capacity)
+        for (tag, mask) in list(self._tag_masks.items()):
+            self._tag_masks[tag] = _grown(mask, capacity, False)
+        self.row_tag_sets = _grown(self.row_tag_sets, capacity, -1)
+        self.row_layouts = _grown(
+            self.row_layouts, capacity, self._layout_id(()))
+        self.capacity = capacity
+
+    def _set(self, row, key, old_value, new_value):
+        if key == "tags":
+            self._set_tags(
+                row, None if new_value is MISSING else set(new_value))
+            return
+        if key == "name":
+            if old_value is not MISSING:
+                self._unindex_name(old_value, row)
+            if new_value is not MISSING:
+                self._index_name(new_value, row)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = _Column(self.capacity)
+        if new_value is MISSING:
+            column.delete(row)
+        else:
+            column.set(row, new_value)
+
+    def _set_tags(self, row, tags):
+        """
+        Set the tags of a row to the given set, or None if the row has no
+        "tags" attribute.
+        """
+        old_tags = set(self.row_tags(row))
+        self.row_tag_sets[row] = (
+            -1 if tags is None else self._tag_set_id(tags))
+        for tag in old_tags.symmetric_difference(tags or ()):
+            mask = self._tag_masks.get(tag)
+            if mask is not None:
+                mask[row] = tag not in old_tags
+
+    # Notifications from materialized resources.
+
+    def _resource_updated(self, resource, key, old_value, new_value):
+        (row, _) = self._rows_by_id[id(resource)]
+        self._set(row, key, old_value, new_value)
+        self.row_layouts[row] = self._layout_id(tuple(resource.keys()))
+        self.version += 1
+
+    def _resource_tags_updated(self, resource, added, removed):
+        (row, _) = self._rows_by_id[id(resource)]
+        tags = set(self.row_tags(row))
+        tags.update(added)
+        tags.difference_update(removed)
+        self._set_tags(row, tags)
+        self.version += 1
+
+class ResourceTable(ResourceCollection):
+    """
+    A `ResourceCollection` stored as columns.
+
+    Construct one with `from_resources` or `from_plain_types`, or by passing
+    ``table=True`` to `load` or `loads`.
+    """
+    def __init__(self, store, rows=None, filename="<no file>"):
+        """
+        Create a table from a `_Store`. Use `from_resources` or
+        `from_plain_types` instead of calling this directly.
+
+        Parameters
+        ----------
+        store : `_Store`
+
+        rows : NumPy integer array [optional]
+            Rows of the store in this table, in order. Default: all rows.
+
+        filename : string [optional]
+            Filename these resources were loaded from. Used in error messages.
+        """
+        self._store = store
+        if rows is None:
+            rows = numpy.arange(store.length)
+        self._rows = rows
+        # When not None, an array whose first len(self._rows) entries are
+        # ``_rows``, with room to add more (see `add`).
+        self._row_buffer = None
+        self.filename = filename
+        self._positions = None
+        self._summary_version = None
+        self._summaries = {}
+
+    def __getstate__(self):
+        return {
+            "store": self._store,
+            "rows": self._rows,
+            "filename": self.filename,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["store"], state["rows"], state["filename"])
+
+    @classmethod
+    def from_resources(cls, resources, filename="<no file>"):
+        """
+        Create a table from a list of `Resource` instances.
+        """
+        if isinstance(resources, ResourceCollection):
+            resources = list(resources)
+        elif isinstance(resources, Mapping):
+            resources = list(resources.values())
+        by_name = collections.OrderedDict(
+            (resource["name"], resource) for resource in resources)
+        return cls(
+            _Store([dict(resource.items()) for resource in by_name.values()]),
+            filename=filename)
+
+    @classmethod
+    def from_plain_types(cls, data, filename="<no file>"):
+        """
+        Create a table from a dict mapping resource names to dicts of
+        attributes, as in JSON collections, or an iterable of (name,
+        attributes) pairs.
+        """
+        if not isinstance(data, Mapping):
+            data = collections.OrderedDict(data)
+        field_dicts = []
+        for (name, value) in data.items():
+            # Same attribute order as Resource(name=name, **value).
+            fields = collections.OrderedDict(value)
+            fields["name"] = name
+            fields.setdefault("tags", [])
+            field_dicts.append(fields)
+        return cls(_Store(field_dicts), filename=filename)
+
+    def _take(self, positions):
+        """
+        Return a new table with the rows at the given positions of this one.
+        """
+        return ResourceTable(
+            self._store, self._rows[positions], filename=self.filename)
+
+    def _position(self, row):
+        if self._positions is None:
+            self._positions = dict(
+                (int(r), i) for (i, r) in enumerate(self._rows))
+        return self._positions[row]
+
+    def _row(self, name):
+        """
+        Return the store row of the resource in this table with the given
+        name. Raises KeyError if there is none.
+        """
+        for row in self._store.rows_named(name):
+            try:
+                self._position(row)
+            except KeyError:
+                continue
+            return row
+        raise KeyError(name)
+
+    def _summary(self, name, compute):
+        """
+        Return a cached value, recomputing it if the store has changed.
+        """
+        if self._summary_version != self._store.version:
+            self._summaries = {}
+            self._summary_version = self._store.version
+        try:
+            return self._summaries[name]
+        except KeyError:
+            return self._summaries.setdefault(name, compute())
+
+    @property
+    def resources(self):
+        """
+        Mapping from name to resource.
+        """
+        return _NameMap(self)
+
+    @property
+    def tags(self):
+        """
+        The tags associated with any resources in this collection.
+        """
+        store = self._store
+        rows = self._rows
+
+        def compute():
+            result = set()
+            for tag_set_id in numpy.unique(store.row_tag_sets[rows]):
+                if tag_set_id >= 0:
+                    result.update(store.tag_sets[tag_set_id])
+            return result
+        return set(self._summary("tags", compute))
+
+    @property
+    def attributes(self):
+        """
+        The attribute names used by resouces in this collection.
+        """
+        rows = self._rows
+
+        def compute():
+            result = [
+                key for (key, column) in self._store.columns.items()
+                if column.present[rows].any()
+            ]
+            if (self._store.row_tag_sets[rows] >= 0).any():
+                result.append("tags")
+            return result
+        return set(self._summary("attributes", compute))
+
+    def add(self, resource):
+        """
+        Add a resource to the end of this table.
+
+        Raises ValueError if there is already a resource with the same name.
+        """
+        if resource["name"] in self.resources:
+            raise ValueError("Duplicate resource name: %s" % resource["name"])
+        row = self._store.append(resource)
+        length = len(self._rows)
+        if self._row_buffer is None or length == len(self._row_buffer):
+            self._row_buffer = _grown(self._rows, max(1, 2 * length), 0)
+        self._row_buffer[length] = row
+        self._rows = self._row_buffer[:length + 1]
+        if self._positions is not None:
+            self._positions[row] = length
+
+    def remove(self, name):
+        """
+        Remove the resource with the given name from this table and return
+        it.
+        """
+        row = self._row(name)
+        resource = self._store.materialize(row)
+        position = self._position(row)
+        self._rows = numpy.delete(self._rows, position)
+        self._row_buffer = None
+        self._positions = None
+        self._store.version += 1
+        return resource
+
+    def filter(self, expression, engine="columnar"):
+        """
+        Return a new table containing only those resources for which
+        ``expression`` evaluated to True.
+
+        See `ResourceCollection.filter`. Unlike there, the columnar engine is
+        the default; give ``engine="python"`` to evaluate the expression on
+        each resource in turn.
+        """
+        if engine not in ("python", "columnar"):
+            raise ValueError("Unsupported engine: %s" % engine)
+        if engine == "columnar" and typechecks.is_string(expression):
+            try:
+                mask = columnar.evaluate_filter(_TableView(self), expression)
+            except columnar.Unsupported:
+                pass
+            else:
+                return self._take(mask.nonzero()[0])
+        extra_bindings = dict((key, None) for key in self.attributes)
+        mask = numpy.array([
+            bool(x.evaluate(expression, extra_bindings=extra_bindings))
+            for x in self
+        ], dtype=bool)
+        return self._take(mask.nonzero()[0])
+
+    def head(self, n=5):
+        """
+        Return a new table containing the first ``n`` resources.
+        """
+        return self._take(slice(0, n))
+
+    def select(self, *expressions, **kwargs):
+        """
+        Select fields (or expressions) from each resource as a pandas
+        DataFrame.
+
+        See `ResourceCollection.select`. Expressions that just name an
+        attribute are read directly from the columns.
+        """
+        attributes = self.attributes
+        labels_and_expressions = labeled_expressions(expressions)
+        if not all(
+                typechecks.is_string(expression) and
+                expression.strip() in attributes and
+                expression.strip() != "tags" and
+                re.match(r"^[A-Za-z_]\w*$", expression.strip())
+                for (_, expression) in labels_and_expressions):
+            return ResourceCollection.select(self, *expressions, **kwargs)
+        import pandas
+        if kwargs.pop("if_error", "raise") not in ("raise", "skip", "none"):
+            raise TypeError("if_error should be 'raise', 'skip', or 'none'")
+        if kwargs:
+            raise TypeError("Invalid keyword arguments: %s" % " ".join(kwargs))
+        return pandas.DataFrame(collections.OrderedDict(
+            (label, self._column(expression.strip()).tolist())
+            for (label, expression) in labels_and_expressions))
+
+    def _column(self, key):
+        return self._store.columns[key].get(self._rows)
+
+    def __getitem__(self, index_or_key):
+        if isinstance(index_or_key, numbers.Integral):
+            return self._store.materialize(self._rows[index_or_key])
+        if isinstance(index_or_key, slice):
+            return [self._store.materialize(row)
+                    for row in self._rows[index_or_key]]
+        return self._store.materialize(self._row(index_or_key))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        materialize = self._store.materialize
+        for row in self._rows:
+            yield materialize(row)
+
+    def _iter_plain_types(self):
+        store = self._store
+        rows = self._rows
+        values = dict((key, self._column(key)) for key in store.columns)
+        tag_set_ids = store.row_tag_sets[rows]
+        layouts = store.row_layouts[rows]
+        for position in range(len(rows)):
+            result = collections.OrderedDict()
+            keys = store.layouts[layouts[position]]
+            if "tags" in keys:
+                result["tags"] = list(store.tag_sets[tag_set_ids[position]])
+            for key in keys:
+                if key not in ("name", "tags"):
+                    result[key] = values[key][position]
+            yield (values["name"][position], result)
+
+class _TableView(object):
+    """
+    Adapts a `ResourceTable` to the interface of `columnar.ColumnarView`.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.attributes = table.attributes
+        self._columns = {}
+        self._typed_columns = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    def column(self, name):
+        try:
+            return self._columns[name]
+        except KeyError:
+            return self._columns.setdefault(name, self.table._column(name))
+
+    def typed_column(self, name):
+        try:
+            return self._typed_columns[name]
+        except KeyError:
+            return self._typed_columns.setdefault(
+                name,
+                self.table._store.columns[name].get_typed(self.table._rows))
+
+    def tag_mask(self, tag):
+        rows = self.table._rows
+        if (self.table._store.row_tag_sets[rows] < 0).any():
+            raise columnar.Unsupported("Some resources have no tags")
+        return self.table._store.tag_mask(tag)[rows]
+
+class _NameMap(Mapping):
+    """
+    Read-only mapping from name to resource for a `ResourceTable`.
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, name):
+        return self.table[name]
+
+    def __iter__(self):
+        return iter(self.table._column("name"))
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, name):
+        try:
+            self.table[name]
+        except KeyError:
+            return False
+        return True
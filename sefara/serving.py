@@ -0,0 +1,515 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A daemon keeping collections loaded, for the commandline tools.
+
+`sefara-serve` runs a `Server` listening on a Unix socket: by default
+"serve.sock" in the cache directory (see the `snapshot` module), or the path
+given by the SEFARA_SERVE_SOCKET environment variable. While it is running,
+`sefara-select`, `sefara-dump` and `sefara-check` send their arguments to it
+instead of loading the collection themselves. The daemon keeps each
+collection it loads (after filters and transforms), and loads it again only
+when the collection files, or the hook files run while loading them, change.
+
+The socket is accessible only to the user running the daemon, and where the
+platform reports the user of a connecting process (SO_PEERCRED, on Linux),
+connections from other users are refused.
+
+The daemon only answers requests from a process with the same working
+directory and the same sefara environment variables as its own. Otherwise,
+or if no daemon is running, the tools load the collection themselves, so
+their output is the same either way.
+
+The protocol is JSON, one message per line. A request gives the command and
+its arguments. The daemon replies with {"loaded": true} once the collection
+is loaded, then {"output": TEXT} messages giving the command's output, then
+{"done": true}. If the command fails, it replies with {"error": MESSAGE,
+"exception": NAME} instead, and if it can't answer the request, with
+{"unsupported": REASON}.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import glob
+import importlib
+import json
+import os
+import socket
+import struct
+import threading
+
+from six.moves import builtins
+
+from . import environment, snapshot, util
+
+PROTOCOL_VERSION = 1
+
+# Commands the daemon runs.
+COMMANDS = ("check", "dump", "select")
+
+# Number of loaded collections the daemon keeps.
+DEFAULT_MAX_COLLECTIONS = 16
+
+# Output is sent in messages of about this many characters.
+OUTPUT_CHUNK_SIZE = 2**16
+
+# Arguments to the commandline tools that determine the loaded collection.
+LOAD_ARGUMENTS = (
+    "collections",
+    "merge",
+    "filter",
+    "transform",
+    "environment_transforms",
+    "load_jobs",
+    "on_conflict",
+)
+
+class RemoteError(Exception):
+    """
+    An error raised by the daemon that has no corresponding exception type
+    here.
+    """
+
+def socket_path():
+    """
+    Path of the daemon's Unix socket.
+    """
+    return (
+        os.environ.get(environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE) or
+        os.path.join(snapshot.cache_directory(), "serve.sock"))
+
+def environment_signature():
+    """
+    Values of the environment variables that can change a command's output.
+    The daemon only answers requests made with the same values as its own.
+    """
+    names = [
+        environment.TRANSFORM_ENVIRONMENT_VARIABLE,
+        environment.CHECKER_ENVIRONMENT_VARIABLE,
+        environment.CACHE_DIR_ENVIRONMENT_VARIABLE,
+        environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE,
+        environment.HTTP_TTL_ENVIRONMENT_VARIABLE,
+        environment.OFFLINE_ENVIRONMENT_VARIABLE,
+        environment.CHDIR_ENVIRONMENT_VARIABLE,
+    ]
+    names.extend(
+        name.strip()
+        for name in os.environ.get(
+            environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE, "").split(":")
+        if name.strip())
+    return dict((name, os.environ.get(name)) for name in names)
+
+def _send(fd, message):
+    fd.write((json.dumps(message) + "\n").encode("utf-8"))
+    fd.flush()
+
+def _receive(fd):
+    line = fd.readline()
+    if not line:
+        raise IOError("Connection to the sefara-serve daemon closed")
+    return json.loads(line.decode("utf-8"))
+
+def _remote_exception(message):
+    name = message.get("exception")
+    if name == "NoCheckers":
+        from .hooks import NoCheckers
+        return NoCheckers(message["error"])
+    exception_type = getattr(builtins, name or "", None)
+    if isinstance(exception_type, type) and issubclass(
+            exception_type, Exception):
+        return exception_type(message["error"])
+    return RemoteError("%s: %s" % (name, message["error"]))
+
+class _Connection(object):
+    """
+    A connection to the daemon.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.fd = connection.makefile("rwb")
+
+    def replies(self):
+        """
+        Generator of the daemon's replies. Closes the connection when
+        finished.
+        """
+        try:
+            while True:
+                yield _receive(self.fd)
+        finally:
+            self.close()
+
+    def close(self):
+        self.fd.close()
+        self.connection.close()
+
+def request(message, path=None):
+    """
+    Send a request to the daemon.
+
+    Returns a `_Connection` to read the replies from, or None if no daemon is
+    listening.
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except socket.error:
+        # A socket left behind by a daemon that is no longer running.
+        connection.close()
+        return None
+    result = _Connection(connection)
+    try:
+        _send(result.fd, message)
+    except (IOError, socket.error):
+        result.close()
+        return None
+    return result
+
+def run_command(command, arguments, path=None):
+    """
+    Run a commandline tool in the daemon.
+
+    Parameters
+    ----------
+    command : string
+        One of `COMMANDS`.
+
+    arguments : dict
+        The tool's parsed arguments. Relative paths in them are resolved in
+        the daemon's working directory, which is the same as this process's:
+        the daemon does not answer requests from other directories.
+
+    path : string [optional]
+        Socket path. Default: see `socket_path`.
+
+    Returns
+    ----------
+    None if the daemon is not running or can't run the command. Otherwise,
+    once the daemon has loaded the collection, a generator of strings giving
+    the command's output. Errors in loading the collection are raised by
+    this function, and errors in the command by the generator.
+    """
+    connection = request({
+        "version": PROTOCOL_VERSION,
+        "command": command,
+        "arguments": arguments,
+        "directory": os.getcwd(),
+        "environment": environment_signature(),
+    }, path=path)
+    if connection is None:
+        return None
+    replies = connection.replies()
+    try:
+        first = next(replies)
+    except (IOError, socket.error, ValueError):
+        # The daemon went away before starting on the request.
+        return None
+    if "unsupported" in first:
+        replies.close()
+        return None
+    if "error" in first:
+        replies.close()
+        raise _remote_exception(first)
+
+    def output():
+        try:
+            for reply in replies:
+                if "output" in reply:
+                    yield reply["output"]
+                elif "error" in reply:
+                    raise _remote_exception(reply)
+                elif reply.get("done"):
+                    return
+        finally:
+            replies.close()
+    return output()
+
+class _OutputWriter(object):
+    """
+    A text file object that sends what is written to it to a client, in
+    messages of about `OUTPUT_CHUNK_SIZE` characters.
+    """
+    def __init__(self, fd):
+        self.fd = fd
+        self.pieces = []
+        self.size = 0
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.size += len(text)
+        if self.size >= OUTPUT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            _send(self.fd, {"output": "".join(self.pieces)})
+            self.pieces = []
+            self.size = 0
+
+class _Entry(object):
+    """
+    A collection loaded by the daemon, with the signature of the files it
+    was loaded from.
+
+    Collections build caches lazily (e.g. their tag index), so a collection
+    is used by one request at a time: `lock` is held while loading it and
+    while running a command on it.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collection = None
+        self.hook_files = []
+        self.signature = None
+
+def _files_signature(sources, hook_files):
+    """
+    Return something that changes when the collection files matching some
+    sources, or some hook files, change, or None if the sources include URLs
+    (which are always loaded again; see `fetching` for their caching).
+    """
+    signature = []
+    filenames = list(hook_files)
+    for source in sources:
+        parsed = util.urlparse(source)
+        if parsed.scheme.lower() not in ("", "file"):
+            return None
+        # Without the fragment, e.g. "#filter=...", or file:// prefix.
+        path = parsed.path
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        signature.append((source, matches))
+        filenames.extend(matches)
+    for filename in sorted(set(filenames)):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            signature.append((filename, None))
+        else:
+            signature.append((filename, stat.st_mtime, stat.st_size))
+    return signature
+
+class Server(object):
+    """
+    Daemon answering requests from the commandline tools.
+
+    Parameters
+    ----------
+    path : string [optional]
+        Socket path. Default: see `socket_path`.
+
+    max_collections : int [optional]
+        Number of loaded collections to keep. The least recently used are
+        discarded.
+    """
+    def __init__(self, path=None, max_collections=DEFAULT_MAX_COLLECTIONS):
+        self.path = path or socket_path()
+        self.max_collections = max_collections
+        self.directory = os.getcwd()
+        self.environment = environment_signature()
+        self._entries = collections.OrderedDict()  # key -> _Entry
+        self._lock = threading.Lock()
+        self._server = None
+
+    def collection(self, arguments):
+        """
+        Return the collection given by the load arguments of a command,
+        loading it if it is not loaded or its files have changed.
+        """
+        entry = self._entry(arguments)
+        with entry.lock:
+            return self._load(entry, arguments)
+
+    def _entry(self, arguments):
+        key = json.dumps(
+            [arguments.get(name) for name in LOAD_ARGUMENTS], sort_keys=True)
+        with self._lock:
+            entry = self._entries.pop(key, None) or _Entry()
+            self._entries[key] = entry
+            while len(self._entries) > self.max_collections:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _load(self, entry, arguments):
+        """
+        Return the collection of an entry, loading it if needed. The caller
+        holds ``entry.lock``.
+        """
+        from .commands.util import load_from_args
+        sources = arguments["collections"] + arguments.get("merge", [])
+        if entry.collection is not None:
+            signature = _files_signature(sources, entry.hook_files)
+            if signature is not None and signature == entry.signature:
+                return entry.collection
+        with snapshot.recording_hook_files() as hook_files:
+            collection = load_from_args(_Arguments(arguments))
+        entry.hook_files = list(hook_files) + list(arguments["transform"])
+        entry.signature = _files_signature(sources, entry.hook_files)
+        entry.collection = collection
+        return collection
+
+    def loaded(self):
+        """
+        Return a list of (sources, filters, number of resources) tuples for
+        the loaded collections.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        result = []
+        for (key, entry) in entries:
+            if entry.collection is not None:
+                arguments = dict(zip(LOAD_ARGUMENTS, json.loads(key)))
+                result.append((
+                    arguments["collections"] + (arguments["merge"] or []),
+                    arguments["filter"],
+                    len(entry.collection)))
+        return result
+
+    def handle(self, fd):
+        """
+        Answer one request, read from and replied to on a binary file object.
+        """
+        try:
+            message = _receive(fd)
+        except (IOError, ValueError):
+            return
+        command = message.get("command")
+        if command == "ping":
+            _send(fd, {"done": True, "loaded": self.loaded()})
+            return
+        if command == "stop":
+            _send(fd, {"done": True})
+            threading.Thread(target=self.stop).start()
+            return
+        reason = None
+        if message.get("version") != PROTOCOL_VERSION:
+            reason = "protocol version"
+        elif command not in COMMANDS:
+            reason = "unknown command: %s" % command
+        elif message.get("directory") != self.directory:
+            reason = "working directory"
+        elif message.get("environment") != self.environment:
+            reason = "environment variables"
+        if reason is not None:
+            _send(fd, {"unsupported": reason})
+            return
+
+        arguments = message["arguments"]
+        entry = self._entry(arguments)
+        with entry.lock:
+            try:
+                collection = self._load(entry, arguments)
+            except Exception as e:
+                _send(fd, {"error": str(e), "exception": type(e).__name__})
+                return
+            _send(fd, {"loaded": True})
+            out = _OutputWriter(fd)
+            try:
+                module = importlib.import_module(
+                    ".commands." + command, __package__)
+                module.write_output(collection, _Arguments(arguments), out)
+                out.flush()
+            except Exception as e:
+                out.flush()
+                _send(fd, {"error": str(e), "exception": type(e).__name__})
+                return
+        _send(fd, {"done": True})
+
+    def serve_forever(self):
+        """
+        Listen on the socket and answer requests, each in its own thread,
+        until `stop` is called.
+        """
+        from six.moves import socketserver
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if not _same_user(self.request):
+                    return
+                try:
+                    server.handle(_Duplex(self.rfile, self.wfile))
+                except (IOError, socket.error):
+                    # The client went away.
+                    pass
+
+        if os.path.exists(self.path):
+            connection = request({"command": "ping"}, path=self.path)
+            if connection is not None:
+                connection.close()
+                raise ValueError(
+                    "A daemon is already listening on %s" % self.path)
+            os.unlink(self.path)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        # Only our user may send requests, which run hook files, so the
+        # socket is created without permissions for anyone else.
+        umask = os.umask(0o077)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(
+                self.path, Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+        try:
+            os.chmod(self.path, 0o600)
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def stop(self):
+        """
+        Stop `serve_forever`.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+
+def _same_user(connection):
+    """
+    Is the process at the other end of a Unix socket connection run by the
+    same user as this one? True if the platform can't tell.
+    """
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return True
+    # struct ucred: pid, uid, gid.
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, option, struct.calcsize("3i"))
+    (_, uid, _) = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+class _Duplex(object):
+    """
+    A file object reading from one file object and writing to another.
+    """
+    def __init__(self, rfile, wfile):
+        self.readline = rfile.readline
+        self.write = wfile.write
+        self.flush = wfile.flush
+
+class _Arguments(object):
+    """
+    Parsed commandline arguments, from a dict.
+    """
+    def __init__(self, arguments):
+        self.__dict__.update(arguments)
@@ -0,0 +1,328 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An on-disk cache of loaded resource collections.
+
+Loading a Python collection means executing it and running its transforms,
+which can be slow. When the snapshot cache is enabled, `load` pickles each
+collection it loads to a file in the cache directory and reuses that
+snapshot on later loads, skipping execution entirely, as long as none of
+these have changed:
+
+    - the path and content of the collection,
+    - the arguments to `load` and the operations in the filename fragment,
+    - the content of any hook files (transforms) run while loading,
+      including those given to `transform_exports`,
+    - the values of the SEFARA_TRANSFORM and SEFARA_CHDIR environment
+      variables, and of any environment variables named in
+      SEFARA_CACHE_VARIABLES.
+
+Anything else a collection or transform depends on (other files it reads,
+modules it imports, the current time) is not tracked. Call `invalidate` when
+those change.
+
+The cache is enabled by setting the SEFARA_CACHE_DIR environment variable to
+a directory, or by passing ``cache=True`` to `load`. Its total size is kept
+under SEFARA_CACHE_MAX_BYTES (default: 1 GB) by deleting the least recently
+used snapshots.
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import hashlib
+import os
+import pickle
+import tempfile
+
+from . import environment, util
+
+# Incremented when the snapshot file format changes.
+FORMAT_VERSION = 2
+
+DEFAULT_MAX_BYTES = 2**30
+
+SUFFIX = ".snapshot"
+
+# List of hook files run while loading, when recording.
+_RECORDING = util.ContextVariable("sefara_recording_hook_files")
+
+def enabled():
+    """
+    Is the cache enabled by the environment?
+    """
+    return bool(os.environ.get(environment.CACHE_DIR_ENVIRONMENT_VARIABLE))
+
+def cache_directory():
+    """
+    The directory where snapshots are stored.
+    """
+    return (
+        os.environ.get(environment.CACHE_DIR_ENVIRONMENT_VARIABLE) or
+        os.path.join(os.path.expanduser("~"), ".cache", "sefara"))
+
+def max_bytes():
+    """
+    The maximum total size of the snapshots in the cache directory.
+    """
+    value = os.environ.get(environment.CACHE_MAX_BYTES_ENVIRONMENT_VARIABLE)
+    return int(value) if value else DEFAULT_MAX_BYTES
+
+def file_digest(filename):
+    """
+    Return a hash of the contents of a file, or None if it can't be read.
+    """
+    hasher = hashlib.sha1()
+    try:
+        with open(filename, "rb") as fd:
+            for block in iter(lambda: fd.read(2**20), b""):
+                hasher.update(block)
+    except (IOError, OSError):
+        return None
+    return hasher.hexdigest()
+
+@contextlib.contextmanager
+def recording_hook_files():
+    """
+    Context manager giving a list that is filled in with the absolute paths
+    of hook files run (by `hooks.run_hook`) in this thread or asyncio task
+    while it is active. When nested in another recording, for example when a
+    Python collection loads another collection, the files are also added to
+    the enclosing list.
+    """
+    enclosing = _RECORDING.get()
+    with _RECORDING.setting([]) as files:
+        yield files
+    if enclosing is not None:
+        enclosing.extend(files)
+
+def record_hook_file(filename):
+    """
+    Note that a hook file is being run. Called by `hooks.run_hook`, and for
+    each hook file of a collection taken from a cache instead of loaded.
+    """
+    files = _RECORDING.get()
+    if files is not None:
+        files.append(os.path.abspath(filename))
+
+def source_name(filename):
+    """
+    Return the name used in the cache for a collection path or URL: an
+    absolute path for local files, otherwise the URL. Any fragment is
+    removed.
+    """
+    parsed = util.urlparse(filename)
+    if not parsed.scheme or parsed.scheme.lower() == "file":
+        return os.path.abspath(parsed.path)
+    return parsed._replace(fragment="").geturl()
+
+def data_digest(data):
+    """
+    Return a hash of a string or bytes, matching `file_digest`.
+    """
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+def snapshot_key(source, digest, options):
+    """
+    Return the cache key for a collection.
+
+    Parameters
+    ----------
+    source : string
+        Collection name given by `source_name`.
+
+    digest : string
+        Hash of the content of the collection, from `file_digest` or
+        `data_digest`.
+
+    options : tuple
+        Any other arguments that affect the result of loading, which must
+        have a stable `repr`.
+    """
+    variables = [
+        environment.TRANSFORM_ENVIRONMENT_VARIABLE,
+        environment.CHDIR_ENVIRONMENT_VARIABLE,
+    ]
+    variables.extend(
+        name.strip() for name in os.environ.get(
+            environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE, "").split(":")
+        if name.strip())
+    hasher = hashlib.sha1()
+    for part in [FORMAT_VERSION, source, digest, options]:
+        hasher.update(repr(part).encode("utf-8"))
+    for name in variables:
+        hasher.update(repr((name, os.environ.get(name))).encode("utf-8"))
+    return hasher.hexdigest()
+
+def _source_prefix(source):
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+def _snapshot_filename(directory, source, key):
+    return os.path.join(
+        directory, "%s-%s%s" % (_source_prefix(source), key, SUFFIX))
+
+def _snapshot_filenames(directory, prefix=""):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return [
+        os.path.join(directory, name) for name in names
+        if name.startswith(prefix) and name.endswith(SUFFIX)
+    ]
+
+def read(source, key, directory=None):
+    """
+    Return the collection cached for the given source and key, or None if
+    there is no valid snapshot.
+    """
+    filename = _snapshot_filename(directory or cache_directory(), source, key)
+    try:
+        fd = open(filename, "rb")
+    except (IOError, OSError):
+        return None
+    with fd:
+        try:
+            metadata = pickle.load(fd)
+            if metadata["format_version"] != FORMAT_VERSION:
+                return None
+            for (hook_filename, digest) in metadata["hook_files"]:
+                if file_digest(hook_filename) != digest:
+                    return None
+            collection = pickle.load(fd)
+        except Exception:
+            # A truncated or incompatible snapshot is treated as a miss and
+            # will be overwritten.
+            return None
+    # A collection loading this one depends on the same hook files.
+    for (hook_filename, _) in metadata["hook_files"]:
+        record_hook_file(hook_filename)
+    try:
+        # The modification time is used to evict least recently used
+        # snapshots first.
+        os.utime(filename, None)
+    except OSError:
+        pass
+    return collection
+
+def write(source, key, collection, hook_files, directory=None):
+    """
+    Store a snapshot of a collection, then evict old snapshots if the cache
+    is over its size limit.
+
+    Parameters
+    ----------
+    source : string
+        Collection name given by `source_name`.
+
+    key : string
+        Key returned by `snapshot_key`.
+
+    collection : `ResourceCollection`
+
+    hook_files : list of string
+        Hook files run while loading the collection. The snapshot is used
+        only while their contents are unchanged.
+
+    Returns
+    ----------
+    True if the snapshot was written, False if the collection could not be
+    pickled (for example, if a resource has a function as an attribute).
+    """
+    directory = directory or cache_directory()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "source": source,
+        "hook_files": [
+            (filename, file_digest(filename))
+            for filename in sorted(set(hook_files))
+        ],
+    }
+    (fd, temporary_filename) = tempfile.mkstemp(
+        dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fd:
+            pickle.dump(metadata, fd, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(collection, fd, pickle.HIGHEST_PROTOCOL)
+        # Replace atomically, so concurrent readers never see a partial file.
+        getattr(os, "replace", os.rename)(
+            temporary_filename, _snapshot_filename(directory, source, key))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        os.unlink(temporary_filename)
+        return False
+    except:
+        os.unlink(temporary_filename)
+        raise
+    evict(directory)
+    return True
+
+def evict(directory=None, limit=None):
+    """
+    Delete the least recently used snapshots until their total size is at
+    most ``limit`` bytes (default: `max_bytes`).
+
+    Returns the number of snapshots deleted.
+    """
+    if limit is None:
+        limit = max_bytes()
+    entries = []
+    for filename in _snapshot_filenames(directory or cache_directory()):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, filename))
+    entries.sort()
+    total = sum(size for (_, size, _) in entries)
+    deleted = 0
+    for (_, size, filename) in entries:
+        if total <= limit:
+            break
+        if _unlink(filename):
+            deleted += 1
+        total -= size
+    return deleted
+
+def invalidate(source, directory=None):
+    """
+    Delete all snapshots of the given collection path or URL.
+
+    Returns the number of snapshots deleted.
+    """
+    source = source_name(source)
+    filenames = _snapshot_filenames(
+        directory or cache_directory(), _source_prefix(source) + "-")
+    return sum(1 for filename in filenames if _unlink(filename))
+
+def clear(directory=None):
+    """
+    Delete all snapshots.
+
+    Returns the number of snapshots deleted.
+    """
+    filenames = _snapshot_filenames(directory or cache_directory())
+    return sum(1 for filename in filenames if _unlink(filename))
+
+def _unlink(filename):
+    try:
+        os.unlink(filename)
+    except OSError:
+        # Already deleted by another process.
+        return False
+    return True
@@ -0,0 +1,245 @@
+# Copyright (c) 2015. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Incremental loading of JSON resource collections.
+
+`iter_json_object` parses the top-level object of a JSON document one key at
+a time from a file object, so a collection can be built, and filtered (see
+the `query` module), while it is read, without holding the whole document or
+its parsed form in memory.
+`load` uses this for JSON collections.
+"""
+
+from __future__ import absolute_import
+
+import codecs
+import collections
+import json
+import re
+
+from .compact import CompactResource, TagVocabulary
+from .query import LazyCollection
+from .resource import Resource
+from .resource_collection import ResourceCollection
+
+CHUNK_SIZE = 2**20
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class _Reader(object):
+    """
+    A buffer over a file object giving text (bytes are decoded as UTF-8).
+    """
+    def __init__(self, fd, initial, chunk_size):
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.decoder = None
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self._append(initial)
+
+    def _append(self, chunk):
+        if isinstance(chunk, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+            chunk = self.decoder.decode(chunk, final=not chunk)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+
+    def read_more(self):
+        """
+        Read another chunk, at least as large as what is currently buffered,
+        so that a value spanning many chunks is parsed in linear time.
+
+        Returns False at end of file.
+        """
+        if self.eof:
+            return False
+        size = max(self.chunk_size, len(self.buffer) - self.position)
+        chunk = self.fd.read(size)
+        if not chunk:
+            self.eof = True
+        self._append(chunk)
+        return not self.eof
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, or "" at end of file.
+        """
+        character = self.buffer[self.position:self.position + 1]
+        if character and character not in " \t\n\r":
+            return character
+        while True:
+            self.position = _WHITESPACE.match(
+                self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self.read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError("Expecting '%s': %s" % (
+                character, self.buffer[self.position:self.position + 50]))
+        self.position += 1
+
+    def decode(self, decoder):
+        """
+        Parse and return the JSON value at the current position.
+        """
+        self.peek()
+        while True:
+            try:
+                (value, end) = decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next
+            # chunk.
+            if end == len(self.buffer) and self.read_more():
+                continue
+            self.position = end
+            return value
+
+def iter_json_object(fd, initial="", chunk_size=CHUNK_SIZE):
+    """
+    Parse a JSON object from a file object incrementally.
+
+    Parameters
+    ----------
+    fd : file object
+        Open in text or binary mode. Binary data must be UTF-8.
+
+    initial : string or bytes [optional]
+        Data already read from ``fd``.
+
+    chunk_size : int [optional]
+        Number of characters or bytes to read at a time.
+
+    Returns
+    ----------
+    Generator of (key, value) pairs in the order they appear in the document.
+    Nested objects are parsed as OrderedDicts.
+    """
+    reader = _Reader(fd, initial, chunk_size)
+    decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.position += 1
+    else:
+        while True:
+            if reader.peek() != '"':
+                raise ValueError("Expecting property name: %s" % (
+                    reader.buffer[reader.position:reader.position + 50]))
+            key = reader.decode(decoder)
+            reader.expect(":")
+            value = reader.decode(decoder)
+            yield (key, value)
+            if reader.peek() == "}":
+                reader.position += 1
+                break
+            reader.expect(",")
+    if reader.peek():
+        raise ValueError("Extra data after JSON object: %s" % (
+            reader.buffer[reader.position:reader.position + 50]))
+
+def resources_from_pairs(pairs, compact=True):
+    """
+    Generate resources from (name, attributes dict) pairs, as in JSON
+    collections.
+
+    If ``compact`` is True, `CompactResource` instances sharing one
+    `TagVocabulary` are created. Otherwise, `Resource` instances are created.
+    """
+    if compact:
+        vocabulary = TagVocabulary()
+        for (key, value) in pairs:
+            yield CompactResource._from_fields(
+                value, name=key, vocabulary=vocabulary)
+    else:
+        for (key, value) in pairs:
+            yield Resource(name=key, **value)
+
+def project_pairs(pairs, columns=None):
+    """
+    Keep only the given attributes (and the name) in (name, attributes dict)
+    pairs. "tags" is kept only if listed. If ``columns`` is None, the pairs
+    are returned unchanged.
+    """
+    if columns is None:
+        return pairs
+    columns = frozenset(columns)
+    return (
+        (name, collections.OrderedDict(
+            (key, value) for (key, value) in fields.items()
+            if key in columns))
+        for (name, fields) in pairs)
+
+def read_collection(
+        fd,
+        filename=None,
+        compact=True,
+        table=False,
+        filters=(),
+        initial="",
+        columns=None):
+    """
+    Load a JSON collection from a file object, parsing it incrementally.
+
+    Parameters
+    ----------
+    fd : file object
+
+    filename : string [optional]
+        Filename to use in error messages.
+
+    compact : Boolean [default: True]
+        Whether to create `CompactResource` instances. See `loads`.
+
+    table : Boolean [default: False]
+        Whether to return a `ResourceTable`. See `loads`.
+
+    filters : list of string or callable [optional]
+        Filter expressions. The result is the same as calling ``filter`` with
+        each of them in turn on the complete collection, but resources that
+        don't pass the filters are discarded while loading.
+
+    initial : string or bytes [optional]
+        Data already read from ``fd``.
+
+    columns : list of string [optional]
+        Attributes to keep; see `loads`.
+
+    Returns
+    ----------
+    `ResourceCollection` instance.
+    """
+    # numpy is only imported when a table is wanted.
+    if table:
+        from .resource_table import ResourceTable
+    pairs = project_pairs(iter_json_object(fd, initial=initial), columns)
+    if not filters:
+        if table:
+            return ResourceTable.from_plain_types(pairs, filename)
+        return ResourceCollection(
+            list(resources_from_pairs(pairs, compact)), filename)
+    plan = LazyCollection(
+        resources_from_pairs(pairs, compact or table), filename)
+    for expression in filters:
+        plan = plan.filter(expression)
+    rc = plan.collect()
+    if table:
+        return ResourceTable.from_resources(rc, filename)
+    return rc
@@ -18,7 +18,14 @@ A few utility functions and imports.
 
 from __future__ import absolute_import
 
+import contextlib
 import os
+import threading
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
 
 try:  # py3
     from shlex import quote as shell_quote
@@ -37,20 +44,105 @@ try:
 except ImportError:
     from urllib.parse import parse_qsl
 
-try:
-    from urllib2 import urlopen  # py 2
-except ImportError:
-    from urllib.request import urlopen  # py 3
+def urlopen(url, *args, **kwargs):
+    """
+    The standard library's ``urlopen``, which is imported when first used
+    since importing it is slow.
+    """
+    try:
+        from urllib2 import urlopen as standard_urlopen  # py 2
+    except ImportError:
+        from urllib.request import urlopen as standard_urlopen  # py 3
+    return standard_urlopen(url, *args, **kwargs)
+
+class ContextVariable(object):
+    """
+    A variable whose value is local to the current thread and, where
+    `contextvars` is available (Python 3.7+), to the current asyncio task.
+    """
+    def __init__(self, name, default=None):
+        self.default = default
+        if contextvars is not None:
+            self._variable = contextvars.ContextVar(name, default=default)
+        else:
+            self._local = threading.local()
+
+    def get(self):
+        if contextvars is not None:
+            return self._variable.get()
+        return getattr(self._local, "value", self.default)
+
+    @contextlib.contextmanager
+    def setting(self, value):
+        """
+        Context manager setting the variable to the given value while it is
+        active.
+        """
+        if contextvars is not None:
+            token = self._variable.set(value)
+            try:
+                yield value
+            finally:
+                self._variable.reset(token)
+        else:
+            previous = self.get()
+            self._local.value = value
+            try:
+                yield value
+            finally:
+                self._local.value = previous
+
+# Absolute path of the Python file being executed by `exec_in_directory`.
+_EXECUTING_FILE = ContextVariable("sefara_executing_file")
+
+# Held while code runs in its own directory; see `chdir_mode`.
+_CHDIR_LOCK = threading.RLock()
+
+def chdir_mode():
+    """
+    Is the pre-0.3 behavior of running Python files from their own directory
+    enabled by the environment (SEFARA_CHDIR)?
+    """
+    from . import environment
+    value = os.environ.get(environment.CHDIR_ENVIRONMENT_VARIABLE, "")
+    return value.strip().lower() in ("1", "true", "yes")
+
+def resolve_path(path):
+    """
+    Return the absolute path for a path given by Python code run by
+    `exec_in_directory`: relative paths are relative to the directory of
+    the file being executed, if any, otherwise to the current working
+    directory. URLs are returned unchanged.
+    """
+    if "://" in path:
+        return path
+    executing = _EXECUTING_FILE.get()
+    if executing is not None:
+        return os.path.normpath(
+            os.path.join(os.path.dirname(executing), path))
+    return os.path.abspath(path)
 
 def exec_in_directory(filename=None, code=None):
     """
-    Execute Python code from either a file or passed as an argument. If a file
-    is specified, the code will be executed with the current working directory
-    set to the directory where the file resides.
+    Execute Python code from either a file or passed as an argument.
+
+    If a file is specified, ``__file__`` is set to its absolute path in the
+    code's namespace, and sefara functions called by the code that take
+    paths (such as `load`, `transform_exports` and `hooks.transform`)
+    resolve relative paths against the file's directory; see
+    `resolve_path`. The current working directory is not changed, so code
+    run this way can safely run concurrently in several threads or asyncio
+    tasks. Other relative paths used by the code, e.g. with ``open``, are
+    relative to the current working directory; use
+    ``os.path.dirname(__file__)`` to locate files next to the code.
+
+    Before version 0.3, the working directory was changed to the file's
+    directory while the code ran. If the SEFARA_CHDIR environment variable
+    is set to "1", this is still done, holding a process-wide lock so that
+    only one thread at a time runs code this way.
 
     If both ``filename`` and ``code`` are specified, then ``code`` is executed,
-    but ``filename`` is used to set the current working directory, and in error
-    messages.
+    but ``filename`` is used to resolve paths, and in error messages.
 
     Parameters
     ----------
@@ -65,21 +157,26 @@ def exec_in_directory(filename=None, code=None):
     dict giving module-level attributes defined by the executed code
 
     """
-    old_cwd = None
-    directory = os.path.dirname(filename) if filename else None
     if code is None:
         with open(filename) as fd:
             code = fd.read()
     compiled = compile(code, filename if filename else '<none>', 'exec')
     result = {}
-    try:
-        if directory:
-            old_cwd = os.getcwd()
-            os.chdir(directory)
-        exec(compiled, result)
-    finally:
-        if directory:
-            os.chdir(old_cwd)
+    executing = None
+    if filename and "://" not in filename and filename != "-":
+        executing = resolve_path(filename)
+        result["__file__"] = executing
+    with _EXECUTING_FILE.setting(executing):
+        if executing is not None and chdir_mode():
+            with _CHDIR_LOCK:
+                cwd = os.getcwd()
+                os.chdir(os.path.dirname(executing))
+                try:
+                    exec(compiled, result)
+                finally:
+                    os.chdir(cwd)
+        else:
+            exec(compiled, result)
     return result
 
 def move_to_front(lst, *items):
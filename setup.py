@@ -3,7 +3,7 @@ try:
 except ImportError:
     from distutils.core import setup
 
-version = "0.2.1"
+version = "0.3.0"
 
 setup(
     name="sefara",
@@ -22,6 +22,7 @@ setup(
             'sefara-dump = sefara.commands.dump:run',
             'sefara-check = sefara.commands.check:run',
             'sefara-env = sefara.commands.env:run',
+            'sefara-serve = sefara.commands.serve:run',
         ]
     },
     classifiers=[
@@ -37,7 +38,14 @@ setup(
         "attrdict>=2.0.0",
         "nose>=1.3.1",
         "typechecks>=0.0.2",
-        "future>=0.14.3",
+        "six>=1.9.0",
+        # concurrent.futures, for running checkers and loads concurrently.
+        'futures>=3.0.0; python_version < "3"',
+        "numpy>=1.9.0",
         "pandas>=0.16.1",
-    ]
+    ],
+    extras_require={
+        "arrow": ["pyarrow"],
+        "zstd": ["zstandard"],
+    }
 )
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+from nose.plugins.skip import SkipTest
+
+import sefara
+from sefara import arrow
+from .test_resource_table import plain
+from . import data_path
+
+def unordered(rc):
+    return dict((name, dict(fields)) for (name, fields) in plain(rc).items())
+
+def mixed_collection():
+    return sefara.ResourceCollection([
+        sefara.Resource(
+            name="a", tags=["x", "y"], path="/a", n=1, score=0.5,
+            nested={"k": [1, 2]}, flag=True, mixed="text"),
+        sefara.Resource(name="b", path="/b", n=2**40, mixed=3),
+        sefara.Resource(name="c", tags=["y"], nothing=None, flag=False),
+    ])
+
+def test_projection():
+    # Column projection also works for text formats.
+    rc = sefara.load(data_path("ex1.py"), columns=["path"])
+    eq_(plain(rc)["dataset1"], {"tags": [], "path": "/path/to/file1.csv"})
+    rc = sefara.loads(
+        rc.to_json(), columns=["path", "tags", "missing"], table=True)
+    eq_(sorted(rc.attributes), ["name", "path", "tags"])
+    rc = sefara.load(data_path("ex1.py"), columns=["path", "tags"])
+    eq_(sorted(rc["dataset2"].tags), ["alpha", "delta", "gamma"])
+
+def test_parquet_and_feather():
+    try:
+        import pyarrow  # noqa
+    except ImportError:
+        raise SkipTest("pyarrow is not installed")
+    rc = mixed_collection()
+    directory = tempfile.mkdtemp()
+    try:
+        for (filename, format) in [
+                ("c.parquet", "parquet"),
+                ("c.feather", "feather"),
+                ("c.bin", "feather")]:
+            path = os.path.join(directory, filename)
+            # The format of c.bin can't be guessed from its name.
+            rc.write(path, format=format if filename == "c.bin" else None)
+            with open(path, "rb") as fd:
+                data = fd.read()
+            eq_(arrow.format_from_magic(data), format)
+            eq_(unordered(sefara.load(path)), unordered(rc))
+            eq_(unordered(sefara.loads(data)), unordered(rc))
+            eq_(unordered(sefara.load(path, table=True)), unordered(rc))
+
+            projected = sefara.load(path, columns=["path", "flag"])
+            eq_(unordered(projected), {
+                "a": {"tags": [], "path": "/a", "flag": True},
+                "b": {"tags": [], "path": "/b"},
+                "c": {"tags": [], "flag": False},
+            })
+            eq_([r.name for r in sefara.load(path + "#filter=tags.y")],
+                ["a", "c"])
+    finally:
+        shutil.rmtree(directory)
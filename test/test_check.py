@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import time
+
+from nose.tools import eq_, assert_raises
+from sefara import hooks, check_cache, Resource, ResourceCollection
+from .test_columnar import synthetic_collection
+
+def depth_checker(collection, limit=40):
+    for resource in collection:
+        if "capture_kit" in resource:
+            yield (
+                resource,
+                True,
+                "too deep" if resource.depth > limit else None)
+        else:
+            yield (resource, False, None)
+
+def reordering_checker(collection):
+    resources = list(collection)
+    if len(resources) > 1:
+        resources[0], resources[1] = resources[1], resources[0]
+    for resource in resources:
+        yield (resource, True, None)
+
+def test_concurrent_check():
+    rc = synthetic_collection()
+    checkers = [depth_checker, (depth_checker, "check", (10,), {})]
+    expected = list(hooks.check(
+        rc, list(checkers), include_environment_checkers=False))
+    eq_(len(expected), len(rc))
+    eq_(expected[46][1][0][1:], (True, "too deep"))
+    for executor in ["thread", "process"]:
+        for chunk_size in [None, 1, 7]:
+            eq_(list(hooks.check(
+                rc,
+                list(checkers),
+                include_environment_checkers=False,
+                jobs=3,
+                executor=executor,
+                chunk_size=chunk_size)), expected)
+
+def test_concurrent_check_errors():
+    rc = synthetic_collection()
+    assert_raises(ValueError, list, hooks.check(
+        rc, [reordering_checker], include_environment_checkers=False,
+        jobs=2, chunk_size=5))
+    assert_raises(hooks.NoCheckers, list, hooks.check(
+        rc, [], include_environment_checkers=False, jobs=2))
+
+COUNTING_CHECKER = """
+def check(collection, log):
+    with open(log, "a") as fd:
+        for resource in collection:
+            fd.write(resource.name + "\\n")
+            yield (resource, True, "bad" if resource.value < 0 else None)
+"""
+
+def test_check_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        checker_path = os.path.join(directory, "checker.py")
+        with open(checker_path, "w") as fd:
+            fd.write(COUNTING_CHECKER)
+        log = os.path.join(directory, "log.txt")
+        data_path = os.path.join(directory, "data.txt")
+        with open(data_path, "w") as fd:
+            fd.write("x")
+        rc = ResourceCollection([
+            Resource(name="a", value=1),
+            Resource(name="b", value=-1),
+            Resource(name="c", value=2, path=data_path),
+        ])
+        database = os.path.join(directory, "results.sqlite")
+
+        def run(jobs=1, **kwargs):
+            if os.path.exists(log):
+                os.unlink(log)
+            results = [
+                (resource.name, tuples[0][1:])
+                for (resource, tuples) in hooks.check(
+                    rc,
+                    [(checker_path, "check", (log,), {})],
+                    include_environment_checkers=False,
+                    jobs=jobs,
+                    chunk_size=1,
+                    cache=check_cache.CheckCache(database, **kwargs))
+            ]
+            eq_(results, [
+                ("a", (True, None)),
+                ("b", (True, "bad")),
+                ("c", (True, None)),
+            ])
+            if not os.path.exists(log):
+                return []
+            with open(log) as fd:
+                return sorted(fd.read().split())
+
+        eq_(run(), ["a", "b", "c"])
+        eq_(run(), [])
+        eq_(run(jobs=2), [])
+        eq_(run(force=True), ["a", "b", "c"])
+
+        rc["a"].value = 3
+        rc["a"].value = 1
+        rc["b"].tags.add("new")
+        eq_(run(), ["b"])
+
+        # A change to a file a resource refers to.
+        with open(data_path, "w") as fd:
+            fd.write("longer")
+        eq_(run(jobs=2), ["c"])
+
+        time.sleep(0.01)
+        eq_(run(max_age=0.005), ["a", "b", "c"])
+
+        # A change to the checker.
+        with open(checker_path, "a") as fd:
+            fd.write("\n# changed\n")
+        eq_(run(), ["a", "b", "c"])
+    finally:
+        shutil.rmtree(directory)
+
+def test_cached_checker_streams():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = check_cache.CheckCache(
+            os.path.join(directory, "results.sqlite"))
+        rc = ResourceCollection([
+            Resource(name="r%d" % i, value=i)
+            for i in range(check_cache._BATCH_SIZE + 10)
+        ])
+        checked = []
+
+        def checker(collection):
+            for resource in collection:
+                checked.append(resource.name)
+                yield (resource, True, None)
+
+        results = check_cache.cached_checker(cache, "key", checker)(rc)
+        eq_(next(results)[0].name, "r0")
+        eq_(checked, ["r0"])
+        eq_(len(list(results)), len(rc) - 1)
+
+        # All results were stored.
+        del checked[:]
+        eq_(len(list(check_cache.cached_checker(cache, "key", checker)(rc))),
+            len(rc))
+        eq_(checked, [])
+    finally:
+        shutil.rmtree(directory)
+
+COUNTING_HOOK = """
+import os
+with open(os.path.join(os.path.dirname(__file__), "executions.txt"), "a") as fd:
+    fd.write("x")
+
+def transform(collection, value):
+    for resource in collection:
+        resource.value = value
+"""
+
+def test_hook_modules_are_reused():
+    directory = tempfile.mkdtemp()
+    try:
+        hook_path = os.path.join(directory, "hook.py")
+        with open(hook_path, "w") as fd:
+            fd.write(COUNTING_HOOK)
+
+        def executions():
+            with open(os.path.join(directory, "executions.txt")) as fd:
+                return len(fd.read())
+
+        rc = ResourceCollection([Resource(name="a")])
+        hooks.transform(rc, hook_path, "transform", 1)
+        hooks.transform(rc, hook_path, "transform", 2)
+        eq_(rc["a"].value, 2)
+        eq_(executions(), 1)
+
+        # Same content, new modification time.
+        os.utime(hook_path, (0, 0))
+        hooks.transform(rc, hook_path, "transform", 3)
+        eq_(executions(), 1)
+
+        with open(hook_path, "a") as fd:
+            fd.write("\n# changed\n")
+        hooks.transform(rc, hook_path, "transform", 4)
+        eq_(rc["a"].value, 4)
+        eq_(executions(), 2)
+
+        hooks.clear_hook_modules()
+        hooks.transform(rc, hook_path, "transform", 5)
+        eq_(executions(), 3)
+    finally:
+        shutil.rmtree(directory)
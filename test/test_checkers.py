@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+
+from nose.tools import eq_, assert_raises
+from sefara import ResourceCollection, Resource, hooks, checkers, path_checks
+
+def test_builtin_path_checker():
+    directory = tempfile.mkdtemp()
+    try:
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(directory, name), "w") as fd:
+                fd.write(name)
+        os.mkdir(os.path.join(directory, "subdir"))
+        rc = ResourceCollection([
+            Resource(name="a", path=os.path.join(directory, "a.txt")),
+            Resource(name="b", path=os.path.join(directory, "b.txt")),
+            Resource(name="missing", path=os.path.join(directory, "c.txt")),
+            Resource(name="no_directory",
+                path=os.path.join(directory, "nowhere", "a.txt")),
+            Resource(name="subdir", path=os.path.join(directory, "subdir")),
+            Resource(name="no_path", other="foo"),
+        ])
+        latencies = {}
+
+        def on_latency(resource, seconds):
+            latencies[resource.name] = seconds
+
+        results = list(hooks.check(
+            rc,
+            [("builtin:path", "check", (), {
+                "concurrency": 2, "on_latency": on_latency})],
+            include_environment_checkers=False))
+        eq_([resource.name for (resource, _) in results],
+            [resource.name for resource in rc])
+        outcomes = dict(
+            (resource.name, tuples[0][1:]) for (resource, tuples) in results)
+        eq_(outcomes["a"], (True, None))
+        eq_(outcomes["b"], (True, None))
+        eq_(outcomes["subdir"], (True, None))
+        eq_(outcomes["no_path"], (False, "No path specified."))
+        for name in ["missing", "no_directory"]:
+            (attempted, problem) = outcomes[name]
+            assert attempted
+            assert "No such file" in problem, problem
+            assert problem.endswith(" ms)"), problem
+        eq_(sorted(latencies), ["a", "b", "missing", "no_directory", "subdir"])
+
+        # Same results when run on chunks in threads.
+        threaded = hooks.check(
+            rc,
+            ["builtin:path"],
+            include_environment_checkers=False,
+            jobs=2,
+            chunk_size=2)
+        eq_([tuples[0][1:] for (_, tuples) in threaded][:2],
+            [outcomes["a"], outcomes["b"]])
+    finally:
+        shutil.rmtree(directory)
+
+def test_latency_excludes_listing():
+    directory = tempfile.mkdtemp()
+    listdir = os.listdir
+
+    def slow_listdir(path):
+        time.sleep(0.2)
+        return listdir(path)
+
+    try:
+        with open(os.path.join(directory, "a.txt"), "w") as fd:
+            fd.write("a")
+        rc = ResourceCollection([
+            Resource(name="a", path=os.path.join(directory, "a.txt")),
+        ])
+        latencies = []
+        path_checks.os.listdir = slow_listdir
+        try:
+            list(checkers.check_paths(
+                rc, on_latency=lambda resource, seconds:
+                    latencies.append(seconds)))
+        finally:
+            path_checks.os.listdir = listdir
+        eq_(len(latencies), 1)
+        assert latencies[0] < 0.2, latencies
+    finally:
+        shutil.rmtree(directory)
+
+def test_listing_is_only_a_hint():
+    directory = tempfile.mkdtemp()
+    listdir = os.listdir
+
+    def case_folding_listdir(path):
+        # As on a case-insensitive filesystem, where "A.txt" opens "a.txt".
+        return [name.upper() for name in listdir(path)]
+
+    try:
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(directory, name), "w") as fd:
+                fd.write(name)
+        rc = ResourceCollection([
+            Resource(name="a", path=os.path.join(directory, "a.txt")),
+            Resource(name="b", path=os.path.join(directory, "B.TXT")),
+            Resource(name="missing", path=os.path.join(directory, "c.txt")),
+        ])
+        path_checks.os.listdir = case_folding_listdir
+        try:
+            results = list(checkers.check_paths(rc))
+        finally:
+            path_checks.os.listdir = listdir
+        problems = dict(
+            (resource.name, problem) for (resource, _, problem) in results)
+        # Not in the listing, but the file exists.
+        eq_(problems["a"], None)
+        # In the listing, but on this filesystem the file does not exist.
+        assert "No such file" in problems["b"], problems["b"]
+        assert "No such file" in problems["missing"], problems["missing"]
+    finally:
+        shutil.rmtree(directory)
+
+def test_unknown_builtin():
+    with assert_raises(ValueError):
+        hooks.run_hook(ResourceCollection([]), "builtin:nothing", "check")
+    with assert_raises(ValueError):
+        checkers.builtin("nothing")
+
+def test_path_checker_requires_python_37():
+    version_info = checkers.sys.version_info
+    checkers.sys.version_info = (3, 4, 0)
+    try:
+        assert_raises(
+            RuntimeError, checkers.check_paths, ResourceCollection([]))
+    finally:
+        checkers.sys.version_info = version_info
@@ -0,0 +1,166 @@
+from nose.tools import eq_, assert_raises
+import sefara
+from sefara import columnar, resource_collection, Resource, ResourceCollection
+from . import data_path
+
+def synthetic_collection():
+    resources = []
+    for i in range(50):
+        fields = {
+            "tags": ["even" if i % 2 == 0 else "odd"] + (
+                ["fizz"] if i % 3 == 0 else []),
+            "depth": i,
+        }
+        if i % 5:
+            fields["capture_kit"] = "kit%d" % (i % 4)
+        resources.append(Resource("sample%02d" % i, **fields))
+    return ResourceCollection(resources)
+
+EXPRESSIONS = [
+    "tags.even",
+    "tags.even and not tags.fizz",
+    "tags.fizz or depth > 40",
+    "capture_kit == 'kit1'",
+    "capture_kit in ['kit1', 'kit2'] and 10 <= depth < 30",
+    "capture_kit is None",
+    "name.startswith('sample1') or name.endswith('7')",
+    "capture_kit and capture_kit.upper() == 'KIT3'",
+    "depth % 7 == 0",
+    "len(name) > 8",
+    "'3' not in name",
+    "not tags.nonexistent",
+    "True",
+    # Unsupported by the columnar engine; falls back.
+    "os.path.basename(name) == 'sample01'",
+    "on_error(False) or capture_kit.startswith('kit2')",
+]
+
+def test_columnar_matches_python():
+    rc = synthetic_collection()
+    for expression in EXPRESSIONS:
+        eq_([r.name for r in rc.filter(expression, engine="columnar")],
+            [r.name for r in rc.filter(expression)])
+
+def typed_collection():
+    values = [
+        (3, 0.5, "a", True, 2 ** 60),
+        (3.0, -0.0, "b", False, 2 ** 53 - 1),
+        (None, 0.0, None, None, 1),
+        (-7, 2 ** 52, "ab", True, 2 ** 60 + 1),
+        (12, float("nan"), "a\0", False, -2 ** 60),
+        (0, 1e300, "", True, 0),
+    ]
+    return ResourceCollection([
+        Resource(
+            "r%d" % i, whole=whole, real=real, text=text, flag=flag, big=big)
+        for (i, (whole, real, text, flag, big)) in enumerate(values)
+    ])
+
+TYPED_EXPRESSIONS = [
+    "whole == 3",
+    "whole is None",
+    "whole is not None and whole > 0",
+    "whole is not None and str(whole) == '3'",
+    "whole is not None and whole / 2 == 1.5",
+    "whole is not None and whole // 5 == -2",
+    "whole is not None and -whole > 0",
+    "whole is not None and abs(whole) == 7",
+    "whole is not None and float(whole) == 12",
+    "whole in [3, 0]",
+    "whole",
+    "real",
+    "real > 1",
+    "str(real) == '-0.0'",
+    "real * 2 > 1e300",
+    "real != real",
+    "real == 4503599627370496",
+    "real * 4 == 18014398509481984",
+    "big > 9007199254740991",
+    "big + 1 == 1152921504606846978",
+    "big * 3 < 0",
+    "text == 'a'",
+    "text is not None and text.startswith('a')",
+    "text is not None and len(text) == 2",
+    "text",
+    "flag",
+    "flag is True",
+    "flag == 1",
+    "not flag",
+    "flag in [True]",
+    "whole is not None and 0 < whole < 5",
+    "whole is not None and 2 < whole * 2 < real",
+]
+
+def test_columnar_typed_columns_match_python():
+    rc = typed_collection()
+    for expression in TYPED_EXPRESSIONS:
+        eq_([r.name for r in rc.filter(expression, engine="columnar")],
+            [r.name for r in rc.filter(expression)],
+            expression)
+
+def test_typed_column():
+    def column(*values):
+        return columnar.typed_column(columnar._object_array(values))
+
+    numeric = column(1, 2.5, None)
+    eq_(list(numeric.values[:2]), [1.0, 2.5])
+    eq_(list(numeric.objects()), [1, 2.5, None])
+    eq_(type(numeric.objects()[0]), int)
+    categorical = column("b", "a", "b", None)
+    eq_(list(categorical.codes), [0, 1, 0, 2])
+    eq_(list(column(True, "x", True).categories), [True, "x"])
+    eq_(column(1, "x").dtype, object)
+    eq_(column(2 ** 60).dtype, object)
+    eq_(column([1], [2]).dtype, object)
+
+def test_columnar_evaluates_supported_expressions():
+    rc = synthetic_collection()
+    view = columnar.ColumnarView(list(rc), rc.attributes)
+    mask = columnar.evaluate_filter(view, "tags.fizz and depth > 20")
+    eq_(list(mask.nonzero()[0]), [21, 24, 27, 30, 33, 36, 39, 42, 45, 48])
+    assert_raises(
+        columnar.Unsupported, columnar.evaluate_filter, view, "resource")
+
+def test_columnar_errors_match_python():
+    rc = synthetic_collection()
+    # capture_kit is None for some resources.
+    assert_raises(
+        ValueError, rc.filter, "capture_kit.startswith('kit')",
+        engine="columnar")
+
+def test_columnar_ex1():
+    rc = sefara.load(data_path("ex1.py"))
+    eq_([x.name for x in rc.filter(
+            "tags.gamma and tags.sigma", engine="columnar")],
+        ["dataset3", "dataset4"])
+
+def test_tag_index_answers_tag_expressions():
+    rc = synthetic_collection()
+    original = resource_collection.TAG_INDEX_MIN_RESOURCES
+    resource_collection.TAG_INDEX_MIN_RESOURCES = len(rc)
+    try:
+        sefara.resource.EXPRESSION_CACHE.clear()
+        eq_(len(rc.filter("tags.even and not tags.fizz")), 16)
+        eq_(len(rc.filter("tags.odd or tags.fizz")), 34)
+        # Never evaluated per resource.
+        eq_(sefara.resource.EXPRESSION_CACHE.info().misses, 0)
+    finally:
+        resource_collection.TAG_INDEX_MIN_RESOURCES = original
+
+def test_small_collections_skip_tag_index():
+    rc = synthetic_collection()
+    eq_(len(rc.filter("tags.even and not tags.fizz")), 16)
+    eq_(rc._tag_index, None)
+
+def test_tag_index_tracks_mutation():
+    rc = synthetic_collection()
+    eq_(rc.tags, set(["even", "odd", "fizz"]))
+    eq_(len(rc.filter("tags.buzz")), 0)
+    rc["sample05"].tags.add("buzz")
+    rc["sample10"].tags = ["buzz", "even"]
+    eq_([r.name for r in rc.filter("tags.buzz")], ["sample05", "sample10"])
+    eq_(rc.tags, set(["even", "odd", "fizz", "buzz"]))
+    subset = rc.filter("tags.buzz")
+    rc["sample05"].tags.discard("buzz")
+    eq_([r.name for r in subset.filter("tags.buzz")], ["sample10"])
+    eq_([r.name for r in rc.filter("tags.buzz")], ["sample10"])
@@ -0,0 +1,129 @@
+import pickle
+import tracemalloc
+
+from nose.tools import eq_, assert_raises
+import sefara
+from sefara import CompactResource, Resource, ResourceCollection
+from . import data_path
+
+def test_compact_resource_api():
+    fields = dict(path="/path/to/file", tags=["a", "b"], info="x")
+    r1 = Resource("r", **fields)
+    r2 = CompactResource("r", **fields)
+    assert isinstance(r2, Resource)
+    eq_(r1, r2)
+    eq_(list(r1.keys()), list(r2.keys()))
+    eq_(r2.name, "r")
+    eq_(r2["path"], "/path/to/file")
+    assert r2.tags.a and not r2.tags.c
+    eq_(r2.evaluate("tags.b and path.startswith('/path')"), True)
+    eq_(str(r1), str(r2))
+
+    r2.extra = [1, 2]
+    eq_(r2.extra, (1, 2))
+    eq_(r2["extra"], [1, 2])
+    del r2.info
+    assert "info" not in r2
+    assert_raises(AttributeError, getattr, r2, "info")
+    r2.tags.add("c")
+    eq_(r2.tags, set(["a", "b", "c"]))
+    r2.tags = ["d"]
+    eq_(r2.tags, set(["d"]))
+    assert_raises(ValueError, setattr, r2, "tags", ["not a tag"])
+
+def test_compact_resources_share_layouts():
+    r1 = CompactResource("r1", path="x", tags=["a"])
+    r2 = CompactResource("r2", path="y", tags=[])
+    assert r1._layout is r2._layout
+    r2.info = 1
+    r1.info = 2
+    assert r1._layout is r2._layout
+
+def test_compact_resource_pickle():
+    r = CompactResource("r", path="x", tags=["a", "b"])
+    copied = pickle.loads(pickle.dumps(r))
+    eq_(copied, r)
+    eq_(copied.tags, set(["a", "b"]))
+
+def test_loads_json_uses_compact_resources():
+    rc = sefara.load(data_path("ex1.py"))
+    rc2 = sefara.loads(rc.to_json(), format="json")
+    assert all(isinstance(r, CompactResource) for r in rc2)
+    eq_(rc, rc2)
+    eq_(rc2.tags, rc.tags)
+    eq_([x.name for x in rc2.filter("tags.gamma and tags.sigma")],
+        ["dataset3", "dataset4"])
+    rc2["dataset1"].tags.add("gamma")
+    rc2["dataset1"].name = "renamed"
+    eq_([x.name for x in rc2.filter("tags.gamma")],
+        ["renamed", "dataset2", "dataset3", "dataset4"])
+    assert not any(
+        isinstance(r, CompactResource)
+        for r in sefara.loads(rc.to_json(), format="json", compact=False))
+
+def allocated_bytes(constructor, num):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        resources = [
+            constructor(
+                "resource%d" % i, path="/path", sample="s", tags=["a", "b"])
+            for i in range(num)
+        ]
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def test_compact_resources_use_less_memory():
+    resource_bytes = allocated_bytes(Resource, 2000)
+    compact_bytes = allocated_bytes(CompactResource, 2000)
+    assert compact_bytes < resource_bytes / 2, (compact_bytes, resource_bytes)
+
+def test_compact_resource_tags_identity():
+    r = CompactResource("r", tags=["a"])
+    tags = r.tags
+    assert r.tags is tags
+    r.tags.add("b")
+    eq_(tags, set(["a", "b"]))
+
+    r.tags = ["q"]
+    tags.add("stale")
+    eq_(r.tags, set(["q"]))
+    eq_(tags, set(["a", "b", "stale"]))
+
+    tags = r.tags
+    del r["tags"]
+    tags.add("stale")
+    assert "tags" not in r
+    r["tags"] = []
+    eq_(r.tags, set())
+
+def test_vocabulary_shares_tags():
+    rc = sefara.loads(
+        '{"r1": {"tags": ["a", "b"]}, "r2": {"tags": ["b", "a"]}}',
+        format="json")
+    (r1, r2) = list(rc)
+    assert r1._tag_tuple is r2._tag_tuple
+    assert r1._vocabulary is r2._vocabulary
+    rc2 = sefara.loads('{"r3": {"tags": ["a"]}}', format="json")
+    assert rc2["r3"]._vocabulary is not r1._vocabulary
+
+def test_large_vocabulary_memory():
+    def resource(i):
+        return CompactResource._from_fields(
+            {"tags": ["tag%d" % (i % 10000), "common"]},
+            name="resource%d" % i,
+            vocabulary=vocabulary)
+
+    vocabulary = sefara.compact.TagVocabulary()
+    for i in range(10000):
+        resource(i)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        resources = [resource(i) for i in range(2000)]
+        per_resource = (
+            tracemalloc.get_traced_memory()[0] - before) / len(resources)
+    finally:
+        tracemalloc.stop()
+    assert per_resource < 400, per_resource
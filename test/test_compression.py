@@ -0,0 +1,59 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+from nose.plugins.skip import SkipTest
+
+import sefara
+from sefara import compression
+from sefara.commands import dump
+from .test_resource_table import plain
+from . import data_path
+
+def check_roundtrip(name, compression_name=None):
+    rc = sefara.load(data_path("ex1.py"))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, name)
+        rc.write(path, compression=compression_name, compression_level=1)
+        with open(path, "rb") as fd:
+            data = fd.read()
+        eq_(compression.from_magic(data), compression_name or
+            compression.from_extension(name))
+        eq_(plain(sefara.load(path)), plain(rc))
+        eq_(plain(sefara.loads(data)), plain(rc))
+        eq_([r.name for r in sefara.load(path + "#filter=tags.gamma")],
+            ["dataset2", "dataset3", "dataset4"])
+    finally:
+        shutil.rmtree(directory)
+
+def test_compressed_collections():
+    for name in ["ex1.json.gz", "ex1.py.gz", "ex1.json.xz", "ex1.py.xz"]:
+        check_roundtrip(name)
+    # Detected from the content alone.
+    check_roundtrip("ex1.json", "gzip")
+
+def test_zstd():
+    try:
+        import zstandard  # noqa
+    except ImportError:
+        raise SkipTest("zstandard is not installed")
+    check_roundtrip("ex1.json.zst")
+
+def test_dump_compressed():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "out.json.gz")
+        dump.run([
+            data_path("ex1.py"),
+            "--no-environment-transforms",
+            "--out", path,
+            "--compression-level", "9",
+        ])
+        with gzip.open(path, "rb") as fd:
+            eq_(plain(sefara.loads(fd.read())),
+                plain(sefara.load(data_path("ex1.py"))))
+    finally:
+        shutil.rmtree(directory)
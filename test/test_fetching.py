@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from nose.tools import eq_, assert_raises
+from six.moves import BaseHTTPServer, socketserver
+
+import sefara
+from sefara import fetching, loading
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.body = b""
+        self.requests = []  # (path, request headers, status)
+        self.clients = set()
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.clients.add(self.client_address)
+        if self.path == "/moved":
+            return self.reply(302, b"", {"Location": "/collection.json"})
+        etag = '"%s"' % hashlib.sha1(server.body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self.reply(304, b"", {"ETag": etag})
+        body = server.body
+        headers = {"ETag": etag}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode="wb") as fd:
+                fd.write(body)
+            body = buffer.getvalue()
+            headers["Content-Encoding"] = "gzip"
+        self.reply(200, body, headers)
+
+    def reply(self, status, body, headers):
+        self.server.requests.append((self.path, dict(self.headers), status))
+        self.send_response(status)
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_fetch_and_load():
+    directory = tempfile.mkdtemp()
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    old_cache_dir = os.environ.get("SEFARA_CACHE_DIR")
+    os.environ["SEFARA_CACHE_DIR"] = directory
+    try:
+        url = "http://127.0.0.1:%d/collection.json" % server.server_port
+        server.body = b'{"a": {"tags": ["x"], "n": 1}, "b": {"n": 2}}'
+        pool = fetching.ConnectionPool()
+
+        response = fetching.fetch(url, pool=pool)
+        eq_(response.data, server.body)
+        assert not response.from_cache
+        eq_(server.requests[-1][1]["Accept-Encoding"], "gzip")
+
+        response = fetching.fetch(url, pool=pool)
+        eq_(response.data, server.body)
+        assert response.from_cache
+        eq_(server.requests[-1][2], 304)
+
+        # Within the TTL, or offline, the server is not contacted.
+        count = len(server.requests)
+        eq_(fetching.fetch(url, ttl=60, pool=pool).data, server.body)
+        eq_(fetching.fetch(url, offline=True, pool=pool).data, server.body)
+        eq_(len(server.requests), count)
+        with assert_raises(IOError):
+            fetching.fetch(url + "?other", offline=True, pool=pool)
+
+        # Redirects are followed. Conditional headers are only sent to the
+        # URL whose response is cached.
+        moved = "http://127.0.0.1:%d/moved" % server.server_port
+        eq_(fetching.fetch(moved, pool=pool).data, server.body)
+        response = fetching.fetch(moved, pool=pool)
+        eq_(response.data, server.body)
+        assert response.from_cache
+        eq_(response.location, url)
+        ((moved_path, moved_headers, _), (path, headers, status)) = (
+            server.requests[-2:])
+        eq_(moved_path, "/moved")
+        assert "If-None-Match" not in moved_headers
+        eq_((path, status), ("/collection.json", 304))
+        assert "If-None-Match" in headers
+
+        # All requests used one connection.
+        eq_(len(server.clients), 1)
+        pool.close()
+
+        rc = sefara.load(url + "#filter=n > 1", environment_transforms=False)
+        eq_([r.name for r in rc], ["b"])
+        rc["b"].n = 100
+        rc = sefara.load(url + "#filter=n > 1", environment_transforms=False)
+        eq_(server.requests[-1][2], 304)
+        eq_(rc["b"].n, 2)
+
+        server.body = b'{"c": {"n": 3}}'
+        rc = sefara.load(url, environment_transforms=False, cache=False)
+        eq_(server.requests[-1][2], 200)
+        eq_([r.name for r in rc], ["c"])
+    finally:
+        if old_cache_dir is None:
+            del os.environ["SEFARA_CACHE_DIR"]
+        else:
+            os.environ["SEFARA_CACHE_DIR"] = old_cache_dir
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory)
+
+def test_parsed_collections_bounded_by_bytes():
+    rc = sefara.load(
+        os.path.join(os.path.dirname(__file__), "data", "ex1.py"))
+    size = len(pickle.dumps(rc, pickle.HIGHEST_PROTOCOL))
+    parsed = loading._ParsedCollections(max_bytes=int(size * 2.5))
+    for key in ["a", "b", "c"]:
+        parsed.put(key, rc, [])
+    eq_(parsed.get("a"), None)
+    eq_(parsed.get("b"), rc)
+    eq_(parsed.get("c"), rc)
+
+    # Too large to keep at all.
+    parsed = loading._ParsedCollections(max_bytes=size - 1)
+    parsed.put("a", rc, [])
+    eq_(parsed.get("a"), None)
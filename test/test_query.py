@@ -0,0 +1,146 @@
+import itertools
+
+from nose.tools import eq_
+from sefara import Resource, ResourceCollection, ResourceTable
+from sefara.query import LazyCollection, _Stream
+from .test_columnar import synthetic_collection, EXPRESSIONS
+
+def outcome(function):
+    try:
+        return function()
+    except ValueError:
+        return ValueError
+
+def test_matches_eager():
+    rc = synthetic_collection()
+    rc[30].late = "yes"
+    expressions = EXPRESSIONS[:6] + [
+        "late is None", "late == 'yes' or depth < 3", lambda r: r.depth > 20]
+    for (first, second) in itertools.product(expressions, repeat=2):
+        if not (callable(first) or callable(second)):
+            # Consecutive string filters are combined into one.
+            expected = lambda: rc.filter("(%s) and (%s)" % (first, second))
+        else:
+            expected = lambda: rc.filter(first).filter(second)
+        eq_(outcome(lambda: rc.lazy().filter(first).filter(second).collect()),
+            outcome(expected))
+        eq_(outcome(lambda:
+                LazyCollection(iter(rc)).filter(first).filter(second)
+                .collect()),
+            outcome(expected))
+        eq_(outcome(lambda:
+                rc.lazy().filter(first).head(3).filter(second).collect()),
+            outcome(lambda: rc.filter(first).head(3).filter(second)))
+    eq_(rc.lazy().head(0).collect(), rc.head(0))
+    eq_(rc.lazy().select("name", "depth").to_dict(),
+        rc.select("name", "depth").to_dict())
+
+    table = ResourceTable.from_resources(rc)
+    result = table.lazy().filter("tags.even").head(4).collect()
+    assert isinstance(result, ResourceTable)
+    eq_(result, rc.filter("tags.even").head(4))
+
+def test_head_stops_early():
+    rc = synthetic_collection()
+    consumed = []
+
+    def resources():
+        for resource in rc:
+            consumed.append(resource)
+            yield resource
+
+    result = LazyCollection(resources()).filter("tags.fizz").head(2).collect()
+    eq_(result, rc.filter("tags.fizz").head(2))
+    eq_(len(consumed), 4)
+
+    # A resource held until a later attribute appears can still be part of
+    # the result.
+    consumed[:] = []
+    rc[10].extra = 1
+    result = LazyCollection(resources()).filter("extra is None").head(2)
+    eq_(result.collect(), rc.filter("extra is None").head(2))
+    eq_(len(consumed), 11)
+
+def test_repeated_names():
+    resources = [
+        Resource("a", depth=1),
+        Resource("b", depth=2),
+        Resource("a", depth=3),
+    ]
+    eq_([r.depth for r in LazyCollection(resources).filter("depth").collect()],
+        [3, 2])
+    eq_([r.depth for r in
+         LazyCollection(resources).filter("depth != 3").collect()],
+        [2])
+
+def test_filters_fused():
+    rc = synthetic_collection()
+    filtered = []
+    original_filter = ResourceCollection.filter
+
+    def recording_filter(self, expression, *args, **kwargs):
+        filtered.append(expression)
+        return original_filter(self, expression, *args, **kwargs)
+
+    ResourceCollection.filter = recording_filter
+    try:
+        result = rc.lazy().filter("tags.even").filter(
+            "depth > 10  # deep").head(3).filter("tags.fizz").collect()
+    finally:
+        ResourceCollection.filter = original_filter
+    eq_([r.name for r in result], ["sample12"])
+    eq_(filtered, ["(tags.even) and (depth > 10  # deep\n)", "tags.fizz"])
+
+def test_builtins_resolved():
+    rc = synthetic_collection()
+    stream = _Stream("len(name) > 1 and re.match('s', name)")
+    for resource in rc.head(5):
+        stream.add(resource)
+    eq_(stream.pending, {})
+    eq_(stream.frontier, 5)
+
+    consumed = []
+
+    def resources():
+        for resource in rc:
+            consumed.append(resource)
+            yield resource
+
+    result = LazyCollection(resources()).filter(
+        "len(resource.tags) > 1").head(2).collect()
+    eq_(result, rc.filter("len(resource.tags) > 1").head(2))
+    eq_(len(consumed), 4)
+
+def test_shadowed_environment_names():
+    # An attribute named like a builtin means the builtin is None in
+    # resources without it. When all attributes are known up front, the
+    # result is the same as ResourceCollection.filter.
+    resources = [Resource("a", depth=1), Resource("b", len=2)]
+    expression = "len is None"
+    eq_([r.name for r in
+            ResourceCollection(resources).lazy().filter(expression)
+            .collect()],
+        ["a"])
+    eq_([r.name for r in
+            LazyCollection(resources, attributes=set(["name", "len"]))
+            .filter(expression).collect()],
+        ["a"])
+
+    # When streaming, resources read before the attribute appeared were
+    # already evaluated with the builtin.
+    eq_([r.name for r in LazyCollection(iter(resources)).filter(expression)
+            .collect()],
+        [])
+
+def test_head_keeps_earlier_repeated_name():
+    resources = [
+        Resource("a", x=1),
+        Resource("b", x=2),
+        Resource("a", x=99),
+    ]
+    # The replacement of "a" comes after the head is complete, so it is not
+    # read.
+    eq_([r.x for r in LazyCollection(iter(resources)).head(1).collect()],
+        [1])
+    eq_([r.x for r in ResourceCollection(resources).lazy().head(1).collect()],
+        [99])
@@ -0,0 +1,24 @@
+from nose.tools import eq_
+import sefara
+from sefara.resource import EXPRESSION_CACHE, ExpressionCache
+from . import data_path
+
+def test_expression_cache_shared_across_filter_and_select():
+    rc = sefara.load(data_path("ex1.py"))
+    EXPRESSION_CACHE.clear()
+    eq_(len(rc.filter("tags.gamma and 'x' not in name")), 3)
+    info = EXPRESSION_CACHE.info()
+    eq_((info.hits, info.misses), (3, 1))
+    rc.select("tags.gamma and 'x' not in name")
+    eq_(EXPRESSION_CACHE.info().hits, 7)
+
+def test_expression_cache_eviction():
+    cache = ExpressionCache(maxsize=2)
+    first = cache.compile("1 + 1")
+    cache.compile("2 + 2")
+    cache.compile("1 + 1")
+    cache.compile("3 + 3")  # evicts "2 + 2"
+    assert cache.compile("1 + 1") is first
+    eq_(cache.info().currsize, 2)
+    cache.compile("2 + 2")
+    eq_(cache.info().misses, 4)
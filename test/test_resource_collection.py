@@ -1,4 +1,10 @@
-from nose.tools import eq_
+import collections
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_, assert_raises
 import sefara
 from . import data_path
 
@@ -93,4 +99,293 @@ def test_roundtrip():
     rc3 = sefara.loads(python, format="python")
     eq_(rc, rc3)
 
+def test_streaming_writers():
+    rc = sefara.load(data_path("ex1.py"))
+    empty = sefara.ResourceCollection([])
+    for collection in [rc, empty]:
+        for indent in [None, 0, 2, 4]:
+            eq_("".join(collection.iter_json(indent=indent)),
+                json.dumps(collection.to_plain_types(), indent=indent))
+
+    # Python output is written one resource at a time.
+    pieces = list(rc.iter_python())
+    eq_(len(pieces), 3 + len(rc))
+    eq_(sefara.loads("".join(pieces), format="python"), rc)
+
+    directory = tempfile.mkdtemp()
+    try:
+        for (filename, expected) in [
+                ("out.json", rc.to_json(indent=2)),
+                ("out.py", rc.to_python(indent=2))]:
+            path = os.path.join(directory, filename)
+            rc.write(path, indent=2)
+            with open(path) as fd:
+                written = fd.read()
+            # Python output starts with a comment giving the time.
+            eq_(written.split("\n", 1)[1], expected.split("\n", 1)[1])
+    finally:
+        shutil.rmtree(directory)
+
+
+
+def test_attributes_and_tags_track_changes():
+    rc = sefara.load(data_path("ex1.py"))
+    eq_(rc.attributes,
+        set(["name", "tags", "path", "foo", "something", "info"]))
+    rc["dataset1"].extra = 5
+    del rc["dataset1"]["foo"]
+    eq_(rc.attributes,
+        set(["name", "tags", "path", "extra", "something", "info"]))
+
+    rc["dataset2"].tags.discard("delta")
+    rc["dataset1"].tags = ["alpha", "omega"]
+    eq_(rc.tags,
+        set(["alpha", "gamma", "sigma", "four", "b", "omega"]))
+
+    removed = rc.remove("dataset1")
+    eq_(removed.name, "dataset1")
+    eq_(rc.attributes, set(["name", "tags", "path", "info"]))
+    eq_(rc.tags, set(["alpha", "gamma", "sigma", "four", "b"]))
+
+    rc.add(sefara.Resource("dataset5", tags=["new"], size=3))
+    eq_(rc.attributes, set(["name", "tags", "path", "info", "size"]))
+    eq_(rc.tags, set(["alpha", "gamma", "sigma", "four", "b", "new"]))
+    eq_([x.name for x in rc.filter("tags.new or size == 3")], ["dataset5"])
+
+def test_assign_resources():
+    rc = sefara.load(data_path("ex1.py"))
+    assert "beta" in rc.tags
+    old = rc["dataset1"]
+    rc.resources = collections.OrderedDict(
+        (name, rc[name]) for name in ["dataset3", "dataset2"])
+    eq_([x.name for x in rc], ["dataset3", "dataset2"])
+    eq_(list(rc.resources), ["dataset3", "dataset2"])
+    eq_(rc.tags, rc["dataset3"].tags | rc["dataset2"].tags)
+    # Resources no longer in the collection don't update it.
+    old.tags.add("gone")
+    assert "gone" not in rc.tags
+
+    rc.resources = [sefara.Resource("new", tags=["x"], size=1)]
+    eq_(rc.attributes, set(["name", "tags", "size"]))
+    eq_([x.name for x in rc.filter("tags.x")], ["new"])
+
+def test_positional_access():
+    rc = sefara.load(data_path("ex1.py"))
+    eq_([rc[i].name for i in range(len(rc))],
+        ["dataset1", "dataset2", "dataset3", "dataset4"])
+    eq_(rc[-1].name, "dataset4")
+    eq_([x.name for x in rc[1:3]], ["dataset2", "dataset3"])
+    rc.remove("dataset2")
+    rc.add(sefara.Resource("dataset5"))
+    eq_([rc[i].name for i in range(len(rc))],
+        ["dataset1", "dataset3", "dataset4", "dataset5"])
+    eq_(rc.filter("name == 'dataset5'").singleton().name, "dataset5")
+
+def test_rename_updates_name_index():
+    rc = sefara.load(data_path("ex1.py"))
+    subset = rc.filter("tags.gamma")
+    rc["dataset2"].name = "renamed"
+    eq_(rc["renamed"].path, "/path/to/somewhere/else.bam")
+    eq_(subset["renamed"].path, "/path/to/somewhere/else.bam")
+    assert "dataset2" not in rc.resources
+    assert_raises(KeyError, rc.__getitem__, "dataset2")
+    eq_([x.name for x in rc],
+        ["dataset1", "renamed", "dataset3", "dataset4"])
+    eq_(list(rc.resources), ["dataset1", "renamed", "dataset3", "dataset4"])
+
+def test_rename_onto_used_name():
+    rc = sefara.load(data_path("ex1.py"))
+    eq_(len(rc.resources), 4)
+    rc["dataset1"].name = "dataset3"
+    # Both resources now have the name. As when loading a collection with a
+    # repeated name, the later one wins.
+    eq_(rc["dataset3"].path, "/path/to/somewhere/else2.bam")
+    eq_(list(rc.resources), ["dataset3", "dataset2", "dataset4"])
+    rc[0].name = "dataset1"
+    eq_(rc["dataset1"].path, "/path/to/file1.csv")
+    eq_(rc["dataset3"].path, "/path/to/somewhere/else2.bam")
+    eq_(list(rc.resources), ["dataset1", "dataset2", "dataset3", "dataset4"])
+
+def test_owners_registered_lazily():
+    rc = sefara.load(data_path("ex1.py"))
+    resource = rc["dataset2"]
+    rc.filter("tags.gamma")
+    num_owners = len(resource._owners)
+    for _ in range(10):
+        rc.filter("tags.gamma").head(2)
+    eq_(len(resource._owners), num_owners)
+
+    # Registered when a cache that must be kept up to date is built.
+    subset = rc.filter("tags.gamma")
+    eq_(subset.tags,
+        set(["alpha", "b", "delta", "four", "gamma", "sigma"]))
+    eq_(len(resource._owners), num_owners + 1)
+    resource.tags.add("new")
+    assert "new" in subset.tags
+    del subset
+    rc.filter("tags.gamma")["dataset2"]
+    eq_(len(resource._owners), num_owners + 1)
+
+CONCURRENT_COLLECTION = """
+import time
+from sefara import export, transform_exports
+
+for i in range(20):
+    export("%s-%d" % (PREFIX, i), number=i)
+    time.sleep(0.001)
+export(number=-1)
+transform_exports("transform.py")
+"""
+
+CONCURRENT_TRANSFORM = """
+def transform(collection):
+    for resource in collection:
+        resource.prefix = PREFIX
+"""
+
+def test_concurrent_load():
+    from concurrent import futures
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        for prefix in ["a", "b", "c", "d", "e", "f"]:
+            subdirectory = os.path.join(directory, prefix)
+            os.mkdir(subdirectory)
+            definition = "PREFIX = %r\n" % prefix
+            with open(os.path.join(subdirectory, "collection.py"), "w") as fd:
+                fd.write(definition + CONCURRENT_COLLECTION)
+            with open(os.path.join(subdirectory, "transform.py"), "w") as fd:
+                fd.write(definition + CONCURRENT_TRANSFORM)
+            paths.append(os.path.join(subdirectory, "collection.py"))
+        cwd = os.getcwd()
+        with futures.ThreadPoolExecutor(len(paths)) as pool:
+            collections = list(pool.map(
+                lambda path: sefara.load(path, environment_transforms=False),
+                paths * 3))
+        eq_(os.getcwd(), cwd)
+        names = set()
+        for (path, rc) in zip(paths * 3, collections):
+            prefix = os.path.basename(os.path.dirname(path))
+            eq_(len(rc), 21)
+            eq_(set(r.prefix for r in rc), set([prefix]))
+            eq_([r.name for r in rc][:2], [prefix + "-0", prefix + "-1"])
+            names.add(list(rc)[-1].name)
+        # Generated names are unique.
+        eq_(len(names), len(collections))
+    finally:
+        shutil.rmtree(directory)
+
+RELATIVE_PATH_COLLECTION = """
+from sefara import export
+import os
+export("a", found=os.path.exists("names.txt"), cwd=os.getcwd())
+"""
+
+def test_collection_working_directory():
+    directory = tempfile.mkdtemp()
+    original_value = os.environ.pop("SEFARA_CHDIR", None)
+    try:
+        path = os.path.join(directory, "collection.py")
+        with open(path, "w") as fd:
+            fd.write(RELATIVE_PATH_COLLECTION)
+        with open(os.path.join(directory, "names.txt"), "w") as fd:
+            fd.write("a\n")
+        cwd = os.getcwd()
+
+        # Relative paths opened by the file are relative to the working
+        # directory of the caller.
+        rc = sefara.load(path, environment_transforms=False)
+        eq_(rc["a"].found, False)
+        eq_(rc["a"].cwd, cwd)
+
+        # Unless SEFARA_CHDIR is set.
+        os.environ["SEFARA_CHDIR"] = "1"
+        rc = sefara.load(path, environment_transforms=False)
+        eq_(rc["a"].found, True)
+        eq_(rc["a"].cwd, os.path.realpath(directory))
+        eq_(os.getcwd(), cwd)
+    finally:
+        if original_value is None:
+            os.environ.pop("SEFARA_CHDIR", None)
+        else:
+            os.environ["SEFARA_CHDIR"] = original_value
+        shutil.rmtree(directory)
+
+def test_load_many():
+    directory = tempfile.mkdtemp()
+    try:
+        for project in ["p1", "p2"]:
+            os.mkdir(os.path.join(directory, project))
+            with open(os.path.join(
+                    directory, project, "collection.py"), "w") as fd:
+                fd.write(
+                    "from sefara import export\n"
+                    "export('%s-a', project='%s')\n"
+                    "export('shared', project='%s')\n" % (
+                        project, project, project))
+        json_path = os.path.join(directory, "extra.json")
+        with open(json_path, "w") as fd:
+            fd.write('{"shared": {"project": "json"}, "b": {"tags": ["x"]}}')
+        pattern = os.path.join(directory, "*", "collection.py")
+        sources = [pattern, json_path]
+        p1 = os.path.join(directory, "p1", "collection.py")
+        p2 = os.path.join(directory, "p2", "collection.py")
+
+        with assert_raises(ValueError):
+            sefara.load_many(sources, environment_transforms=False)
+        with assert_raises(ValueError):
+            sefara.load_many([os.path.join(directory, "*.nothing")])
+
+        for jobs in [1, 3]:
+            def load(on_conflict):
+                return sefara.load_many(
+                    sources,
+                    jobs=jobs,
+                    on_conflict=on_conflict,
+                    environment_transforms=False)
+
+            rc = load("first")
+            eq_([(r.name, r.project) for r in rc if "project" in r], [
+                ("p1-a", "p1"), ("shared", "p1"), ("p2-a", "p2")])
+            eq_(rc.provenance["shared"], p1)
+            eq_(rc.provenance["b"], json_path)
+
+            rc = load("last")
+            eq_([r.name for r in rc], ["p1-a", "shared", "p2-a", "b"])
+            eq_(rc["shared"].project, "json")
+            eq_(rc.provenance["shared"], json_path)
+
+            rc = load("rename")
+            eq_([r.name for r in rc],
+                ["p1-a", "shared", "p2-a", "shared-2", "shared-3", "b"])
+            eq_([rc[name].project for name in ["shared-2", "shared-3"]],
+                ["p2", "json"])
+            eq_(rc.provenance["shared-2"], p2)
+
+        rc = sefara.load_many(
+            [p1, json_path + "#filter=tags.x"],
+            environment_transforms=False,
+            table=True)
+        assert isinstance(rc, sefara.ResourceTable)
+        eq_(list(rc.resources), ["p1-a", "shared", "b"])
+    finally:
+        shutil.rmtree(directory)
+
+def test_load_filters_use_collection_filter():
+    filtered = []
+    original_filter = sefara.ResourceCollection.filter
+
+    def recording_filter(self, expression, *args, **kwargs):
+        filtered.append(expression)
+        return original_filter(self, expression, *args, **kwargs)
 
+    sefara.ResourceCollection.filter = recording_filter
+    try:
+        rc = sefara.load(
+            data_path("ex1.py") + "#filter=tags.gamma&filter=tags.sigma",
+            environment_transforms=False)
+    finally:
+        sefara.ResourceCollection.filter = original_filter
+    eq_([r.name for r in rc], ["dataset3", "dataset4"])
+    eq_(filtered, ["(tags.gamma) and (tags.sigma)"])
@@ -0,0 +1,156 @@
+import gc
+import pickle
+
+import numpy
+
+from nose.tools import eq_, assert_raises
+import sefara
+from sefara import ResourceTable, ResourceCollection
+from . import data_path
+from .test_columnar import (
+    synthetic_collection, typed_collection, EXPRESSIONS, TYPED_EXPRESSIONS)
+
+def plain(rc):
+    result = rc.to_plain_types()
+    for value in result.values():
+        value["tags"] = sorted(value["tags"])
+    return result
+
+def synthetic_table():
+    return ResourceTable.from_resources(synthetic_collection())
+
+def test_matches_collection():
+    rc = synthetic_collection()
+    table = synthetic_table()
+    eq_(len(table), len(rc))
+    eq_(table.attributes, rc.attributes)
+    eq_(table.tags, rc.tags)
+    eq_(table, rc)
+    eq_(plain(table), plain(rc))
+    eq_(list(table.resources), list(rc.resources))
+    eq_(table[3], rc[3])
+    eq_(table[numpy.int64(3)], rc[numpy.int64(3)])
+    eq_(table[numpy.int64(3)], rc[3])
+    eq_(table["sample07"], rc["sample07"])
+    eq_(table[-2:], rc[-2:])
+    for expression in EXPRESSIONS:
+        eq_(plain(table.filter(expression)), plain(rc.filter(expression)))
+    eq_(table.filter(lambda r: r.depth > 45),
+        rc.filter(lambda r: r.depth > 45))
+    eq_(table.select("name", "kit: capture_kit").to_dict(),
+        rc.select("name", "kit: capture_kit").to_dict())
+    eq_(table.select("name.upper()", "depth").to_dict(),
+        rc.select("name.upper()", "depth").to_dict())
+
+def test_load():
+    rc = sefara.load(data_path("ex1.py"))
+    for table in [sefara.load(data_path("ex1.py"), table=True),
+                  sefara.loads(rc.to_json(), table=True)]:
+        assert isinstance(table, ResourceTable)
+        eq_(table, rc)
+        eq_(table.filter("tags.beta"), rc.filter("tags.beta"))
+        eq_(table.filter("tags.alpha and info").select("path").to_dict(),
+            rc.filter("tags.alpha and info").select("path").to_dict())
+
+def test_mutation():
+    table = synthetic_table()
+    subset = table.filter("tags.fizz")
+    resource = subset[0]
+    resource.depth = 1000
+    resource.tags.add("big")
+    resource.tags.remove("fizz")
+    resource.capture_kit = "new_kit"
+    eq_(table.filter("depth > 999"), subset.filter("tags.big"))
+    eq_(len(table.filter("tags.fizz")), len(subset) - 1)
+    eq_(list(table.filter("capture_kit == 'new_kit'").resources),
+        [resource.name])
+    assert "big" in table.tags
+
+    resource.name = "renamed"
+    assert table["renamed"] is resource
+    assert_raises(KeyError, lambda: table["sample00"])
+    assert "sample00" not in table.resources
+
+    del resource["capture_kit"]
+    eq_(len(table.filter("capture_kit == 'new_kit'")), 0)
+
+def test_add_remove():
+    table = synthetic_table()
+    subset = table.filter("tags.even")
+    subset.add(sefara.Resource("extra", tags=["even", "extra"], depth=-1))
+    eq_(subset[-1].name, "extra")
+    eq_(len(subset.filter("tags.extra")), 1)
+    eq_(len(table), 50)
+    assert "extra" not in table.resources
+    assert_raises(ValueError, subset.add, sefara.Resource("extra"))
+    removed = subset.remove("sample02")
+    eq_(removed.depth, 2)
+    assert "sample02" not in subset.resources
+    assert "sample02" in table.resources
+    eq_(len(subset), 25)
+
+def test_add_many():
+    rc = synthetic_collection()
+    table = ResourceTable.from_resources(rc[:1])
+    head = table.head(1)
+    eq_(len(table.filter("tags.fizz")), 1)
+    for resource in rc[1:]:
+        table.add(sefara.Resource(**dict(resource.items())))
+    eq_(plain(table), plain(rc))
+    eq_(table.tags, rc.tags)
+    eq_(plain(table.filter("tags.fizz and not tags.even")),
+        plain(rc.filter("tags.fizz and not tags.even")))
+    eq_(len(head), 1)
+    head.add(sefara.Resource("extra", tags=["fizz"]))
+    eq_(len(table), 50)
+    eq_(len(table.filter("tags.fizz")), 17)
+    eq_(len(head.filter("tags.fizz")), 2)
+
+def test_add_name_from_parent():
+    table = synthetic_table()
+    subset = table.filter("tags.even")
+    subset.add(sefara.Resource("sample01", depth=-1))
+    eq_(subset["sample01"].depth, -1)
+    eq_(table["sample01"].depth, 1)
+    subset.remove("sample01")
+    eq_(table["sample01"].depth, 1)
+    assert "sample01" not in subset.resources
+
+    # A removed name can be added again.
+    subset.remove("sample02")
+    subset.add(sefara.Resource("sample02", depth=-2))
+    eq_(subset["sample02"].depth, -2)
+    eq_(table["sample02"].depth, 2)
+
+def test_resources_not_kept():
+    table = synthetic_table()
+    resource = table[3]
+    for other in table:
+        other.depth = other.depth
+    del other
+    gc.collect()
+    eq_(list(table._store.materialized.keys()), [3])
+    resource.depth = 300
+    del resource
+    gc.collect()
+    eq_(len(table._store.materialized), 0)
+    eq_(table[3].depth, 300)
+    assert table[3] is table[3]
+
+def test_filter_engine():
+    table = synthetic_table()
+    for expression in EXPRESSIONS:
+        eq_(plain(table.filter(expression, engine="python")),
+            plain(table.filter(expression)))
+    typed = ResourceTable.from_resources(typed_collection())
+    for expression in TYPED_EXPRESSIONS:
+        eq_([r.name for r in typed.filter(expression, engine="python")],
+            [r.name for r in typed.filter(expression)],
+            expression)
+    assert_raises(ValueError, table.filter, "tags.even", engine="other")
+
+def test_pickle():
+    table = synthetic_table().filter("tags.odd")
+    table[0].depth = 99
+    copy = pickle.loads(pickle.dumps(table))
+    eq_(copy, table)
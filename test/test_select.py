@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_, assert_raises
+
+import sefara
+from sefara.commands import select
+from . import data_path
+
+def run_select(*argv):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "out.txt")
+        select.run(
+            [data_path("ex1.py")] + list(argv) +
+            ["--no-environment-transforms", "--out", path])
+        with open(path) as fd:
+            return fd.read()
+    finally:
+        shutil.rmtree(directory)
+
+def test_fields_after_collection():
+    eq_(run_select("name", "--filter", "tags.sigma", "--format", "raw"),
+        "dataset3\ndataset4\n")
+    eq_(run_select("name", "foo", "--filter", "tags.beta", "--format", "raw"),
+        "dataset1zzz\n")
+
+def test_merge():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "extra.json")
+        with open(path, "w") as fd:
+            fd.write('{"extra": {"tags": ["sigma"]}}')
+        eq_(run_select(
+                "name",
+                "--merge", path,
+                "--filter", "tags.sigma",
+                "--format", "raw"),
+            "dataset3\ndataset4\nextra\n")
+    finally:
+        shutil.rmtree(directory)
+
+def test_formats():
+    eq_(run_select("name", "n: len(tags)", "--filter", "tags.gamma"),
+        "# name,n\ndataset2,3\ndataset3,4\ndataset4,4\n")
+    eq_(run_select("name", "foo", "--format", "raw"),
+        "dataset1zzz\ndataset2\ndataset3\ndataset4\n")
+    eq_(run_select("name", "n: len(tags)", "--format", "args"),
+        " --name dataset1 dataset2 dataset3 dataset4 --n 2 3 4 4\n")
+    eq_(run_select(
+            "name", "n: len(tags)", "--format", "args-repeated",
+            "--filter", "tags.sigma"),
+        " --name dataset3 --n 4 --name dataset4 --n 4\n")
+
+def test_if_error():
+    eq_(run_select("foo.upper()", "--if-error", "skip"), "ZZZ\n")
+    eq_(run_select("name", "x: foo.upper()", "--if-error", "none"),
+        "# name,x\ndataset1,ZZZ\ndataset2,\ndataset3,\ndataset4,\n")
+    assert_raises(ValueError, run_select, "foo.upper()")
+
+def test_iter_select():
+    rc = sefara.load(data_path("ex1.py"))
+    rows = rc.iter_select("name", "x: foo.upper()", if_error="skip")
+    eq_(next(rows), ["dataset1", "ZZZ"])
+    eq_(list(rows), [])
+    eq_(list(rc.iter_select("name", "foo", if_error="none"))[1],
+        ["dataset2", None])
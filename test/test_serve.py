@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from nose.tools import eq_, assert_raises
+
+from sefara import environment, serving
+from sefara.commands import select, dump, util
+from . import data_path
+
+class running_server(object):
+    """
+    Context manager running a daemon on a temporary socket, which the
+    commandline tools use.
+    """
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "serve.sock")
+        self.old_socket = os.environ.get(
+            environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE)
+        os.environ[environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE] = self.path
+        self.server = serving.Server()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        while not os.path.exists(self.path):
+            self.thread.join(0.01)
+        return self.server
+
+    def __exit__(self, *args):
+        self.server.stop()
+        self.thread.join()
+        if self.old_socket is None:
+            del os.environ[environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE]
+        else:
+            os.environ[environment.SERVE_SOCKET_ENVIRONMENT_VARIABLE] = (
+                self.old_socket)
+        shutil.rmtree(self.directory)
+
+def run_tool(tool, argv):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "out.txt")
+        tool.run(argv + ["--out", path])
+        with open(path) as fd:
+            return fd.read()
+    finally:
+        shutil.rmtree(directory)
+
+def test_tools_use_daemon():
+    directory = tempfile.mkdtemp()
+    try:
+        collection = os.path.join(directory, "ex1.py")
+        shutil.copy(data_path("ex1.py"), collection)
+        select_argv = [
+            collection, "name", "path", "--filter", "tags.gamma",
+            "--no-environment-transforms"]
+        dump_argv = [collection, "--format", "json",
+            "--no-environment-transforms"]
+        expected = [
+            run_tool(select, select_argv + ["--no-daemon"]),
+            run_tool(dump, dump_argv + ["--no-daemon"]),
+        ]
+        with running_server() as server:
+            eq_(server.loaded(), [])
+            eq_([run_tool(select, select_argv), run_tool(dump, dump_argv)],
+                expected)
+            eq_(sorted(length for (_, _, length) in server.loaded()), [3, 4])
+            eq_(os.stat(server.path).st_mode & 0o777, 0o600)
+
+            # Concurrent requests for the same collection.
+            outputs = []
+            threads = [
+                threading.Thread(target=lambda: outputs.append(
+                    run_tool(select, select_argv)))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            eq_(outputs, [expected[0]] * 8)
+
+            # Errors in evaluating expressions are raised by the tool.
+            assert_raises(
+                ValueError, run_tool, select, [collection, "foo.upper()"])
+
+            # Changing the collection file reloads it.
+            with open(collection, "a") as fd:
+                fd.write("\nexport(name='extra', tags=['gamma'])\n")
+            os.utime(collection, (0, 0))
+            eq_(run_tool(select, select_argv).splitlines()[-1], "extra,")
+
+            # Requests with other environment variables are not sent to the
+            # daemon.
+            loaded = server.loaded()
+            old_transform = os.environ.get(
+                environment.TRANSFORM_ENVIRONMENT_VARIABLE)
+            os.environ[environment.TRANSFORM_ENVIRONMENT_VARIABLE] = (
+                data_path("transform_ex1.py"))
+            try:
+                eq_(run_tool(select, [collection, "posix_path"])
+                        .splitlines()[0], "/path/to/dataset1.bam")
+            finally:
+                if old_transform is None:
+                    del os.environ[environment.TRANSFORM_ENVIRONMENT_VARIABLE]
+                else:
+                    os.environ[environment.TRANSFORM_ENVIRONMENT_VARIABLE] = (
+                        old_transform)
+            eq_(server.loaded(), loaded)
+    finally:
+        shutil.rmtree(directory)
+
+def test_socket_permissions():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "new", "serve.sock")
+        server = serving.Server(path=path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            while not os.path.exists(path):
+                thread.join(0.01)
+            eq_(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+            eq_(os.stat(path).st_mode & 0o777, 0o600)
+            # Connections from our own user are answered.
+            connection = serving.request({"command": "ping"}, path=path)
+            assert connection is not None
+            connection.close()
+        finally:
+            server.stop()
+            thread.join()
+    finally:
+        shutil.rmtree(directory)
+
+def test_stdin_not_sent_to_daemon():
+    with running_server():
+        for argv in [["-", "name"], [data_path("ex1.py"), "--merge", "-"]]:
+            args = select.parser.parse_args(argv)
+            eq_(util.run_in_daemon("select", args), None)
+        args = select.parser.parse_args([data_path("ex1.py"), "name"])
+        output = util.run_in_daemon("select", args)
+        eq_("".join(output).splitlines()[0], "dataset1")
+
+def test_no_daemon():
+    path = os.path.join(tempfile.mkdtemp(), "missing.sock")
+    eq_(serving.request({"command": "ping"}, path=path), None)
+    eq_(serving.run_command("select", {}, path=path), None)
+
+def test_reload_with_fragment():
+    directory = tempfile.mkdtemp()
+    try:
+        collection = os.path.join(directory, "ex1.py")
+        shutil.copy(data_path("ex1.py"), collection)
+        argv = [
+            collection + "#filter=tags.sigma", "name",
+            "--no-environment-transforms"]
+        with running_server():
+            eq_(run_tool(select, argv), "dataset3\ndataset4\n")
+            with open(collection, "a") as fd:
+                fd.write("\nexport(name='extra', tags=['sigma'])\n")
+            os.utime(collection, (0, 0))
+            eq_(run_tool(select, argv), "dataset3\ndataset4\nextra\n")
+    finally:
+        shutil.rmtree(directory)
+
+def test_environment_signature():
+    names = ["SEFARA_TEST_VARIABLE_1", "SEFARA_TEST_VARIABLE_2"]
+    old_value = os.environ.get(
+        environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE)
+    os.environ[environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE] = (
+        ":".join(names))
+    try:
+        os.environ[names[1]] = "a"
+        signature = serving.environment_signature()
+        eq_(signature[names[0]], None)
+        eq_(signature[names[1]], "a")
+    finally:
+        del os.environ[names[1]]
+        if old_value is None:
+            del os.environ[environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE]
+        else:
+            os.environ[environment.CACHE_VARIABLES_ENVIRONMENT_VARIABLE] = (
+                old_value)
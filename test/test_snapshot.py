@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+import sefara
+from sefara import snapshot
+
+COLLECTION = """
+import os
+from sefara import export, transform_exports
+
+with open(os.path.join(os.path.dirname(__file__), "executions.log"), "a") as fd:
+    fd.write("x")
+
+export("dataset1", path="/path/to/file1.csv", tags=["alpha", "beta"])
+export("dataset2", path="/path/to/file2.csv", tags=["alpha"])
+transform_exports("%s")
+"""
+
+TRANSFORM = """
+def transform(collection):
+    for resource in collection:
+        resource.kind = %r
+"""
+
+def write(filename, content):
+    with open(filename, "w") as fd:
+        fd.write(content)
+
+def test_snapshot_cache():
+    directory = tempfile.mkdtemp()
+    old_environ = dict(os.environ)
+    try:
+        cache_dir = os.path.join(directory, "cache")
+        os.environ["SEFARA_CACHE_DIR"] = cache_dir
+        os.environ.pop("SEFARA_TRANSFORM", None)
+        collection = os.path.join(directory, "collection.py")
+        transform = os.path.join(directory, "transform.py")
+        log = os.path.join(directory, "executions.log")
+        write(collection, COLLECTION % transform)
+        write(transform, TRANSFORM % "csv")
+
+        def executions():
+            with open(log) as fd:
+                return len(fd.read())
+
+        rc = sefara.load(collection)
+        eq_(executions(), 1)
+        cached = sefara.load(collection)
+        eq_(executions(), 1)
+        eq_(cached, rc)
+        eq_(cached[0].kind, "csv")
+
+        # The cached collection tracks modifications like any other.
+        cached[0].extra = 1
+        assert "extra" in cached.attributes
+
+        # Filters are part of the key.
+        eq_(len(sefara.load(collection + "#filter=tags.beta")), 1)
+        eq_(executions(), 2)
+        eq_(len(sefara.load(collection + "#filter=tags.beta")), 1)
+        eq_(executions(), 2)
+
+        # Changing a transform file invalidates the snapshot.
+        write(transform, TRANSFORM % "bam")
+        eq_(sefara.load(collection)[0].kind, "bam")
+        eq_(executions(), 3)
+
+        # So do environment variables.
+        os.environ["SEFARA_TRANSFORM"] = transform
+        sefara.load(collection)
+        eq_(executions(), 4)
+        os.environ["SEFARA_CACHE_VARIABLES"] = "SOME_VARIABLE"
+        os.environ["SOME_VARIABLE"] = "1"
+        sefara.load(collection)
+        eq_(executions(), 5)
+        sefara.load(collection)
+        eq_(executions(), 5)
+
+        sefara.load(collection, cache=False)
+        eq_(executions(), 6)
+
+        eq_(snapshot.invalidate(collection), 4)
+        sefara.load(collection)
+        eq_(executions(), 7)
+
+        eq_(snapshot.evict(limit=0), 1)
+        eq_(snapshot.clear(), 0)
+    finally:
+        os.environ.clear()
+        os.environ.update(old_environ)
+        shutil.rmtree(directory)
+
+NESTED_COLLECTION = """
+import os
+import sefara
+from sefara import export
+
+with open(os.path.join(os.path.dirname(__file__), "executions.log"), "a") as fd:
+    fd.write("x")
+
+for resource in sefara.load(%r, transforms=[%r]):
+    export(resource.name, kind=resource.kind)
+"""
+
+def test_nested_load_hook_files():
+    directory = tempfile.mkdtemp()
+    old_environ = dict(os.environ)
+    try:
+        os.environ["SEFARA_CACHE_DIR"] = os.path.join(directory, "cache")
+        os.environ.pop("SEFARA_TRANSFORM", None)
+        inner = os.path.join(directory, "inner.json")
+        outer = os.path.join(directory, "outer.py")
+        transform = os.path.join(directory, "transform.py")
+        log = os.path.join(directory, "executions.log")
+        write(inner, sefara.load(
+            os.path.join(os.path.dirname(__file__), "data", "ex1.py")
+        ).to_json())
+        write(outer, NESTED_COLLECTION % (inner, transform))
+        write(transform, TRANSFORM % "csv")
+
+        def executions():
+            with open(log) as fd:
+                return len(fd.read())
+
+        # The inner collection is already cached when the outer one runs.
+        sefara.load(inner, transforms=[transform])
+        eq_(sefara.load(outer)[0].kind, "csv")
+        eq_(sefara.load(outer)[0].kind, "csv")
+        eq_(executions(), 1)
+
+        # The outer snapshot depends on the transform run by the inner load.
+        write(transform, TRANSFORM % "bam")
+        eq_(sefara.load(outer)[0].kind, "bam")
+        eq_(executions(), 2)
+        write(transform, TRANSFORM % "vcf")
+        eq_(sefara.load(outer)[0].kind, "vcf")
+        eq_(executions(), 3)
+    finally:
+        os.environ.clear()
+        os.environ.update(old_environ)
+        shutil.rmtree(directory)
+
+def test_table_snapshot():
+    directory = tempfile.mkdtemp()
+    try:
+        collection = os.path.join(directory, "collection.json")
+        write(collection, sefara.load(
+            os.path.join(os.path.dirname(__file__), "data", "ex1.py")
+        ).to_json())
+        rc = sefara.load(collection, table=True, cache=True)
+        cached = sefara.load(collection, table=True, cache=True)
+        assert isinstance(cached, sefara.ResourceTable)
+        eq_(cached, rc)
+        cached[0].tags.add("new_tag")
+        eq_(len(cached.filter("tags.new_tag")), 1)
+    finally:
+        snapshot.invalidate(collection)
+        shutil.rmtree(directory)
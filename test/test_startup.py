@@ -0,0 +1,68 @@
+'''
+Guard against regressions in the import time of the commandline tools.
+'''
+
+import json
+import subprocess
+import sys
+
+from nose.tools import eq_
+
+from . import data_path
+
+# Modules that must not be imported just to start a tool or load a
+# collection.
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "http.client"]
+
+# Generous compared to the typical import time of a tool (tens of
+# milliseconds), but well under the time to import pandas.
+STARTUP_BUDGET_SECONDS = 0.25
+
+def run_python(code):
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], stderr=subprocess.STDOUT)
+    return output.decode("utf-8")
+
+def imported_heavy_modules(code):
+    output = run_python(
+        code + "\n"
+        "import json, sys\n"
+        "print(json.dumps([m for m in %r if m in sys.modules]))\n"
+        % HEAVY_MODULES)
+    return json.loads(output.strip().splitlines()[-1])
+
+def test_tools_do_not_import_heavy_modules():
+    eq_(imported_heavy_modules(
+        "import sefara.commands.check, sefara.commands.dump, "
+        "sefara.commands.env, sefara.commands.select"), [])
+    eq_(imported_heavy_modules(
+        "import sefara\n"
+        "rc = sefara.load(%r)\n"
+        "rc.to_json()\n"
+        "list(rc.iter_select('name', 'path'))\n" % data_path("ex1.py")), [])
+    eq_(imported_heavy_modules(
+        "import sefara\n"
+        "rc = sefara.load(%r)\n"
+        "rc.filter('tags.gamma and not tags.b')\n"
+        "sefara.load(%r).filter('tags.x')\n" % (
+            data_path("ex1.py"), data_path("ex1.py#filter=tags.gamma"))), [])
+
+def test_select_imports_pandas():
+    assert "pandas" in imported_heavy_modules(
+        "import sefara\n"
+        "sefara.load(%r).select('name')\n" % data_path("ex1.py"))
+
+def test_startup_time():
+    # The best of a few runs, to ignore a busy machine.
+    times = []
+    for _ in range(3):
+        output = run_python(
+            "import time\n"
+            "start = time.time()\n"
+            "import sefara.commands.select\n"
+            "print(time.time() - start)\n")
+        times.append(float(output.strip().splitlines()[-1]))
+    elapsed = min(times)
+    assert elapsed < STARTUP_BUDGET_SECONDS, (
+        "Importing sefara-select took %0.3f sec (budget: %0.3f sec)" % (
+            elapsed, STARTUP_BUDGET_SECONDS))
@@ -0,0 +1,69 @@
+import collections
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_, assert_raises
+import sefara
+from sefara import streaming
+from .test_columnar import synthetic_collection, EXPRESSIONS
+
+DOCUMENTS = [
+    '{}',
+    ' { } ',
+    '{"a": {"x": 1}}',
+    '{"a": {"x": 12345678}, "b" : {"y": [1, 2.5e10, null, true]}}',
+    '{"r\\u00e9sum\\u00e9": {"name\\"": "\\u2603 snow"}, "\\u2603": {}}\n',
+    '{"a": {"x": 1}, "b": {}, "a": {"x": 2}}',
+]
+
+def test_iter_json_object():
+    for document in DOCUMENTS:
+        expected = list(json.loads(document).items())
+        for chunk_size in [1, 2, 3, 7, 1000]:
+            for data in [document, document.encode("utf-8")]:
+                fd = io.BytesIO(data) if isinstance(data, bytes) else (
+                    io.StringIO(data))
+                pairs = streaming.iter_json_object(fd, chunk_size=chunk_size)
+                eq_(list(collections.OrderedDict(pairs).items()), expected)
+    for document in ['', '[]', '{"a": 1', '{"a": 1,}', '{"a": 1} x', '{1: 2}']:
+        assert_raises(
+            ValueError,
+            lambda: list(streaming.iter_json_object(
+                io.StringIO(document), chunk_size=2)))
+
+def test_filter_while_loading():
+    rc = synthetic_collection()
+    # An attribute that first appears late in the collection.
+    rc[-1].late = "yes"
+    data = rc.to_json()
+    for expression in EXPRESSIONS + [
+            "late is None", "late == 'yes' or depth < 3",
+            "[x for x in [depth] if x > 45]", lambda r: r.depth % 11 == 0]:
+        loaded = sefara.loads(data, environment_transforms=False)
+        streamed = streaming.read_collection(
+            io.StringIO(data), filters=[expression])
+        eq_(streamed, loaded.filter(expression))
+        eq_(streaming.read_collection(
+                io.BytesIO(data.encode("utf-8")),
+                table=True,
+                filters=[expression]),
+            loaded.filter(expression))
+
+def test_load():
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "collection.json")
+        rc = synthetic_collection()
+        with open(filename, "w") as fd:
+            fd.write(rc.to_json())
+        eq_(sefara.load(filename), rc)
+        eq_(sefara.load(filename + "#filter=tags.fizz&filter=depth > 20"),
+            rc.filter("tags.fizz").filter("depth > 20"))
+        eq_(sefara.load(filename, filters=["capture_kit == 'kit1'"]),
+            rc.filter("capture_kit == 'kit1'"))
+        eq_(sefara.load(filename, table=True), rc)
+    finally:
+        shutil.rmtree(directory)